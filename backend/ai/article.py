@@ -0,0 +1,112 @@
+import asyncio
+import difflib
+import os
+import re
+
+from ai.prompts import PROMPT_MODEL
+from ai.scrape import decompose_article, get_article
+from db.db import create_article
+from utils.metrics import span
+
+# How concepts are joined into articles.text
+CONCEPT_SEPARATOR = "\n "
+# difflib similarity at or above which a re-decomposed concept counts as unchanged
+CONCEPT_MATCH_THRESHOLD = float(os.getenv("CONCEPT_MATCH_THRESHOLD", "0.85"))
+
+
+async def load_concepts(checkpoints, article_url, style="", decompose_fn=decompose_article):
+    """Scrape and decompose an article once per run
+
+    The article text and concepts are checkpointed in `checkpoints`, so a
+    resumed run (and every style generated from it) reuses them.
+
+    Args:
+        decompose_fn: Article text -> concepts (pipelines may use their own prompt)
+
+    Returns:
+        The concepts (may be empty)
+    """
+    async def scrape():
+        async with span("scrape", style=style):
+            # requests is blocking: keep the event loop serving other runs
+            return await asyncio.to_thread(get_article, article_url)
+
+    article_text = await checkpoints.run("article_text", scrape)
+
+    async def decompose():
+        async with span("decompose", model=PROMPT_MODEL, style=style):
+            return await decompose_fn(article_text)
+
+    return await checkpoints.run("concepts", decompose)
+
+
+class ArticleRow:
+    """The articles row of a run, created on first use
+
+    Runs create it with their first stored media (so a run that produces
+    nothing leaves no row), and every style generated from one scrape shares
+    it. It is keyed by the run id, so a resumed run gets the same row back.
+    """
+
+    def __init__(self, source, concepts, user_id, run_id, article_id=None):
+        self.source = source
+        self.concepts = concepts
+        self.user_id = user_id
+        self.run_id = run_id
+        self.id = article_id
+        self._lock = asyncio.Lock()
+
+    async def get_id(self) -> int:
+        async with self._lock:
+            if self.id is None:
+                row = await create_article(self.source, text=CONCEPT_SEPARATOR.join(self.concepts), user_id=self.user_id, run_id=self.run_id)
+                self.id = row["id"]
+        return self.id
+
+
+def split_concepts(article_text) -> list:
+    """The concepts stored in an article's text"""
+    return [concept.strip() for concept in (article_text or "").split(CONCEPT_SEPARATOR) if concept.strip()]
+
+
+def normalize_concept(concept: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", concept.lower()).split())
+
+
+def match_concepts(old, new, threshold=CONCEPT_MATCH_THRESHOLD) -> dict:
+    """Pair each new concept with the old concept it repeats, if any
+
+    Exact matches (ignoring case, whitespace and punctuation) are paired
+    first; the remaining concepts are then paired as near duplicates, most
+    similar first (difflib ratio), down to `threshold`. Each old concept is
+    paired at most once.
+
+    Returns:
+        {new index: (old index, similarity)}
+    """
+    old_norm = [normalize_concept(concept) for concept in old]
+    new_norm = [normalize_concept(concept) for concept in new]
+    matches = {}
+    unused = set(range(len(old)))
+
+    for j, concept in enumerate(new_norm):
+        i = next((i for i in sorted(unused) if old_norm[i] == concept), None)
+        if i is not None:
+            matches[j] = (i, 1.0)
+            unused.discard(i)
+
+    candidates = []
+    for j, concept in enumerate(new_norm):
+        if j in matches:
+            continue
+        for i in unused:
+            matcher = difflib.SequenceMatcher(None, old_norm[i], concept, autojunk=False)
+            if matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold:
+                ratio = matcher.ratio()
+                if ratio >= threshold:
+                    candidates.append((ratio, j, i))
+    for ratio, j, i in sorted(candidates, reverse=True):
+        if j not in matches and i in unused:
+            matches[j] = (i, ratio)
+            unused.discard(i)
+    return matches
@@ -0,0 +1,117 @@
+import asyncio
+import time
+import traceback
+
+from ai.article import ArticleRow, load_concepts
+from ai.nemotron_fal import generate_style_media
+from ai.nemotron_manim_generator import process_article_and_generate_media as process_article_and_generate_manim
+from utils.checkpoints import RunCheckpoints, run_key_for
+from utils.progress import emit_progress
+from utils.scheduler import VIDEO_LANE, work_context
+
+MANIM_STYLE = "manim"
+
+
+def fan_out_variants(styles, persona_ids=None) -> list:
+    """(style, persona_id) pairs to generate, without duplicates
+
+    Image styles are crossed with the personas; Manim has no persona and is
+    generated once.
+    """
+    variants = []
+    for style in dict.fromkeys(styles):
+        for persona_id in ([None] if style == MANIM_STYLE else dict.fromkeys(persona_ids or [None])):
+            variants.append((style, persona_id))
+    return variants
+
+
+async def process_article_and_generate_styles(article_url, styles, persona_ids=None, user_id=1, max_retries=5, run_key=None):
+    """Generate several styles (and personas) of one article from one scrape
+
+    The article is scraped and decomposed once and every variant shares the
+    concepts and one article row; the variants' prompt, image and render
+    work then runs in parallel, within the global LLM and fal limits
+    (utils/limits.py). A variant failing does not fail the others. Progress
+    events are those of the image and Manim pipelines, tagged by style.
+
+    Args:
+        article_url: URL of the article to process
+        styles: Styles to generate ("manim" renders a video)
+        persona_ids: Personas to generate each image style for (optional)
+        user_id: User ID for database storage
+        max_retries: Manim code generation attempts
+        run_key: Key of the run to resume (default: derived from the inputs)
+
+    Returns:
+        {"article_id", "concepts", "variants": [{"style", "persona_id",
+        "success", ...}]}, or None if no concepts could be extracted
+    """
+    variants = fan_out_variants(styles, persona_ids)
+    checkpoints = await RunCheckpoints.open(
+        run_key or run_key_for("styles", article_url, user_id, *[f"{style}/{persona_id}" for style, persona_id in variants])
+    )
+
+    run_started = time.perf_counter()
+    concepts = await load_concepts(checkpoints, article_url, style=",".join(dict.fromkeys(styles)))
+    if not concepts:
+        print("No concepts extracted from article")
+        return None
+
+    emit_progress("concepts", concepts=concepts)
+    print(f"Generating {len(variants)} variants of {len(concepts)} concepts")
+    article = ArticleRow(article_url, concepts, user_id, checkpoints.run_id)
+
+    async def run_variant(index, style, persona_id):
+        variant = {"style": style, "persona_id": persona_id}
+        complete = False
+        try:
+            if style == MANIM_STYLE:
+                # Saved here too: the Manim run drops its own checkpoints
+                # once it completes, and a resumed fan-out must not render
+                # (and store) the video again. Scheduled as video work,
+                # behind the image styles.
+                with work_context(lane=VIDEO_LANE):
+                    result = await checkpoints.run(f"{style}/result", lambda: process_article_and_generate_manim(
+                        article_url=article_url,
+                        style=style,
+                        user_id=user_id,
+                        max_retries=max_retries,
+                        run_key=run_key_for(checkpoints.run_key, style),
+                        concepts=concepts,
+                        article=article
+                    ))
+                variant.update(result, success=True)
+                complete = True
+                emit_progress("video", style=style, status="rendered", media_id=result["media_id"], media_url=result["video_path"])
+            else:
+                entries = await generate_style_media(
+                    checkpoints, article, concepts, style,
+                    persona_id=persona_id,
+                    stage_prefix=f"{style}/{persona_id}/",
+                    slot_offset=index * len(concepts),
+                    started=run_started
+                )
+                stored = [entry for entry in entries if entry]
+                variant.update(success=bool(stored), media_count=len(stored), media_entries=stored)
+                complete = len(stored) == len(concepts)
+        except Exception as e:
+            print(f"{style} variant failed: {e}")
+            traceback.print_exc()
+            variant.update(success=False, error=str(e))
+        return variant, complete
+
+    outcomes = await asyncio.gather(*(run_variant(i, style, persona_id) for i, (style, persona_id) in enumerate(variants)))
+    results = [variant for variant, _ in outcomes]
+
+    completed = sum(complete for _, complete in outcomes)
+    if completed == len(outcomes):
+        await checkpoints.complete()
+    else:
+        # Keep the checkpoints: a retry redoes only what is missing
+        print(f"Run {checkpoints.run_id}: {completed}/{len(outcomes)} variants complete")
+
+    return {
+        "article_id": article.id,
+        "concepts": concepts,
+        "variants": results
+    }
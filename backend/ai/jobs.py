@@ -0,0 +1,227 @@
+import asyncio
+import os
+import socket
+import traceback
+import uuid
+
+from db.db import (
+    claim_job,
+    create_job,
+    fail_abandoned_jobs,
+    finish_job,
+    get_job,
+    renew_job_lease,
+    update_job_progress,
+)
+from utils.metrics import request_timings
+from utils.scheduler import ARTICLE_LANE, USER_WEIGHTS
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+
+class JobWorkerPool:
+    """Runs queued jobs from the jobs table with a fixed number of workers
+
+    Handlers are async functions taking the job's params and returning a
+    JSON-serializable result (or None for failure). Jobs are claimed with
+    FOR UPDATE SKIP LOCKED and leased; the lease is renewed while the job
+    runs, so pools in several processes can share the table and a job whose
+    worker died is picked up again (up to max_attempts). Each kind runs in
+    a scheduler lane (`lanes`, article by default); claims serve lanes in
+    priority order and users fairly within a lane (see db.create_job), with
+    the same per-user weights as the in-process queues. Stage-level
+    progress comes from the pipeline's metric spans and is written to the
+    job row at most every progress_interval seconds.
+    """
+
+    def __init__(
+        self,
+        handlers: dict,
+        concurrency: int = 2,
+        poll_interval: float = 1.0,
+        lease_seconds: float = 120,
+        max_attempts: int = 2,
+        progress_interval: float = 1.0,
+        lanes: dict = None,
+        weights: dict = None,
+    ):
+        self.handlers = handlers
+        self.lanes = lanes or {}
+        self.weights = USER_WEIGHTS if weights is None else weights
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.progress_interval = progress_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._workers = []
+        self._wakeup = None
+        # job_id -> events set whenever the job changes in this process
+        self._listeners = {}
+
+    async def submit(self, kind: str, params: dict, user_id: int | None = None) -> dict:
+        """Queue a job and wake an idle worker
+
+        Returns:
+            The job row
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = await create_job(
+            uuid.uuid4().hex, kind, params, user_id=user_id,
+            lane=self.lanes.get(kind, ARTICLE_LANE), cost=1.0 / self.weights.get(user_id, 1.0),
+        )
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    def start(self):
+        """Start the workers (must be called from the running event loop)"""
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def run_forever(self):
+        """Run the workers until cancelled (e.g. in a standalone worker process)"""
+        self.start()
+        await asyncio.gather(*self._workers)
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def watch(self, job_id: str, heartbeat: float = 15.0):
+        """Yield the job each time it changes, ending once it has finished
+
+        Changes made in this process are seen at once; changes made by
+        workers in other processes are picked up by polling. Yields None
+        when nothing changed for `heartbeat` seconds (to keep streams alive).
+        """
+        changed = asyncio.Event()
+        self._listeners.setdefault(job_id, set()).add(changed)
+        try:
+            last_update = None
+            idle = 0.0
+            while True:
+                job = await get_job(job_id)
+                if job is None:
+                    return
+                if job["updated_at"] != last_update:
+                    last_update = job["updated_at"]
+                    idle = 0.0
+                    yield job
+                    if job["status"] in FINISHED_STATUSES:
+                        return
+                elif idle >= heartbeat:
+                    idle = 0.0
+                    yield None
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                idle += self.poll_interval
+                changed.clear()
+        finally:
+            listeners = self._listeners.get(job_id)
+            if listeners is not None:
+                listeners.discard(changed)
+                if not listeners:
+                    del self._listeners[job_id]
+
+    def _notify(self, job_id: str):
+        for event in self._listeners.get(job_id, ()):
+            event.set()
+
+    async def _work(self):
+        while True:
+            try:
+                await fail_abandoned_jobs(self.max_attempts)
+                job = await claim_job(list(self.handlers), self.worker_id, self.lease_seconds, self.max_attempts)
+            except Exception as e:
+                print(f"Job worker poll failed: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: dict):
+        job_id = job["id"]
+        print(f"Running {job['kind']} job {job_id} (attempt {job['attempts']}/{self.max_attempts})")
+        self._notify(job_id)
+        dirty = asyncio.Event()
+        # Started outside request_timings so their own DB writes aren't
+        # reported as job progress
+        lease = asyncio.create_task(self._keep_lease(job_id))
+        progress = asyncio.create_task(self._flush_progress(job_id, lambda: timings.as_dict(), dirty))
+
+        with request_timings(on_change=dirty.set) as timings:
+            status, result, error = "failed", None, None
+            try:
+                result = await self.handlers[job["kind"]](job["params"])
+                if result is None:
+                    error = "No result produced"
+                else:
+                    status = "succeeded"
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                traceback.print_exc()
+                error = str(e)
+            finally:
+                progress.cancel()
+                lease.cancel()
+                await asyncio.gather(progress, lease, return_exceptions=True)
+
+        try:
+            await finish_job(job_id, status, result=result, error=error, progress=timings.as_dict())
+        except Exception as e:
+            # The lease runs out and another worker retries the job
+            print(f"Could not record the outcome of job {job_id}: {e}")
+        self._notify(job_id)
+        print(f"Job {job_id} {status}")
+
+    async def _keep_lease(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await renew_job_lease(job_id, self.worker_id, self.lease_seconds):
+                    print(f"Lost the lease on job {job_id}")
+                    return
+            except Exception as e:
+                print(f"Renewing the lease on job {job_id} failed: {e}")
+
+    async def _flush_progress(self, job_id: str, snapshot, dirty: asyncio.Event):
+        while True:
+            await dirty.wait()
+            dirty.clear()
+            try:
+                await update_job_progress(job_id, snapshot())
+                self._notify(job_id)
+            except Exception as e:
+                print(f"Saving progress of job {job_id} failed: {e}")
+            await asyncio.sleep(self.progress_interval)
+
+
+def job_view(job: dict) -> dict:
+    """Public view of a job row"""
+    view = {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "stage": (job.get("progress") or {}).get("current_stage"),
+        "progress": job.get("progress"),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "attempts": job.get("attempts"),
+    }
+    for field in ("created_at", "started_at", "finished_at", "updated_at"):
+        value = job.get(field)
+        view[field] = value.isoformat() if hasattr(value, "isoformat") else value
+    return view
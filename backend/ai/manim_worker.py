@@ -0,0 +1,188 @@
+import asyncio
+import importlib.util
+import multiprocessing
+import queue
+import sys
+import threading
+import traceback
+import uuid
+
+# Manim quality flag -> config.quality name
+QUALITY_NAMES = {
+    "l": "low_quality",
+    "m": "medium_quality",
+    "h": "high_quality",
+    "p": "production_quality",
+    "k": "fourk_quality",
+}
+
+
+class ManimRenderError(RuntimeError):
+    """A scene failed to render inside a warm worker"""
+
+
+def _render_job(job):
+    from manim import tempconfig
+
+    overrides = {
+        "quality": QUALITY_NAMES[job["quality"]],
+        "media_dir": job["media_dir"],
+        "input_file": job["scene_file"],
+        "write_to_movie": True,
+        "format": "mp4",
+    }
+    if job.get("tex_dir"):
+        overrides["tex_dir"] = job["tex_dir"]
+        overrides["no_latex_cleanup"] = True
+
+    # tempconfig restores the global config afterwards so jobs don't leak
+    # settings into each other
+    with tempconfig(overrides):
+        module_name = f"_manim_scene_{uuid.uuid4().hex}"
+        spec = importlib.util.spec_from_file_location(module_name, job["scene_file"])
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            spec.loader.exec_module(module)
+            scene = getattr(module, job["scene_name"])()
+            scene.render()
+            return str(scene.renderer.file_writer.movie_file_path)
+        finally:
+            sys.modules.pop(module_name, None)
+
+
+def _worker_main(conn):
+    """Worker process: import manim once, then render jobs until told to stop"""
+    import manim  # noqa: F401 - the import is the expensive part we keep warm
+
+    conn.send({"ready": True})
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        try:
+            conn.send({"ok": True, "video_path": _render_job(job)})
+        except BaseException as e:
+            conn.send({"ok": False, "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()})
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs_done = 0
+        self.ready = False
+
+    def wait_ready(self, timeout):
+        if not self.ready:
+            if not self.conn.poll(timeout):
+                raise TimeoutError("Manim worker did not start in time")
+            self.conn.recv()
+            self.ready = True
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class ManimWorkerPool:
+    """Pool of long-lived processes that keep manim imported between renders
+
+    Each worker renders one scene at a time with its own tempconfig and is
+    recycled after max_jobs renders (or after a crash/timeout) so leaked
+    state and memory never accumulate.
+    """
+
+    def __init__(self, size: int = 2, max_jobs: int = 20, start_timeout: float = 120, job_timeout: float = 600):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.start_timeout = start_timeout
+        self.job_timeout = job_timeout
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        """Spawn the workers (they import manim in the background)"""
+        with self._lock:
+            if self._started:
+                return
+            for _ in range(self.size):
+                self._idle.put(_Worker(self._ctx))
+            self._started = True
+
+    def wait_ready(self):
+        """Start the pool and block until every worker has imported manim
+
+        Meant for startup: it also waits for renders in progress to finish.
+        """
+        self.start()
+        workers = [self._idle.get() for _ in range(self.size)]
+        try:
+            for worker in workers:
+                worker.wait_ready(self.start_timeout)
+        finally:
+            for worker in workers:
+                self._idle.put(worker)
+
+    def shutdown(self):
+        with self._lock:
+            while not self._idle.empty():
+                self._idle.get_nowait().stop()
+            self._started = False
+
+    def render_sync(self, scene_file: str, scene_name: str, media_dir: str, quality: str = "l", tex_dir: str | None = None) -> str:
+        """Render a scene on a warm worker, blocking until it finishes
+
+        Returns:
+            Path of the rendered video
+        """
+        self.start()
+        worker = self._idle.get()
+        recycle = False
+        try:
+            worker.wait_ready(self.start_timeout)
+            worker.conn.send({
+                "scene_file": scene_file,
+                "scene_name": scene_name,
+                "media_dir": media_dir,
+                "quality": quality,
+                "tex_dir": tex_dir,
+            })
+            if not worker.conn.poll(self.job_timeout):
+                recycle = True
+                raise TimeoutError(f"Manim render of {scene_name} timed out after {self.job_timeout}s")
+            result = worker.conn.recv()
+            worker.jobs_done += 1
+            if not result["ok"]:
+                print(result["traceback"])
+                raise ManimRenderError(result["error"])
+            return result["video_path"]
+        except (EOFError, BrokenPipeError, OSError):
+            recycle = True
+            raise ManimRenderError(f"Manim worker died while rendering {scene_name}")
+        except TimeoutError:
+            recycle = True
+            raise
+        finally:
+            if recycle or worker.jobs_done >= self.max_jobs or not worker.process.is_alive():
+                worker.stop()
+                worker = _Worker(self._ctx)
+            self._idle.put(worker)
+
+    async def render(self, scene_file: str, scene_name: str, media_dir: str, quality: str = "l", tex_dir: str | None = None) -> str:
+        """Render a scene on a warm worker without blocking the event loop"""
+        return await asyncio.to_thread(self.render_sync, scene_file, scene_name, media_dir, quality, tex_dir)
@@ -1,19 +1,35 @@
 import asyncio
 import sys
+import time
 from pathlib import Path
 
-from ai.prompts import generate_multiple_prompts
+from ai.prompts import PROMPT_MODEL, create_generation_prompt
 from ai.scrape import decompose_article
+from ai.article import CONCEPT_SEPARATOR, ArticleRow, load_concepts, match_concepts, split_concepts
 
 # Add the backend directory to the path so we can import from db
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from dotenv import load_dotenv
-import fal_client
-from db.db import get_persona_by_id, store_media, create_article, get_article_by_id
+from db.db import (
+    get_latest_article_by_source,
+    get_media_by_article,
+    get_persona_by_id,
+    store_media,
+    supersede_media,
+    update_article_text,
+)
 from ai.scrape import get_article
+from utils.mirror import MEDIA_MIRROR
+from utils.metrics import CONCEPTS_DIFFED, TIME_TO_FIRST_IMAGE, span
+from utils.limits import FAL_LIMIT
+from utils.progress import emit_progress
+from utils.checkpoints import RunCheckpoints, run_key_for
 
 load_dotenv()
 
+FAL_TEXT_TO_IMAGE = "fal-ai/alpha-image-232/text-to-image"
+FAL_EDIT_IMAGE = "fal-ai/alpha-image-232/edit-image"
+
 
 
 
@@ -25,17 +41,19 @@ async def generate_image(prompt):
 
     print(f"\n\nGenerating image with prompt: {prompt}\n")
     
-    handler = await fal_client.submit_async(
-        "fal-ai/alpha-image-232/text-to-image",
-        arguments={
-            "prompt": prompt
-        },
-    )
-    
-    async for event in handler.iter_events(with_logs=True):
-        print(event)
-    
-    result = await handler.get()
+    import fal_client
+    async with FAL_LIMIT, span("fal", model=FAL_TEXT_TO_IMAGE):
+        handler = await fal_client.submit_async(
+            FAL_TEXT_TO_IMAGE,
+            arguments={
+                "prompt": prompt
+            },
+        )
+        
+        async for event in handler.iter_events(with_logs=True):
+            print(event)
+        
+        result = await handler.get()
     return result
 
 async def generate_image_with_persona(prompt, persona_id):
@@ -43,18 +61,20 @@ async def generate_image_with_persona(prompt, persona_id):
     prompt = f"{prompt}"
     print(persona)
     print(f"Generating Image with prompt: {prompt}")
-    handler  = await fal_client.submit_async(
-        "fal-ai/alpha-image-232/edit-image",
-        arguments={
-            "image_urls": [persona["image_url"]],
-            "prompt": prompt
-        },
-    )
+    import fal_client
+    async with FAL_LIMIT, span("fal", model=FAL_EDIT_IMAGE):
+        handler  = await fal_client.submit_async(
+            FAL_EDIT_IMAGE,
+            arguments={
+                "image_urls": [persona["image_url"]],
+                "prompt": prompt
+            },
+        )
 
-    async for event in handler.iter_events(with_logs=True):
-        print(event)
+        async for event in handler.iter_events(with_logs=True):
+            print(event)
 
-    result = await handler.get()
+        result = await handler.get()
 
     print(result)
     return result
@@ -78,88 +98,271 @@ async def generate_multiple_images(prompts):
 
     return valid_results
 
-async def process_article_and_generate_media(persona_id = None, article_url=None, style="meme", user_id=1):
-    """Process an article and generate media content, storing results in the database"""
-    
-    article_text = get_article(article_url)
-    concepts = await decompose_article(article_text)
-    
-    if not concepts or len(concepts) == 0:
-        print("No concepts extracted from article")
-        return None
-        
-    print(f"Generating prompts for {len(concepts)} concepts")
-    
-    # Generate prompts for all concepts
-    prompts = await generate_multiple_prompts(concepts, style)
-    
-    # Validate and filter out empty prompts
-    print(f"\nReceived {len(prompts)} prompts from generation")
-    valid_prompts = [p for p in prompts if p and p.strip()]
-    
-    if len(valid_prompts) < len(prompts):
-        print(f"Warning: {len(prompts) - len(valid_prompts)} empty prompts were filtered out")
+async def generate_style_media(checkpoints, article, concepts, style, persona_id=None, stage_prefix="", slot_offset=0, started=None):
+    """Generate and store one image per concept in one style
     
-    if not valid_prompts:
-        print("Error: No valid prompts generated")
-        return None
-    
-    print(f"Proceeding with {len(valid_prompts)} valid prompts\n")
-    
-    # Generate images for all prompts in parallel
-    image_results = await generate_multiple_images(valid_prompts)
-    
-    if not image_results or len(image_results) == 0:
-        print("Failed to generate any images")
-        return None
+    Each concept goes prompt -> image -> media row on its own, so the first
+    image is stored while other prompts are still being written. The prompts
+    and images are checkpointed (as lists aligned with the concepts, None
+    where a step failed) under stage_prefix, so a resumed run only redoes the
+    missing ones; media rows are keyed by run_slot slot_offset + i. Progress
+    events (each prompt, each stored image) go to the current progress feed.
     
-    # Create article in database
-    article = await create_article(article_url, text="\n ".join(concepts), user_id=user_id)
-    article_id = article["id"]
+    Args:
+        checkpoints: RunCheckpoints of the run
+        article: ArticleRow the media belong to (created with the first image)
+        concepts: Concepts of the article
+        style: Generation style
+        persona_id: Persona to put in the images (edits the persona's image)
+        stage_prefix: Prefix of the checkpoint stages (one per style in a fan-out)
+        slot_offset: First run_slot of this style's media
+        started: perf_counter() at the start of the run, for time to first image
     
-    # Store all media in the database and collect results
-    media_entries = []
+    Returns:
+        The media entries, aligned with the concepts (None where one failed)
+    """
+    started = started or time.perf_counter()
+    prompts = checkpoints.get(f"{stage_prefix}prompts") or [None] * len(concepts)
+    images = checkpoints.get(f"{stage_prefix}images") or [None] * len(concepts)
+    media_entries = [None] * len(concepts)
     
-    for i, image_result in enumerate(image_results):
-        if not image_result or "images" not in image_result:
-            print(f"Skipping invalid image result for concept {i+1}")
-            continue
-            
+    async def produce(i):
+        concept = concepts[i]
+        if not prompts[i]:
+            async with span("prompts", model=PROMPT_MODEL, style=style):
+                prompt = await create_generation_prompt(concept, style=style, max_length=500)
+            if not prompt or not prompt.strip():
+                print(f"Warning: empty {style} prompt for concept {i+1} was filtered out")
+                return
+            prompts[i] = prompt
+            await checkpoints.save(f"{stage_prefix}prompts", prompts)
+        emit_progress("prompt", style=style, persona_id=persona_id, index=i, concept=concept, prompt=prompts[i])
+        
+        if not images[i]:
+            try:
+                if persona_id is not None:
+                    image_result = await generate_image_with_persona(prompts[i], persona_id)
+                else:
+                    image_result = await generate_image(prompts[i])
+            except Exception as e:
+                print(f"Image generation failed for concept {i+1}: {e}")
+                return
+            if not image_result or "images" not in image_result:
+                print(f"Skipping invalid image result for concept {i+1}")
+                return
+            images[i] = image_result["images"][0]
+            await checkpoints.save(f"{stage_prefix}images", images)
+        
         # Extract the image URL from the nested structure
-        image_obj = image_result["images"][0]
+        image_obj = images[i]
         media_url = image_obj["url"]  # Extract just the URL string
         
         print(f"\nExtracted image URL for concept {i+1}: {media_url}")
         
-        # Store the media in the database
+        # Store the media in the database (a resumed run gets its existing row back)
         try:
+            article_id = await article.get_id()
             media_row = await store_media(
                 article_id=article_id,
-                prompt=valid_prompts[i],
+                prompt=prompts[i],
                 style=style,
                 media_type="image",
-                media_url=media_url
+                media_url=media_url,
+                run_id=checkpoints.run_id,
+                run_slot=slot_offset + i,
+                concept=concept,
+                persona_id=persona_id
             )
-            
-            print(f"=== Media stored in database with ID {media_row['id']} ===")
-            
-            # Add to results
-            media_entries.append({
-                "article_id": article_id,
-                "media_id": media_row["id"],
-                "concept": concepts[i],
-                "prompt": valid_prompts[i],
-                "media_url": media_url,
-                "image_metadata": image_result["images"][0]
-            })
         except Exception as e:
             print(f"Error storing media for concept {i+1}: {str(e)}")
+            return
+        
+        print(f"=== Media stored in database with ID {media_row['id']} ===")
+        
+        if media_row["inserted"]:
+            # Copy the ephemeral fal URL to S3 in the background
+            MEDIA_MIRROR.schedule(media_row["id"], media_url)
+        
+        if not any(media_entries):
+            TIME_TO_FIRST_IMAGE.observe(time.perf_counter() - started, style=style)
+        media_entries[i] = {
+            "article_id": article_id,
+            "media_id": media_row["id"],
+            "concept": concept,
+            "prompt": prompts[i],
+            "media_url": media_row["media_url"],
+            "image_metadata": image_obj
+        }
+        emit_progress(
+            "image", style=style, persona_id=persona_id, index=i, article_id=article_id,
+            media_id=media_row["id"], media_url=media_row["media_url"], concept=concept
+        )
+    
+    await asyncio.gather(*(produce(i) for i in range(len(concepts))))
+    return media_entries
+
+async def process_article_and_generate_media(persona_id = None, article_url=None, style="meme", user_id=1, run_key=None):
+    """Process an article and generate media content, storing results in the database
+    
+    Progress events (concepts, then those of generate_style_media) are
+    published on the current progress feed for streaming responses.
+    
+    Each stage (article text, concepts, prompts, images) is checkpointed, so
+    retrying a failed run with the same inputs resumes where it stopped, and
+    re-storing the run's article and media updates the existing rows.
+    
+    Args:
+        run_key: Key of the run to resume (default: derived from the inputs)
+    """
+    checkpoints = await RunCheckpoints.open(
+        run_key or run_key_for("generate", article_url, style, user_id, persona_id)
+    )
+    
+    run_started = time.perf_counter()
+    concepts = await load_concepts(checkpoints, article_url, style=style)
+    
+    if not concepts or len(concepts) == 0:
+        print("No concepts extracted from article")
+        return None
+    
+    emit_progress("concepts", concepts=concepts)
+    print(f"Generating prompts and images for {len(concepts)} concepts")
+    
+    article = ArticleRow(article_url, concepts, user_id, checkpoints.run_id)
+    media_entries = await generate_style_media(
+        checkpoints, article, concepts, style, persona_id=persona_id, started=run_started
+    )
+    
+    stored = [entry for entry in media_entries if entry]
+    if not stored:
+        print("Failed to generate any images")
+        return None
+    
+    if len(stored) == len(concepts):
+        await checkpoints.complete()
+    else:
+        # Keep the checkpoints: a retry fills in the missing images
+        print(f"Run {checkpoints.run_id} stored {len(stored)}/{len(concepts)} images")
     
     # Return complete results with all media entries
+    return {
+        "article_id": article.id,
+        "media_count": len(stored),
+        "media_entries": stored
+    }
+
+async def update_article_media(persona_id=None, article_url=None, style="meme", user_id=1, run_key=None):
+    """Bring the media of an edited article up to date, regenerating as little as possible
+    
+    The latest article from the source is re-scraped and re-decomposed, and
+    the new concepts are matched against those its `style` images with the
+    same persona were made for (exactly, then as near duplicates, see
+    match_concepts). Images whose concept still holds are kept; only new or
+    changed concepts go through prompt and image generation, and their media
+    are added to the same article. Media of concepts that no longer hold are
+    marked superseded (not deleted: they may be scheduled for posting), so
+    they stop counting as the article's media. Without a previous article
+    this is a normal run.
+    
+    Returns:
+        Like process_article_and_generate_media, plus an "update" report:
+        concept counts (kept exactly, kept as near duplicates, regenerated),
+        the prompt and image calls skipped, and the superseded media ids
+    """
+    previous = await get_latest_article_by_source(article_url, user_id)
+    if previous is None:
+        print(f"No previous article from {article_url}, generating from scratch")
+        result = await process_article_and_generate_media(persona_id=persona_id, article_url=article_url, style=style, user_id=user_id)
+        if result:
+            result["update"] = {"previous_article_id": None, "regenerated": result["media_count"]}
+        return result
+    
+    article_id = previous["id"]
+    checkpoints = await RunCheckpoints.open(
+        run_key or run_key_for("update", article_id, style, user_id, persona_id)
+    )
+    run_started = time.perf_counter()
+    concepts = await load_concepts(checkpoints, article_url, style=style)
+    if not concepts:
+        print("No concepts extracted from article")
+        return None
+    emit_progress("concepts", concepts=concepts)
+    
+    # The concept each existing image of this style and persona was made for;
+    # rows from before media.concept existed are matched to the article's
+    # concepts in order
+    old_concepts = split_concepts(previous["text"])
+    media_rows = sorted(
+        (
+            row for row in await get_media_by_article(article_id)
+            if row["style"] == style and row["media_type"] == "image" and row["persona_id"] == persona_id
+            # Stored by an earlier attempt of this update: returned by the run itself
+            and row["run_id"] != checkpoints.run_id
+        ),
+        key=lambda row: row["id"]
+    )
+    media_concepts = [
+        row["concept"] or (old_concepts[n] if n < len(old_concepts) else "")
+        for n, row in enumerate(media_rows)
+    ]
+    matches = match_concepts(media_concepts, concepts)
+    todo = [j for j in range(len(concepts)) if j not in matches]
+    exact = sum(1 for _, similarity in matches.values() if similarity == 1.0)
+    print(f"Concepts of article {article_id}: {exact} unchanged, {len(matches) - exact} near duplicates, {len(todo)} new or changed")
+    
+    kept = {}
+    for j, (i, similarity) in matches.items():
+        row = media_rows[i]
+        kept[j] = {
+            "article_id": article_id,
+            "media_id": row["id"],
+            "concept": concepts[j],
+            "prompt": row["prompt"],
+            "media_url": row["media_url"],
+            "kept": True
+        }
+        emit_progress("image", style=style, persona_id=persona_id, index=j, article_id=article_id, media_id=row["id"], media_url=row["media_url"], concept=concepts[j], kept=True)
+    
+    article = ArticleRow(article_url, concepts, user_id, checkpoints.run_id, article_id=article_id)
+    generated = await generate_style_media(
+        checkpoints, article, [concepts[j] for j in todo], style, persona_id=persona_id, started=run_started
+    ) if todo else []
+    new_entries = dict(zip(todo, generated))
+    
+    await update_article_text(article_id, CONCEPT_SEPARATOR.join(concepts))
+    
+    regenerated = sum(1 for entry in generated if entry)
+    CONCEPTS_DIFFED.inc(exact, outcome="unchanged")
+    CONCEPTS_DIFFED.inc(len(matches) - exact, outcome="near_duplicate")
+    CONCEPTS_DIFFED.inc(len(todo), outcome="regenerated")
+    if regenerated == len(todo):
+        await checkpoints.complete()
+    else:
+        # Keep the checkpoints: a retry fills in the missing images
+        print(f"Run {checkpoints.run_id} stored {regenerated}/{len(todo)} new images")
+    
+    matched_media = {media_rows[i]["id"] for i, _ in matches.values()}
+    superseded = [row["id"] for row in media_rows if row["id"] not in matched_media]
+    if superseded:
+        # Later readers (the Wan video's reference images among them) only see current concepts
+        await supersede_media(superseded)
+    media_entries = [entry for j in range(len(concepts)) for entry in [kept.get(j) or new_entries.get(j)] if entry]
     return {
         "article_id": article_id,
         "media_count": len(media_entries),
-        "media_entries": media_entries
+        "media_entries": media_entries,
+        "update": {
+            "previous_article_id": article_id,
+            "concepts": len(concepts),
+            "unchanged": exact,
+            "near_duplicates": len(matches) - exact,
+            "regenerated": regenerated,
+            "failed": len(todo) - regenerated,
+            # Each kept concept saves a prompt (LLM) call and an image (fal) call
+            "skipped_prompt_calls": len(matches),
+            "skipped_image_calls": len(matches),
+            "superseded_media_ids": superseded
+        }
     }
 
 # async def process_article_and_generate_media(persona_id = None, article_url=None, style="meme", user_id=1):
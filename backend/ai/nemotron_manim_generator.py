@@ -2,39 +2,93 @@ import asyncio
 import os
 import sys
 from pathlib import Path
-import requests
 import re
-import datetime
 import subprocess
 import argparse
+import shutil
+import tempfile
 
 # Add the backend directory to the path so we can import from db
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from openai import OpenAI
-import httpx
 from dotenv import load_dotenv
-import fal_client
-from db.db import store_media, create_article, get_article_by_id
+from db.db import store_media, store_media_variant, update_media_url
+from ai.prompts import NVIDIA_BASE_URL, PROMPT_MODEL, to_thread
 from ai.scrape import get_article
-from utils.s3_upload import upload_to_s3
+from utils.s3_upload import reserve_url, upload_to_s3_async, url_exists
+from utils.metrics import span
+from utils.limits import FAL_LIMIT, LLM_LIMIT, RENDER_LIMIT
+from utils.scheduler import VIDEO_LANE, work_context
+from utils.checkpoints import RunCheckpoints, run_key_for
+from ai.article import ArticleRow, load_concepts
+from utils.artifacts import atomic_write_text, gc_directory, sha256_text
+from utils.render_cache import RenderCache
+from utils.tex_cache import TexCache
+from ai.manim_worker import ManimWorkerPool
 
 load_dotenv()
 
+BACKEND_DIR = Path(__file__).parent.parent
+MANIM_CODE_DIR = BACKEND_DIR / "manim" / "code"
+MANIM_VIDEO_DIR = BACKEND_DIR / "manim" / "generated_video"
+
+# Budget for manim/code and manim/generated_video (each)
+MANIM_ARTIFACT_MAX_BYTES = int(os.getenv("MANIM_ARTIFACT_MAX_BYTES", str(2 * 1024**3)))
+MANIM_ARTIFACT_MAX_AGE_SECONDS = float(os.getenv("MANIM_ARTIFACT_MAX_AGE_HOURS", "72")) * 3600
+
+# Preview render returned by /manim, and the upgrade rendered in the background
+MANIM_CODE_MODEL = "qwen/qwen3-coder-480b-a35b-instruct"
+
+PREVIEW_QUALITY = "l"
+HD_QUALITY = os.getenv("MANIM_HD_QUALITY", "h")
+
+# Output subdirectory manim uses for each quality flag
+QUALITY_DIRS = {
+    "l": "480p15",
+    "m": "720p30",
+    "h": "1080p60",
+    "p": "1440p60",
+    "k": "2160p60",
+}
+
+RENDER_CACHE = RenderCache(BACKEND_DIR / "manim" / "render_cache.json")
+
+# Compiled TeX shared by every render
+MANIM_TEX_STAGING_DIR = BACKEND_DIR / "manim" / "tex_staging"
+TEX_CACHE = TexCache(
+    os.getenv("MANIM_TEX_CACHE_DIR", str(BACKEND_DIR / "manim" / "tex_cache")),
+    max_bytes=int(os.getenv("MANIM_TEX_CACHE_MAX_BYTES", str(512 * 1024**2)))
+)
+
+# Warm render workers (MANIM_WORKERS=0 renders with the manim CLI instead)
+MANIM_WORKERS = int(os.getenv("MANIM_WORKERS", "0"))
+RENDER_POOL = ManimWorkerPool(
+    size=MANIM_WORKERS,
+    max_jobs=int(os.getenv("MANIM_WORKER_MAX_JOBS", "20"))
+) if MANIM_WORKERS > 0 else None
+
 async def generate_prompt(prompt:str="", system_prompt:str=""):
     """Generate a prompt using the Qwen model based on an article content or URL"""
+    async with LLM_LIMIT:
+        return await to_thread(generate_prompt_sync, prompt, system_prompt)
+
+def generate_prompt_sync(prompt:str="", system_prompt:str=""):
+    """Blocking streamed NVIDIA call behind generate_prompt"""
+    import httpx
+    from openai import OpenAI
+
     # Create a custom http client without proxies to avoid compatibility issues
-    http_client = httpx.Client(base_url="https://integrate.api.nvidia.com/v1")
+    http_client = httpx.Client(base_url=NVIDIA_BASE_URL)
     
     # Initialize the OpenAI client with the custom http client
     client = OpenAI(
-        base_url = "https://integrate.api.nvidia.com/v1",
+        base_url = NVIDIA_BASE_URL,
         api_key = os.getenv("NVIDIA_API_KEY"),
         http_client = http_client
     )
 
     completion = client.chat.completions.create(
-        model="qwen/qwen3-next-80b-a3b-thinking",
+        model=PROMPT_MODEL,
         messages=[
             {"role":"system","content":system_prompt},
             {"role":"user","content": prompt}
@@ -83,15 +137,22 @@ async def decompose_article(article):
 
 async def generate_manim_code(prompt:str="", system_prompt:str=""):
     """Generate manim code using the Qwen coder model"""
+    async with LLM_LIMIT:
+        return await to_thread(generate_manim_code_sync, prompt, system_prompt)
+
+def generate_manim_code_sync(prompt:str="", system_prompt:str=""):
+    """Blocking streamed NVIDIA call behind generate_manim_code"""
+    from openai import OpenAI
+
     # Create a custom http cl
     # ient without proxies to avoid compatibility issues
     client = OpenAI(
-        base_url = "https://integrate.api.nvidia.com/v1",
+        base_url = NVIDIA_BASE_URL,
         api_key = os.getenv("NVIDIA_API_KEY")
     )
 
     completion = client.chat.completions.create(
-        model="qwen/qwen3-coder-480b-a35b-instruct",
+        model=MANIM_CODE_MODEL,
         messages=[
             {"role":"system","content": system_prompt},
             {"role":"user","content": prompt}
@@ -121,30 +182,58 @@ def extract_python_code(text: str) -> str:
     return text.strip()
 
 def save_manim_code(code: str, output_dir: str = "manim/code") -> str:
-    """Save manim code to a Python file"""
+    """Save manim code to a content-addressed Python file
+
+    The filename is derived from the hash of the cleaned code, so identical
+    code maps to the same file and concurrent saves never collide.
+    """
     # Create output directory if it doesn't exist (relative to backend directory)
-    output_path = Path(__file__).parent.parent / output_dir
+    output_path = BACKEND_DIR / output_dir
     output_path.mkdir(parents=True, exist_ok=True)
     
-    # Generate unique filename with timestamp
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"scene_{timestamp}.py"
-    filepath = output_path / filename
-    
     # Extract clean Python code
     clean_code = extract_python_code(code)
     
-    # Write to file
-    with open(filepath, 'w') as f:
-        f.write(clean_code)
+    # Name the file after the code hash
+    filename = f"scene_{sha256_text(clean_code)[:16]}.py"
+    filepath = output_path / filename
+    
+    if filepath.exists():
+        print(f"\n=== Manim code already saved at: {filepath} ===")
+        return str(filepath)
+    
+    atomic_write_text(filepath, clean_code)
     
     print(f"\n=== Manim code saved to: {filepath} ===")
     return str(filepath)
 
-async def run_manim_scene(scene_filepath: str, output_dir: str = "manim/generated_video") -> str:
-    """Run manim to generate video from the scene file"""
+def collect_manim_artifacts(protect=()):
+    """Garbage-collect the manim code and video directories under their size/age budget"""
+    for directory in (MANIM_CODE_DIR, MANIM_VIDEO_DIR):
+        stats = gc_directory(
+            directory,
+            max_bytes=MANIM_ARTIFACT_MAX_BYTES,
+            max_age_seconds=MANIM_ARTIFACT_MAX_AGE_SECONDS,
+            protect=protect
+        )
+        if stats["removed_files"]:
+            print(f"GC removed {stats['removed_files']} files ({stats['freed_bytes']} bytes) from {directory}")
+
+def scene_code_hash(scene_filepath: str) -> str:
+    """Hash the code of a scene file (the render cache key)"""
+    with open(scene_filepath, 'r') as f:
+        return sha256_text(f.read())
+
+async def run_manim_scene(scene_filepath: str, output_dir: str = "manim/generated_video", quality: str = "l") -> str:
+    """Run manim to generate video from the scene file
+    
+    Args:
+        scene_filepath: Path to the scene file
+        output_dir: Manim media directory (relative to backend directory)
+        quality: Manim quality flag: l (480p15), m (720p30), h (1080p60), p (1440p60) or k (2160p60)
+    """
     # Create output directory (relative to backend directory)
-    output_path = Path(__file__).parent.parent / output_dir
+    output_path = BACKEND_DIR / output_dir
     output_path.mkdir(parents=True, exist_ok=True)
     
     # Extract scene class name from the file
@@ -156,15 +245,68 @@ async def run_manim_scene(scene_filepath: str, output_dir: str = "manim/generate
             raise ValueError("No Scene class found in the generated code")
         scene_name = scene_match.group(1)
     
+    # Identical code has already been rendered at this quality
+    code_digest = sha256_text(content)
+    cached = RENDER_CACHE.get(code_digest, quality)
+    if cached and cached.get("video_path"):
+        print(f"\n=== Render cache hit for scene {scene_name}: {cached['video_path']} ===")
+        return cached["video_path"]
+    
     print(f"\n=== Running manim for scene: {scene_name} ===")
     
+    # Staging (and publishing) TeX is part of the render's work, so it
+    # happens within the render limit too
+    async with RENDER_LIMIT:
+        # Private tex_dir seeded from the shared TeX cache
+        MANIM_TEX_STAGING_DIR.mkdir(parents=True, exist_ok=True)
+        staging_dir = Path(tempfile.mkdtemp(dir=MANIM_TEX_STAGING_DIR))
+        tex_dir = staging_dir / "Tex"
+        seeded = TEX_CACHE.stage(tex_dir)
+        
+        try:
+            async with span("manim_render", model=QUALITY_DIRS[quality], style="manim"):
+                if RENDER_POOL is not None:
+                    print(f"Rendering {scene_filepath} on a warm manim worker")
+                    video_path = Path(await RENDER_POOL.render(
+                        scene_filepath,
+                        scene_name,
+                        media_dir=str(output_path),
+                        quality=quality,
+                        tex_dir=str(tex_dir)
+                    ))
+                else:
+                    video_path = await _run_manim_cli(scene_filepath, scene_name, output_path, quality, staging_dir, tex_dir)
+        finally:
+            tex_stats = TEX_CACHE.publish(tex_dir, seeded)
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            if tex_stats["hits"] or tex_stats["misses"]:
+                print(f"TeX cache: {tex_stats['hits']} hits, {tex_stats['misses']} misses")
+    
+    if video_path.exists():
+        print(f"\n=== Video generated at: {video_path} ===")
+        RENDER_CACHE.put(code_digest, quality, video_path=str(video_path))
+        collect_manim_artifacts(protect=(scene_filepath, video_path))
+        return str(video_path)
+    else:
+        raise FileNotFoundError(f"Expected video not found at {video_path}")
+
+async def _run_manim_cli(scene_filepath, scene_name, output_path, quality, staging_dir, tex_dir) -> Path:
+    """Render a scene with a fresh manim CLI process"""
+    config_file = staging_dir / "manim.cfg"
+    config_file.write_text(
+        "[CLI]\n"
+        f"tex_dir = {tex_dir}\n"
+        # Keep the .tex files around so publish() can count cache lookups
+        "no_latex_cleanup = True\n"
+    )
+    
     # Run manim command
-    # -pql = preview, quality low (for faster generation)
-    # Can change to -pqh for high quality
+    # -ql = quality low (for faster generation), -qh for high quality
     cmd = [
         "manim",
-        "-pql",  # preview, quality low
+        f"-q{quality}",
         "--media_dir", str(output_path),
+        "--config_file", str(config_file),
         scene_filepath,
         scene_name
     ]
@@ -172,28 +314,21 @@ async def run_manim_scene(scene_filepath: str, output_dir: str = "manim/generate
     print(f"Running command: {' '.join(cmd)}")
     
     try:
-        result = subprocess.run(
+        result = await asyncio.to_thread(
+            subprocess.run,
             cmd,
             capture_output=True,
             text=True,
             check=True
         )
         print(result.stdout)
-        
-        # Find the generated video file
-        # Manim outputs to media_dir/videos/scene_filename/quality/SceneName.mp4
-        scene_file_basename = os.path.splitext(os.path.basename(scene_filepath))[0]
-        video_path = output_path / "videos" / scene_file_basename / "480p15" / f"{scene_name}.mp4"
-        
-        if video_path.exists():
-            print(f"\n=== Video generated at: {video_path} ===")
-            return str(video_path)
-        else:
-            raise FileNotFoundError(f"Expected video not found at {video_path}")
-            
     except subprocess.CalledProcessError as e:
         print(f"Error running manim: {e.stderr}")
         raise
+    
+    # Manim outputs to media_dir/videos/scene_filename/quality/SceneName.mp4
+    scene_file_basename = os.path.splitext(os.path.basename(scene_filepath))[0]
+    return output_path / "videos" / scene_file_basename / QUALITY_DIRS[quality] / f"{scene_name}.mp4"
 
 async def create_generation_prompt(concept, max_length, style="manim"):
     # Create manim code generation prompt
@@ -256,44 +391,65 @@ async def generate_image(prompt):
 
     print(f"\n\nGenerating image with prompt: {prompt}\n")
     
-    handler = await fal_client.submit_async(
-        "fal-ai/alpha-image-232/text-to-image",
-        arguments={
-            "prompt": prompt
-        },
-    )
-    
-    async for event in handler.iter_events(with_logs=True):
-        print(event)
-    
-    result = await handler.get()
+    import fal_client
+    model = "fal-ai/alpha-image-232/text-to-image"
+    async with FAL_LIMIT, span("fal", model=model):
+        handler = await fal_client.submit_async(
+            model,
+            arguments={
+                "prompt": prompt
+            },
+        )
+        
+        async for event in handler.iter_events(with_logs=True):
+            print(event)
+        
+        result = await handler.get()
     return result
 
-async def process_article_and_generate_media(article_url=None, style="manim", user_id=1, max_retries=5):
+async def process_article_and_generate_media(article_url=None, style="manim", user_id=1, max_retries=5, run_key=None, concepts=None, article=None):
     """Process an article and generate manim video content, storing results in the database
     
+    The article text, concepts and the scene code that rendered are
+    checkpointed, so retrying a failed run with the same inputs resumes
+    where it stopped, and re-storing the run's article and media updates the
+    existing rows.
+    
     Args:
         article_url: URL of the article to process
         style: Generation style (default: "manim")
         user_id: User ID for database storage
         max_retries: Maximum number of code generation attempts (default: 5)
+        run_key: Key of the run to resume (default: derived from the inputs)
+        concepts: Concepts of the article, if already extracted (e.g. shared
+            with other styles); otherwise the article is scraped and decomposed
+        article: ArticleRow to store the video under (default: a new row)
     """
+    checkpoints = await RunCheckpoints.open(run_key or run_key_for("manim", article_url, style, user_id))
     
     # Get article and extract concepts
-    article_text = get_article(article_url)
-    concepts = await decompose_article(article_text)
+    if concepts is None:
+        concepts = await load_concepts(checkpoints, article_url, style=style, decompose_fn=decompose_article)
+    if article is None:
+        article = ArticleRow(article_url, concepts, user_id, checkpoints.run_id)
     concept = '\n'.join([f'\n Concept {i+1}: {concept}\n' for i, concept in enumerate(concepts)])
     
     for attempt in range(1, max_retries + 1):
         try:
-            # Generate manim code
-            manim_code = await create_generation_prompt(concept=concept, max_length=500)
+            # Generate manim code (or reuse the code a previous attempt rendered)
+            manim_code = checkpoints.get("scene_code")
+            if manim_code:
+                print(f"Using saved scene code for run {checkpoints.run_id}")
+            else:
+                async with span("manim_codegen", model=MANIM_CODE_MODEL, style=style):
+                    manim_code = await create_generation_prompt(concept=concept, max_length=500)
             
             # Save the code to a file
             scene_filepath = save_manim_code(manim_code)
             
             # Run manim to generate video
-            video_path = await run_manim_scene(scene_filepath)
+            video_path = await run_manim_scene(scene_filepath, quality=PREVIEW_QUALITY)
+            await checkpoints.save("scene_code", manim_code)
             
             # If we got here, video was generated successfully
             print(f"\n{'='*60}")
@@ -335,15 +491,11 @@ async def process_article_and_generate_media(article_url=None, style="manim", us
                 ) from e
     
     # Create article in database
-    article = await create_article(article_url, text="\n".join(concepts), user_id=user_id)
-    article_id = article["id"]
+    article_id = await article.get_id()
     
-    # Upload video to S3
-    print("\n=== Uploading video to S3 ===")
+    # Upload the preview render to S3
     try:
-        s3_url = upload_to_s3(video_path, s3_folder="manim_videos")
-        print(f"Video uploaded to S3: {s3_url}")
-        media_url = s3_url
+        media_url = await upload_render(video_path, scene_filepath, quality=PREVIEW_QUALITY)
     except Exception as e:
         print(f"Failed to upload to S3: {e}")
         print("Falling back to local path")
@@ -355,18 +507,79 @@ async def process_article_and_generate_media(article_url=None, style="manim", us
         prompt=concept[:500],  # Store the concept as the prompt
         style=style,
         media_type="video",
-        media_url=media_url  # S3 URL or local path as fallback
+        media_url=media_url,  # S3 URL or local path as fallback
+        run_id=checkpoints.run_id,
+        run_slot=0
     )
     
+    await store_media_variant(media_row["id"], QUALITY_DIRS[PREVIEW_QUALITY], media_url)
+    
     print(f"\n=== Media stored in database with ID {media_row['id']} ===")
     
+    await checkpoints.complete()
+    
     return {
         "article_id": article_id,
         "media_id": media_row["id"],
         "concept": concept,
         "video_path": media_url,  # Return S3 URL
-        "scene_file": scene_filepath
+        # The upgrade re-renders from the code: the scene file may be
+        # garbage-collected before it runs
+        "scene_code": manim_code
     }
+
+async def upload_render(video_path: str, scene_filepath: str, quality: str) -> str:
+    """Upload a render to S3, reusing the URL if this exact render was uploaded before (and is still there)
+    
+    Returns:
+        The S3 URL (raises if the upload failed)
+    """
+    code_digest = scene_code_hash(scene_filepath)
+    cached = RENDER_CACHE.get(code_digest, quality)
+    if cached and cached.get("s3_url"):
+        # The S3 janitor may have purged the object since it was cached
+        await reserve_url(cached["s3_url"])
+        if await asyncio.to_thread(url_exists, cached["s3_url"]):
+            print(f"\n=== Reusing uploaded render: {cached['s3_url']} ===")
+            return cached["s3_url"]
+        print(f"Cached upload {cached['s3_url']} is gone, uploading again")
+    
+    print("\n=== Uploading video to S3 ===")
+    s3_url = await upload_to_s3_async(video_path, s3_folder="manim_videos")
+    print(f"Video uploaded to S3: {s3_url}")
+    RENDER_CACHE.put(code_digest, quality, s3_url=s3_url)
+    return s3_url
+
+async def upgrade_manim_render(media_id: int, scene_code: str, quality: str = None):
+    """Re-render an already validated scene in high quality and swap it in
+    
+    Meant to run in the background after the preview has been returned. The
+    media row's URL is updated in place and both renders are kept as variants.
+    If the render or its upload fails, the preview is left as it is.
+    
+    Args:
+        media_id: ID of the media row holding the preview render
+        scene_code: Scene code that rendered successfully in preview quality;
+            its scene file is written again if artifact GC removed it meanwhile
+        quality: Manim quality flag for the upgrade (default: MANIM_HD_QUALITY)
+    """
+    quality = quality or HD_QUALITY
+    try:
+        print(f"\n=== Rendering {QUALITY_DIRS[quality]} upgrade for media {media_id} ===")
+        scene_filepath = save_manim_code(scene_code)
+        # Nobody waits on the upgrade: it queues behind everything else
+        with work_context(lane=VIDEO_LANE):
+            video_path = await run_manim_scene(scene_filepath, quality=quality)
+        media_url = await upload_render(video_path, scene_filepath, quality)
+        await store_media_variant(media_id, QUALITY_DIRS[quality], media_url)
+        await update_media_url(media_id, media_url)
+        print(f"=== Media {media_id} upgraded to {QUALITY_DIRS[quality]}: {media_url} ===")
+        return media_url
+    except Exception as e:
+        print(f"High quality render failed for media {media_id} (preview kept): {e}")
+        import traceback
+        traceback.print_exc()
+        return None
     
 
 async def main(max_retries=5):
@@ -1,28 +1,40 @@
-from tqdm import tqdm
 import asyncio
-import httpx
-from openai import OpenAI
 import os
 from dotenv import load_dotenv
 from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from utils.limits import LLM_LIMIT
 
 load_dotenv()
 
-executor = ThreadPoolExecutor(max_workers=10)
+PROMPT_MODEL = "qwen/qwen3-next-80b-a3b-thinking"
+# OpenAI-compatible endpoint (can point at a local server, e.g. for benchmarks)
+NVIDIA_BASE_URL = os.getenv("NVIDIA_BASE_URL", "https://integrate.api.nvidia.com/v1")
+
+
+@lru_cache(maxsize=1)
+def get_executor():
+    """Thread pool for the blocking LLM calls, created on first use"""
+    return ThreadPoolExecutor(max_workers=10)
+
 
-# Reuse HTTP client for efficiency
-http_client = httpx.Client(base_url="https://integrate.api.nvidia.com/v1")
+@lru_cache(maxsize=1)
+def get_client():
+    """Shared NVIDIA client (reuses one HTTP connection pool), created on first use"""
+    import httpx
+    from openai import OpenAI
 
-client = OpenAI(
-    base_url="https://integrate.api.nvidia.com/v1",
-    api_key=os.getenv("NVIDIA_API_KEY"),
-    http_client=http_client
-)
+    return OpenAI(
+        base_url=NVIDIA_BASE_URL,
+        api_key=os.getenv("NVIDIA_API_KEY"),
+        http_client=httpx.Client(base_url=NVIDIA_BASE_URL)
+    )
 
 async def to_thread(fn, *args, **kwargs):
     """Run blocking sync code in worker threads."""
     loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(executor, lambda: fn(*args, **kwargs))
+    return await loop.run_in_executor(get_executor(), lambda: fn(*args, **kwargs))
 
 
 
@@ -56,18 +68,26 @@ async def create_generation_prompt(concept, max_length, style="meme"):
 
 async def generate_prompt(prompt:str="", system_prompt:str=""):
     """Generate a prompt using the Qwen model based on an article content or URL"""
+    async with LLM_LIMIT:
+        return await to_thread(generate_prompt_sync, prompt, system_prompt)
+
+def generate_prompt_sync(prompt:str="", system_prompt:str=""):
+    """Blocking streamed NVIDIA call behind generate_prompt"""
+    import httpx
+    from openai import OpenAI
+
     # Create a custom http client without proxies to avoid compatibility issues
-    http_client = httpx.Client(base_url="https://integrate.api.nvidia.com/v1")
+    http_client = httpx.Client(base_url=NVIDIA_BASE_URL)
     
     # Initialize the OpenAI client with the custom http client
     client = OpenAI(
-        base_url = "https://integrate.api.nvidia.com/v1",
+        base_url = NVIDIA_BASE_URL,
         api_key = os.getenv("NVIDIA_API_KEY"),
         http_client = http_client
     )
 
     completion = client.chat.completions.create(
-        model="qwen/qwen3-next-80b-a3b-thinking",
+        model=PROMPT_MODEL,
         messages=[
             {"role":"system","content":system_prompt},
             {"role":"user","content": prompt}
@@ -98,13 +118,14 @@ async def generate_prompt(prompt:str="", system_prompt:str=""):
 
 
 async def generate_prompt_fast(prompt: str, system_prompt: str):
-    return await to_thread(generate_prompt_fast_sync, prompt, system_prompt)
+    async with LLM_LIMIT:
+        return await to_thread(generate_prompt_fast_sync, prompt, system_prompt)
 
 def generate_prompt_fast_sync(prompt: str, system_prompt: str):
     """Synchronous NVIDIA call (non-streaming, fast)."""
 
-    completion = client.chat.completions.create(
-        model="qwen/qwen3-next-80b-a3b-thinking",
+    completion = get_client().chat.completions.create(
+        model=PROMPT_MODEL,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": prompt},
@@ -1,8 +1,9 @@
-import requests
-from markdownify import markdownify as md
 import re
 from ai.prompts import generate_prompt
 def get_article(article_url):
+    import requests
+    from markdownify import markdownify as md
+
     session = requests.Session()
     session.headers.update({
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
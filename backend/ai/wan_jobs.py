@@ -0,0 +1,130 @@
+import asyncio
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+from ai.wan_video import generate_wan_video_from_images
+from utils.scheduler import VIDEO_LANE, FairQueue
+
+
+class WanJobQueue:
+    """Single-consumer queue for Wan video jobs
+
+    There is one GPU, so jobs run strictly one at a time. They are taken in
+    weighted fair order across users (utils/scheduler.py), so one user's
+    batch of articles does not hold up everyone else's videos.
+    The models are owned by a WanModelManager shared with the rest of the app.
+    Job state is kept in memory; finished jobs are evicted oldest first once
+    more than max_finished_jobs are stored.
+    """
+
+    def __init__(self, model, run_job=generate_wan_video_from_images, max_finished_jobs: int = 1000):
+        self.model = model
+        self._run_job = run_job
+        self.max_finished_jobs = max_finished_jobs
+        self._queue = FairQueue()
+        self._queued = asyncio.Event()
+        # Jobs submitted and not finished
+        self._unfinished = 0
+        self._all_finished = asyncio.Event()
+        self._all_finished.set()
+        self._jobs = OrderedDict()
+        # job_id -> event set when the job finishes
+        self._finished = {}
+        self._consumer = None
+
+    def start(self):
+        """Start the consumer task (must be called from the running event loop)"""
+        if self._consumer is None or self._consumer.done():
+            self._consumer = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        if self._consumer is not None:
+            self._consumer.cancel()
+            try:
+                await self._consumer
+            except asyncio.CancelledError:
+                pass
+            self._consumer = None
+
+    def submit(self, article_id: int, user_id: int = 1, lane: str = VIDEO_LANE) -> dict:
+        """Queue a Wan video job for an article
+
+        Returns:
+            The job record (job_id, status, ...)
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "article_id": article_id,
+            "user_id": user_id,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+        }
+        self._jobs[job_id] = job
+        self._finished[job_id] = asyncio.Event()
+        self._queue.push(job_id, user_id, lane)
+        self._queued.set()
+        self._unfinished += 1
+        self._all_finished.clear()
+        self.start()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> dict | None:
+        """Get a copy of a job record, with its queue position while queued"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job = dict(job)
+        if job["status"] == "queued":
+            job["queue_position"] = self._queue.ordered().index(job_id)
+        return job
+
+    async def wait(self, job_id: str) -> dict | None:
+        """Wait for a job to finish and return its record"""
+        finished = self._finished.get(job_id)
+        if finished is not None:
+            await finished.wait()
+        return self.get(job_id)
+
+    async def join(self):
+        """Wait until every submitted job has finished"""
+        await self._all_finished.wait()
+
+    async def _consume(self):
+        while True:
+            while not len(self._queue):
+                self._queued.clear()
+                await self._queued.wait()
+            job_id = self._queue.pop()
+            job = self._jobs[job_id]
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            try:
+                result = await self._run_job(job["article_id"], model=self.model, user_id=job["user_id"])
+                job["result"] = result
+                job["status"] = "succeeded" if result else "failed"
+                if not result:
+                    job["error"] = "No video generated"
+            except Exception as e:
+                print(f"Wan job {job_id} failed: {e}")
+                traceback.print_exc()
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                job["finished_at"] = time.time()
+                self._finished.pop(job_id).set()
+                self._evict_finished()
+                self._unfinished -= 1
+                if not self._unfinished:
+                    self._all_finished.set()
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished_at"] is not None]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
@@ -0,0 +1,198 @@
+import asyncio
+import os
+import threading
+import time
+
+RESIDENCY_POLICIES = ("resident", "offload", "unload")
+
+
+class WanBackend:
+    """Interface the model manager drives
+
+    Implementations must be safe to call from a worker thread; the manager
+    never calls two methods at the same time.
+    """
+
+    def load(self):
+        """Load the models onto the device"""
+        raise NotImplementedError
+
+    def generate(self, **kwargs):
+        """Generate a video (same keyword arguments as the Wan generator)"""
+        raise NotImplementedError
+
+    def offload(self):
+        """Free device memory but keep the weights loaded in host memory"""
+
+    def unload(self):
+        """Drop the models entirely"""
+
+
+class WanSubmoduleBackend(WanBackend):
+    """Backend for the Wan-2-1 submodule's in-memory generator"""
+
+    def __init__(self, ckpt_dir: str | None = None, task: str = "vace-1.3B", device_id: int = 0):
+        self.ckpt_dir = ckpt_dir or os.getenv("WAN_CKPT_DIR", "/home/ubuntu/karthik-ragunath-ananda-kumar-utah/unianimate-dit/Wan2.1-VACE-1.3B")
+        self.task = task
+        self.device_id = device_id
+        self._generator = None
+
+    def load(self):
+        from ai.wan_video import get_generator
+
+        print("🔄 Loading Wan models (this will take a while)...")
+        self._generator = get_generator(
+            task=self.task,
+            ckpt_dir=self.ckpt_dir,
+            device_id=self.device_id
+        )
+        print("✓ Models loaded and cached in memory!")
+
+    def generate(self, **kwargs):
+        return self._generator.generate(**kwargs)
+
+    def offload(self):
+        # Wan moves the diffusion model back onto the device at the start of
+        # generate(), so parking it on the CPU is safe between jobs
+        model = getattr(self._generator, "model", None)
+        if model is not None and hasattr(model, "cpu"):
+            model.cpu()
+        self._empty_device_cache()
+
+    def unload(self):
+        self._generator = None
+        self._empty_device_cache()
+
+    @staticmethod
+    def _empty_device_cache():
+        try:
+            import torch
+        except ImportError:
+            return
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+class WanModelManager:
+    """Owns the Wan models: preloading, residency and load state
+
+    Residency policies:
+        resident: load once and keep the weights on the device
+        offload: keep the weights on the device while busy, park them in host
+            memory after idle_seconds without a job
+        unload: drop the models after idle_seconds without a job (the next job
+            pays the full load again)
+
+    Within a job the weights are never offloaded (offload_model=False), so
+    back-to-back jobs don't reshuffle weights.
+    """
+
+    def __init__(self, backend: WanBackend, residency: str = "resident", idle_seconds: float = 600):
+        if residency not in RESIDENCY_POLICIES:
+            raise ValueError(f"Unknown Wan residency policy: {residency} (expected one of {RESIDENCY_POLICIES})")
+        self.backend = backend
+        self.residency = residency
+        self.idle_seconds = idle_seconds
+        self.state = "unloaded"
+        self.error = None
+        self.loaded_at = None
+        self.last_used = None
+        self.jobs_done = 0
+        self._lock = threading.Lock()
+        self._idle_task = None
+
+    def _ensure_loaded(self):
+        # Caller holds self._lock
+        if self.state in ("ready", "offloaded"):
+            return
+        self.state = "loading"
+        self.error = None
+        start = time.time()
+        try:
+            self.backend.load()
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            raise
+        self.state = "ready"
+        self.loaded_at = time.time()
+        print(f"Wan models loaded in {self.loaded_at - start:.1f}s")
+
+    def _generate_sync(self, **kwargs):
+        with self._lock:
+            self._ensure_loaded()
+            self.state = "busy"
+            try:
+                kwargs["offload_model"] = False
+                return self.backend.generate(**kwargs)
+            finally:
+                self.state = "ready"
+                self.jobs_done += 1
+                self.last_used = time.time()
+
+    def _release_if_idle(self):
+        with self._lock:
+            if self.state != "ready" or self.last_used is None:
+                return
+            if time.time() - self.last_used < self.idle_seconds:
+                return
+            if self.residency == "offload":
+                print("Wan models idle, offloading to host memory")
+                self.backend.offload()
+                self.state = "offloaded"
+            elif self.residency == "unload":
+                print("Wan models idle, unloading")
+                self.backend.unload()
+                self.state = "unloaded"
+
+    async def preload(self):
+        """Load the models now rather than on the first job"""
+        def load():
+            with self._lock:
+                self._ensure_loaded()
+        try:
+            await asyncio.to_thread(load)
+        except Exception as e:
+            print(f"Wan preload failed: {e}")
+
+    async def generate(self, **kwargs):
+        """Generate a video without blocking the event loop"""
+        return await asyncio.to_thread(self._generate_sync, **kwargs)
+
+    def start(self):
+        """Start the idle watcher (must be called from the running event loop)"""
+        if self.residency == "resident":
+            return
+        if self._idle_task is None or self._idle_task.done():
+            self._idle_task = asyncio.create_task(self._watch_idle())
+
+    async def stop(self):
+        if self._idle_task is not None:
+            self._idle_task.cancel()
+            try:
+                await self._idle_task
+            except asyncio.CancelledError:
+                pass
+            self._idle_task = None
+
+    async def _watch_idle(self):
+        interval = max(1.0, min(self.idle_seconds / 4, 30.0))
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self._release_if_idle)
+
+    @property
+    def ready(self) -> bool:
+        return self.state in ("ready", "busy", "offloaded")
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "residency": self.residency,
+            "idle_seconds": self.idle_seconds,
+            "loaded_at": self.loaded_at,
+            "last_used": self.last_used,
+            "jobs_done": self.jobs_done,
+            "error": self.error,
+        }
@@ -0,0 +1,173 @@
+import importlib.util
+import os
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+# Add the backend directory to the path so we can import from db
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from db.db import store_media, get_media_urls_by_article
+from utils.s3_upload import upload_to_s3_async
+from utils.downloads import DownloadCache
+from utils.workspace import JobWorkspace, gc_workspaces
+from utils.metrics import span
+
+# Add Wan-2-1 to Python path for dynamic import
+WAN_DIR = Path(__file__).parent.parent.parent / "submodules" / "Wan-2-1"
+if str(WAN_DIR) not in sys.path:
+    sys.path.insert(0, str(WAN_DIR))
+
+# The Wan generator pulls in torch, so it is only imported when the models
+# load (see load_wan_generator); this just checks that the submodule is there
+WAN_INSTALLED = importlib.util.find_spec("generate_integrated_fast") is not None
+if not WAN_INSTALLED:
+    print(f"Warning: Wan generator not available: generate_integrated_fast not found in {WAN_DIR}")
+
+
+@lru_cache(maxsize=None)
+def load_wan_generator():
+    """Import the submodule's generator module on first use
+
+    The result is cached, so a broken install (e.g. torch missing) is only
+    tried and reported once.
+
+    Returns:
+        The generate_integrated_fast module, or None if it can't be imported
+    """
+    try:
+        import generate_integrated_fast  # type: ignore[import-not-found]
+    except Exception as e:
+        print(f"Warning: Wan generator not available: {type(e).__name__}: {e}")
+        return None
+    return generate_integrated_fast
+
+
+def get_generator(**kwargs):
+    """Build the submodule's in-memory generator (imports torch and Wan)"""
+    module = load_wan_generator()
+    if module is None:
+        raise RuntimeError("Wan generator not available (generate_integrated_fast failed to import)")
+    return module.get_generator(**kwargs)
+
+
+# The generator only consumes the first reference image today
+WAN_NUM_REF_IMAGES = int(os.getenv("WAN_NUM_REF_IMAGES", "1"))
+
+# Per-job workspaces live on the scratch volume and are removed after upload
+WAN_SCRATCH_DIR = Path(os.getenv("WAN_SCRATCH_DIR", str(WAN_DIR / "wan_generated")))
+WAN_SCRATCH_MAX_BYTES = int(os.getenv("WAN_SCRATCH_MAX_BYTES", str(20 * 1024**3)))
+WAN_SCRATCH_MIN_FREE_BYTES = int(os.getenv("WAN_SCRATCH_MIN_FREE_BYTES", str(5 * 1024**3)))
+WAN_SCRATCH_MAX_AGE_SECONDS = float(os.getenv("WAN_SCRATCH_MAX_AGE_HOURS", "24")) * 3600
+
+# Reference images shared across runs (repeated runs on an article skip the download)
+REF_IMAGE_CACHE = DownloadCache(
+    os.getenv("WAN_REF_IMAGE_CACHE_DIR", str(WAN_DIR / "ref_image_cache")),
+    max_bytes=int(os.getenv("WAN_REF_IMAGE_CACHE_MAX_BYTES", str(1024**3)))
+)
+
+WAN_PROMPT = "create a coherent video animation using the reference images with smooth transitions and engaging movement"
+
+
+async def generate_wan_video_from_images(article_id: int, model, user_id: int = 1):
+    """Generate Wan video from article images
+
+    Args:
+        article_id: ID of the article whose images are used as references
+        model: WanModelManager that owns the loaded models
+        user_id: User ID for database storage
+    """
+    # Get all image URLs from the article
+    print(f"\n=== Fetching images for article {article_id} ===")
+    image_urls = await get_media_urls_by_article(article_id, media_type='image')
+
+    if not image_urls:
+        print("No images found, skipping Wan video generation")
+        return None
+
+    print(f"Found {len(image_urls)} images for Wan video generation")
+
+    # Make room on the scratch volume before starting
+    gc_stats = gc_workspaces(
+        WAN_SCRATCH_DIR,
+        max_bytes=WAN_SCRATCH_MAX_BYTES,
+        min_free_bytes=WAN_SCRATCH_MIN_FREE_BYTES,
+        max_age_seconds=WAN_SCRATCH_MAX_AGE_SECONDS
+    )
+    if gc_stats["removed_workspaces"]:
+        print(f"Removed {gc_stats['removed_workspaces']} old Wan workspaces ({gc_stats['freed_bytes']} bytes)")
+
+    # Unique directory for this run (removed once the video is uploaded)
+    with JobWorkspace(WAN_SCRATCH_DIR) as workspace:
+        run_dir = workspace.path
+        print(f"Created run directory: {run_dir}")
+        return await _generate_in_workspace(article_id, model, image_urls, workspace)
+
+
+async def _generate_in_workspace(article_id, model, image_urls, workspace):
+    run_dir = workspace.path
+
+    # Download only the images the generator consumes, concurrently
+    local_image_paths = [str(path) for path in await REF_IMAGE_CACHE.fetch_many(image_urls[:WAN_NUM_REF_IMAGES])]
+
+    # Join paths with comma for Wan input
+    src_ref_images = ",".join(local_image_paths)
+
+    # Generate prompt for video
+    prompt = WAN_PROMPT
+
+    print(f"\n=== Generating Wan video ===")
+    print(f"Reference images: {src_ref_images}")
+
+    # Define output video path in run_dir
+    output_video_path = run_dir / f"wan_video_{run_dir.name}.mp4"
+
+    # Generate video (runs in a worker thread so the event loop keeps serving requests)
+    print("Generating video with cached models...")
+    async with span("wan", model=getattr(model.backend, "task", ""), style="wan_video"):
+        await model.generate(
+            prompt=prompt,
+            src_ref_images=src_ref_images,
+            save_file=str(output_video_path),
+            size="832*480",
+            frame_num=41,
+            sample_steps=25,
+            sample_shift=16.0,
+            sample_solver='unipc',
+            guide_scale=5.0,
+            base_seed=-1
+        )
+
+    # Check if video was generated
+    if not output_video_path.exists():
+        print(f"Video not found at expected path: {output_video_path}")
+        return None
+
+    print(f"\n=== Video generated at: {output_video_path} ===")
+
+    # Upload to S3
+    print("\n=== Uploading Wan video to S3 ===")
+    # A failed upload fails the job: the workspace is removed on exit, so a
+    # media row must never point at the local file
+    try:
+        media_url = await upload_to_s3_async(str(output_video_path), s3_folder="wan_videos")
+    except Exception as e:
+        raise RuntimeError(f"Failed to upload Wan video to S3: {e}") from e
+    print(f"Video uploaded to S3: {media_url}")
+
+    # Store the media in the database
+    media_row = await store_media(
+        article_id=article_id,
+        prompt=prompt[:500],
+        style="wan_video",
+        media_type="video",
+        media_url=media_url
+    )
+
+    print(f"\n=== Wan video stored in database with ID {media_row['id']} ===")
+
+    return {
+        "media_id": media_row["id"],
+        "video_url": media_url,
+        "prompt": prompt,
+        "num_reference_images": len(image_urls)
+    }
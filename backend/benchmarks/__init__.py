@@ -0,0 +1 @@
+# Make this directory a proper Python package
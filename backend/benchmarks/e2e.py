@@ -0,0 +1,255 @@
+"""Offline end-to-end load test of the API
+
+Drives /generate, /manim and /media in-process (httpx over ASGI) with every
+external service replaced by a local fake (see benchmarks/fakes.py), so no
+NVIDIA or fal credits are spent. Reports throughput, p50/p95/p99 latency and
+event-loop lag; --json writes the same numbers for run-to-run comparison.
+The generate-stream endpoint is /generate in NDJSON streaming mode, and also
+reports the time to the first stored image.
+
+Usage (from the backend directory):
+    python -m benchmarks.e2e --endpoint generate --requests 50 --concurrency 10
+    python -m benchmarks.e2e --endpoint manim --llm-latency 2 --render-latency 5
+    python -m benchmarks.e2e --endpoint media --requests 1000 --concurrency 50 --json media.json
+    python -m benchmarks.e2e --endpoint generate-stream --fal-latency 3
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from benchmarks.fakes import offline_services
+
+ENDPOINTS = ("generate", "generate-stream", "manim", "media")
+
+
+def percentile(values, q: float) -> float:
+    """q-th percentile (0-100) with linear interpolation"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values) -> dict:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values, default=0.0),
+        "mean": statistics.fmean(values) if values else 0.0,
+    }
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a task that sleeps `interval`
+
+    Lag is the API's blocking time showing through: sync calls made on the
+    loop (rather than in threads) delay every other request.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+
+
+def request_for(endpoint: str, i: int, article_base_url: str):
+    """(method, path, json body) of the i-th benchmark request"""
+    if endpoint == "media":
+        return "GET", "/media?limit=50", None
+    if endpoint == "generate-stream":
+        return "POST", "/generate", {"user_id": 1, "link": f"{article_base_url}/{i}", "style": "meme", "stream": "ndjson"}
+    return "POST", f"/{endpoint}", {"user_id": 1, "link": f"{article_base_url}/{i}", "style": "meme" if endpoint == "generate" else "manim"}
+
+
+async def read_stream(client, path: str, body: dict, first_images: list) -> str | None:
+    """Read a /generate NDJSON stream, recording the time to its first image
+
+    The ASGI transport hands over the body only once the response is
+    complete, so the time is the server's: the first image event's
+    elapsed_seconds (since the run started).
+
+    Returns:
+        Why the request failed, or None
+    """
+    last = first = None
+    async with client.stream("POST", path, json=body) as response:
+        if response.status_code != 200:
+            return f"HTTP {response.status_code}"
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            last = json.loads(line)
+            if last["event"] == "image" and first is None:
+                first = last["elapsed_seconds"]
+    if last is None or last["event"] != "done":
+        return f"Stream ended with: {json.dumps(last)[:200]}"
+    first_images.append(first)
+    return None
+
+
+async def run_load(app, endpoint: str, requests: int, concurrency: int, article_base_url: str, timeout: float) -> dict:
+    """Send `requests` requests with at most `concurrency` in flight"""
+    import httpx
+
+    latencies = []
+    first_images = []
+    errors = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    monitor = LoopLagMonitor()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=timeout) as client:
+        async def one(i):
+            method, path, body = request_for(endpoint, i, article_base_url)
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    if endpoint == "generate-stream":
+                        reason = await read_stream(client, path, body, first_images)
+                    else:
+                        response = await client.request(method, path, json=body)
+                        ok = response.status_code == 200 and response.json().get("success", True) is not False
+                        reason = None if ok else f"HTTP {response.status_code}: {response.text[:200]}"
+                except Exception as e:
+                    reason = f"{type(e).__name__}: {e}"
+                if reason is None:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors[reason] = errors.get(reason, 0) + 1
+
+        monitor.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+        await monitor.stop()
+
+    return {
+        "endpoint": endpoint,
+        "requests": requests,
+        "concurrency": concurrency,
+        "succeeded": len(latencies),
+        "failed": sum(errors.values()),
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_seconds": summarize(latencies),
+        "first_image_seconds": summarize(first_images) if first_images else None,
+        "loop_lag_seconds": summarize(monitor.lags),
+    }
+
+
+async def run_benchmark(endpoint: str = "generate", requests: int = 20, concurrency: int = 5, seed_articles: int = 0,
+                        timeout: float = 600, **service_options) -> dict:
+    """Run one load test against fresh offline services
+
+    Args:
+        endpoint: One of ENDPOINTS
+        requests: Number of requests to send
+        concurrency: Maximum requests in flight
+        seed_articles: Articles generated through /generate before the run
+            (so /media has rows to return)
+        timeout: Per-request timeout in seconds
+        service_options: Latencies etc. passed to offline_services
+    """
+    with offline_services(**service_options) as services:
+        import main
+        from utils.downloads import close_http_client
+        from utils.mirror import MEDIA_MIRROR
+
+        try:
+            if seed_articles:
+                await run_load(main.app, "generate", seed_articles, concurrency, services["article_base_url"], timeout)
+            result = await run_load(main.app, endpoint, requests, concurrency, services["article_base_url"], timeout)
+            # Background S3 mirroring is part of the work the run caused
+            mirror_started = time.perf_counter()
+            await MEDIA_MIRROR.join()
+            result["mirror_drain_seconds"] = time.perf_counter() - mirror_started
+            result["service_calls"] = dict(services["server"].requests)
+            result["options"] = service_options
+        finally:
+            await close_http_client()
+    return result
+
+
+def print_report(result: dict):
+    latency = result["latency_seconds"]
+    lag = result["loop_lag_seconds"]
+    print(f"\n/{result['endpoint']}: {result['requests']} requests, concurrency {result['concurrency']}")
+    print(f"  succeeded {result['succeeded']}, failed {result['failed']} in {result['elapsed_seconds']:.2f}s "
+          f"({result['throughput_rps']:.2f} req/s)")
+    print(f"  latency   p50 {latency['p50']*1000:8.1f} ms  p95 {latency['p95']*1000:8.1f} ms  "
+          f"p99 {latency['p99']*1000:8.1f} ms  max {latency['max']*1000:8.1f} ms")
+    first_image = result["first_image_seconds"]
+    if first_image:
+        print(f"  1st image p50 {first_image['p50']*1000:8.1f} ms  p95 {first_image['p95']*1000:8.1f} ms  "
+              f"p99 {first_image['p99']*1000:8.1f} ms  max {first_image['max']*1000:8.1f} ms")
+    print(f"  loop lag  p50 {lag['p50']*1000:8.1f} ms  p95 {lag['p95']*1000:8.1f} ms  "
+          f"p99 {lag['p99']*1000:8.1f} ms  max {lag['max']*1000:8.1f} ms")
+    print(f"  mirror drain {result['mirror_drain_seconds']:.2f}s, service calls {result['service_calls']}")
+    for reason, count in result["errors"].items():
+        print(f"  error x{count}: {reason}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--endpoint", choices=ENDPOINTS, default="generate")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--seed-articles", type=int, default=None, help="Articles to create first (default: 5 for /media)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per LLM completion")
+    parser.add_argument("--llm-chunks", type=int, default=20, help="Chunks per streamed completion")
+    parser.add_argument("--fal-latency", type=float, default=2.0, help="Seconds per fal image")
+    parser.add_argument("--render-latency", type=float, default=1.0, help="Seconds per manim render")
+    parser.add_argument("--concepts", type=int, default=3, help="Concepts per decomposed article")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output")
+    args = parser.parse_args()
+
+    seed_articles = args.seed_articles if args.seed_articles is not None else (5 if args.endpoint == "media" else 0)
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        result = asyncio.run(run_benchmark(
+            endpoint=args.endpoint,
+            requests=args.requests,
+            concurrency=args.concurrency,
+            seed_articles=seed_articles,
+            llm_latency=args.llm_latency,
+            llm_chunks=args.llm_chunks,
+            fal_latency=args.fal_latency,
+            render_latency=args.render_latency,
+            concepts=args.concepts,
+        ))
+
+    print_report(result)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,551 @@
+"""Local stand-ins for every external service the pipeline talks to
+
+- FakeServiceServer: one local HTTP server that serves an OpenAI-compatible
+  /v1/chat/completions (streaming or not, with configurable latency), article
+  pages for the scraper and image bytes for "fal" results
+- fake_fal_module / fake_tweepy_module: drop-in modules for fal_client and
+  tweepy (both are imported lazily, so putting them in sys.modules is enough)
+- InMemoryRepository: the db.db functions the API uses, backed by dicts
+- offline_services(): installs all of the above plus a moto S3 bucket and a
+  fake manim renderer, and undoes everything on exit
+"""
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from utils.scheduler import ARTICLE_LANE, LANES
+
+BENCH_BUCKET = "astrosmurf-bench"
+
+ARTICLE_HTML = """<html><body><h1>Benchmark article {n}</h1>
+<p>Black holes bend light so strongly that nothing escapes past the event horizon.</p>
+<p>Gravitational waves ripple outward when two black holes merge.</p>
+<p>Hawking radiation means black holes slowly evaporate over time.</p>
+</body></html>"""
+
+MANIM_CODE = """```python
+from manim import *
+
+class BenchScene{n}(Scene):
+    def construct(self):
+        self.play(Create(Circle()))
+```"""
+
+# 1x1 transparent PNG
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+
+class FakeServiceServer:
+    """Threaded local HTTP server standing in for NVIDIA, article sites and fal's CDN
+
+    Latency is simulated with time.sleep in the server's own threads, so it
+    costs the API under test nothing but waiting, like a remote service.
+    """
+
+    def __init__(self, llm_latency: float = 0.5, llm_chunks: int = 20, concepts: int = 3):
+        self.llm_latency = llm_latency
+        self.llm_chunks = llm_chunks
+        self.concepts = concepts
+        # Concepts every decomposition returns, if set (e.g. to simulate an
+        # edited article); by default each decomposition is unique
+        self.fixed_concepts = None
+        self.requests = {"chat": 0, "article": 0, "image": 0}
+        self._counter = itertools.count(1)
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.startswith("/article/"):
+                    server.requests["article"] += 1
+                    self._send(200, "text/html", ARTICLE_HTML.format(n=self.path.rsplit("/", 1)[-1]).encode())
+                elif self.path.startswith("/images/"):
+                    server.requests["image"] += 1
+                    self._send(200, "image/png", PNG_BYTES)
+                else:
+                    self._send(404, "text/plain", b"not found")
+
+            def do_POST(self):
+                if not self.path.endswith("/chat/completions"):
+                    self._send(404, "text/plain", b"not found")
+                    return
+                server.requests["chat"] += 1
+                body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))))
+                content = server.completion_for(body)
+                if body.get("stream"):
+                    self._stream(body.get("model", ""), content)
+                else:
+                    time.sleep(server.llm_latency)
+                    self._send(200, "application/json", json.dumps(_completion(body.get("model", ""), content)).encode())
+
+            def _send(self, status, content_type, data):
+                self.send_response(status)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model, content):
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.end_headers()
+                chunks = max(1, server.llm_chunks)
+                size = max(1, -(-len(content) // chunks))
+                pieces = [content[i:i + size] for i in range(0, len(content), size)]
+                for piece in pieces:
+                    time.sleep(server.llm_latency / len(pieces))
+                    self.wfile.write(f"data: {json.dumps(_chunk(model, piece))}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def completion_for(self, body: dict) -> str:
+        """Canned answer shaped like what the caller expects
+
+        Every answer is unique, so render and upload caches are not hit
+        across benchmark requests.
+        """
+        n = next(self._counter)
+        prompt = " ".join(m.get("content", "") for m in body.get("messages", []))
+        if "<concept>" in prompt and self.fixed_concepts is not None:
+            return "\n".join(f"<concept>{concept}</concept>" for concept in self.fixed_concepts)
+        if "<concept>" in prompt:
+            return "\n".join(f"<concept>Benchmark concept {n}.{i}: black holes, idea {i}.</concept>" for i in range(self.concepts))
+        if "Manim" in prompt:
+            return MANIM_CODE.format(n=n)
+        return f"A glowing black hole over a city skyline, cinematic lighting, variation {n}"
+
+
+def _completion(model, content):
+    return {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def _chunk(model, content):
+    return {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+    }
+
+
+def fake_fal_module(image_base_url: str, latency: float = 2.0) -> types.ModuleType:
+    """A fal_client replacement: queued jobs that finish after `latency` seconds"""
+    module = types.ModuleType("fal_client")
+    counter = itertools.count(1)
+
+    class Handler:
+        def __init__(self, n):
+            self.n = n
+
+        async def iter_events(self, with_logs=False):
+            yield {"status": "IN_PROGRESS"}
+            await asyncio.sleep(latency)
+            yield {"status": "COMPLETED"}
+
+        async def get(self):
+            return {"images": [{"url": f"{image_base_url}/images/{self.n}.png", "width": 1, "height": 1, "content_type": "image/png"}]}
+
+    async def submit_async(application, arguments):
+        return Handler(next(counter))
+
+    module.submit_async = submit_async
+    return module
+
+
+def fake_tweepy_module(latency: float = 0.2) -> types.ModuleType:
+    """A tweepy replacement whose uploads and tweets just sleep"""
+    module = types.ModuleType("tweepy")
+    counter = itertools.count(1)
+
+    class OAuth1UserHandler:
+        def __init__(self, *args, **kwargs):
+            pass
+
+    class API:
+        def __init__(self, auth):
+            pass
+
+        def media_upload(self, path, **kwargs):
+            time.sleep(latency)
+            return types.SimpleNamespace(media_id_string=str(next(counter)), expires_after_secs=86400)
+
+    class Client:
+        def __init__(self, **kwargs):
+            pass
+
+        def create_tweet(self, text="", media_ids=None):
+            time.sleep(latency)
+            return types.SimpleNamespace(data={"id": str(next(counter))})
+
+    module.OAuth1UserHandler = OAuth1UserHandler
+    module.API = API
+    module.Client = Client
+    return module
+
+
+class InMemoryRepository:
+    """The db.db functions used by the API, backed by in-memory tables
+
+    Methods share names and signatures with db.db, and return dicts where
+    db.db returns asyncpg records.
+    """
+
+    def __init__(self):
+        self.articles = {}
+        self.media = {}
+        self.media_variants = {}
+        self.x_media_uploads = {}
+        self.jobs = {}
+        self.checkpoints = {}
+        self._ids = itertools.count(1)
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc)
+
+    async def create_article(self, source, text, user_id=None, run_id=None):
+        for article in self.articles.values():
+            if run_id is not None and article["run_id"] == run_id:
+                article["text"] = text
+                return {"id": article["id"]}
+        article_id = next(self._ids)
+        self.articles[article_id] = {
+            "id": article_id, "source": source, "text": text, "user_id": user_id, "run_id": run_id, "date_created": self._now(),
+        }
+        return {"id": article_id}
+
+    async def get_article_by_id(self, article_id):
+        return self.articles.get(article_id)
+
+    async def get_latest_article_by_source(self, source, user_id=None):
+        articles = [a for a in self.articles.values() if a["source"] == source and user_id in (None, a["user_id"])]
+        return max(articles, key=lambda a: (a["date_created"], a["id"]), default=None)
+
+    async def update_article_text(self, article_id, text):
+        if article_id not in self.articles:
+            return None
+        self.articles[article_id]["text"] = text
+        return {"id": article_id}
+
+    async def get_media_by_article(self, article_id):
+        return sorted(
+            (m for m in self.media.values() if m["article_id"] == article_id and m["superseded_at"] is None),
+            key=lambda m: m["date_created"], reverse=True,
+        )
+
+    async def supersede_media(self, media_ids):
+        for media_id in media_ids:
+            if self.media[media_id]["superseded_at"] is None:
+                self.media[media_id]["superseded_at"] = self._now()
+
+    async def store_media(self, article_id, prompt, style, media_type, media_url, run_id=None, run_slot=None, concept=None, persona_id=None):
+        for media in self.media.values():
+            if run_id is not None and (media["run_id"], media["run_slot"]) == (run_id, run_slot):
+                return {"id": media["id"], "media_url": media["media_url"], "inserted": False}
+        media_id = next(self._ids)
+        self.media[media_id] = {
+            "id": media_id, "article_id": article_id, "prompt": prompt, "style": style, "media_type": media_type,
+            "media_url": media_url, "run_id": run_id, "run_slot": run_slot, "concept": concept,
+            "persona_id": persona_id, "superseded_at": None, "date_created": self._now(),
+        }
+        return {"id": media_id, "media_url": media_url, "inserted": True}
+
+    async def update_media_url(self, media_id, media_url):
+        if media_id not in self.media:
+            return None
+        self.media[media_id]["media_url"] = media_url
+        return {"id": media_id}
+
+    async def store_media_variant(self, media_id, quality, media_url):
+        self.media_variants[(media_id, quality)] = {"quality": quality, "media_url": media_url, "date_created": self._now()}
+        return {"id": media_id}
+
+    async def get_media_variants(self, media_id):
+        return [v for (m, _), v in self.media_variants.items() if m == media_id]
+
+    async def get_media_by_id(self, media_id):
+        return self.media.get(media_id)
+
+    async def get_media_urls_by_article(self, article_id, media_type="image"):
+        return [
+            m["media_url"] for m in self.media.values()
+            if m["article_id"] == article_id and m["media_type"] == media_type and m["superseded_at"] is None
+        ]
+
+    async def get_persona_by_id(self, persona_id):
+        return {"id": persona_id, "image_url": None}
+
+    async def get_media_with_article_info(self, limit=50):
+        rows = []
+        for media in sorted(self.media.values(), key=lambda m: m["date_created"], reverse=True)[:limit]:
+            article = self.articles.get(media["article_id"], {})
+            rows.append(dict(media, article_text=article.get("text"), article_source=article.get("source")))
+        return rows
+
+    async def search_media(self, search_term, limit=20):
+        term = search_term.lower()
+        rows = await self.get_media_with_article_info(limit=len(self.media))
+        return [r for r in rows if term in f"{r['article_text']} {r['article_source']} {r['prompt']}".lower()][:limit]
+
+    async def get_x_media_upload(self, media_id, media_url):
+        upload = self.x_media_uploads.get(media_id)
+        if upload and upload["media_url"] == media_url and upload["expires_at"] > self._now():
+            return upload["x_media_id"]
+        return None
+
+    async def store_x_media_upload(self, media_id, media_url, x_media_id, expires_at):
+        self.x_media_uploads[media_id] = {"media_url": media_url, "x_media_id": x_media_id, "expires_at": expires_at}
+
+    async def create_job(self, job_id, kind, params, user_id=None, lane=ARTICLE_LANE, cost=1.0):
+        now = self._now()
+        pending = [j for j in self.jobs.values() if j["lane"] == lane and j["status"] in ("queued", "running")]
+        running = [j["fair_start"] for j in pending if j["status"] == "running"]
+        virtual_time = max(running) if running else min((j["fair_start"] for j in pending), default=0)
+        user_tag = max((j["fair_tag"] for j in pending if j["user_id"] == user_id), default=0)
+        start = max(virtual_time, user_tag)
+        self.jobs[job_id] = {
+            "id": job_id, "kind": kind, "user_id": user_id, "params": params, "status": "queued",
+            "lane": lane, "fair_start": start, "fair_tag": start + cost,
+            "progress": None, "result": None, "error": None, "attempts": 0, "worker_id": None,
+            "claimed_until": None, "created_at": now, "started_at": None, "finished_at": None, "updated_at": now,
+        }
+        return dict(self.jobs[job_id])
+
+    async def get_job(self, job_id):
+        job = self.jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def claim_job(self, kinds, worker_id, lease_seconds, max_attempts):
+        now = self._now()
+        order = lambda j: (LANES.index(j["lane"]), j["fair_tag"], j["created_at"])
+        for job in sorted(self.jobs.values(), key=order):
+            expired = job["status"] == "running" and job["claimed_until"] < now
+            if job["kind"] in kinds and job["attempts"] < max_attempts and (job["status"] == "queued" or expired):
+                job.update(
+                    status="running", attempts=job["attempts"] + 1, worker_id=worker_id,
+                    claimed_until=now + timedelta(seconds=lease_seconds),
+                    started_at=job["started_at"] or now, updated_at=now,
+                )
+                return dict(job)
+        return None
+
+    async def renew_job_lease(self, job_id, worker_id, lease_seconds):
+        job = self.jobs.get(job_id)
+        if not job or job["worker_id"] != worker_id or job["status"] != "running":
+            return False
+        job["claimed_until"] = self._now() + timedelta(seconds=lease_seconds)
+        return True
+
+    async def update_job_progress(self, job_id, progress):
+        self.jobs[job_id].update(progress=progress, updated_at=self._now())
+
+    async def finish_job(self, job_id, status, result=None, error=None, progress=None):
+        job = self.jobs[job_id]
+        job.update(status=status, result=result, error=error, claimed_until=None, finished_at=self._now(), updated_at=self._now())
+        if progress is not None:
+            job["progress"] = progress
+
+    async def fail_abandoned_jobs(self, max_attempts):
+        now = self._now()
+        for job in self.jobs.values():
+            if job["status"] == "running" and job["claimed_until"] < now and job["attempts"] >= max_attempts:
+                job.update(status="failed", error="Worker lost while running the job", claimed_until=None, finished_at=now, updated_at=now)
+
+    async def get_checkpoints(self, run_key, max_age_seconds):
+        cutoff = self._now() - timedelta(seconds=max_age_seconds)
+        return {
+            stage: json.loads(saved["data"])
+            for (key, stage), saved in self.checkpoints.items()
+            if key == run_key and saved["date_created"] > cutoff
+        }
+
+    async def save_checkpoint(self, run_key, stage, data):
+        self.checkpoints[(run_key, stage)] = {"data": json.dumps(data, default=str), "date_created": self._now()}
+
+    async def delete_checkpoints(self, run_key):
+        for key in [key for key in self.checkpoints if key[0] == run_key]:
+            del self.checkpoints[key]
+
+    async def delete_stale_checkpoints(self, max_age_seconds):
+        cutoff = self._now() - timedelta(seconds=max_age_seconds)
+        for key in [key for key, saved in self.checkpoints.items() if saved["date_created"] < cutoff]:
+            del self.checkpoints[key]
+
+    async def release_tombstone(self, media_url):
+        # Nothing is ever tombstoned in memory
+        return False
+
+
+_MISSING = object()
+
+
+class _Patches:
+    """Records attribute and mapping changes so they can be undone"""
+
+    def __init__(self):
+        self._undo = []
+
+    def setattr(self, target, name, value):
+        old = getattr(target, name, _MISSING)
+        self._undo.append(lambda: delattr(target, name) if old is _MISSING else setattr(target, name, old))
+        setattr(target, name, value)
+
+    def setitem(self, mapping, key, value):
+        old = mapping.get(key, _MISSING)
+        self._undo.append(lambda: mapping.pop(key, None) if old is _MISSING else mapping.__setitem__(key, old))
+        mapping[key] = value
+
+    def undo(self):
+        while self._undo:
+            self._undo.pop()()
+
+
+def _install_repository(patches, repository):
+    """Point db.db and every module that imported its functions at the repository"""
+    import db.db as db_module
+
+    for name in dir(repository):
+        if name.startswith("_") or not hasattr(db_module, name):
+            continue
+        original = getattr(db_module, name)
+        replacement = getattr(repository, name)
+        for module in list(sys.modules.values()):
+            if module is not None and getattr(module, name, None) is original:
+                patches.setattr(module, name, replacement)
+
+
+@contextmanager
+def offline_services(
+    llm_latency: float = 0.5,
+    llm_chunks: int = 20,
+    fal_latency: float = 2.0,
+    render_latency: float = 1.0,
+    x_latency: float = 0.2,
+    concepts: int = 3,
+    repository=None,
+):
+    """Run the API against local fakes; yields a dict describing them
+
+    Must be entered before the app is used. Importing main here (rather than
+    at the caller) lets the environment be set up first.
+    """
+    from moto import mock_aws
+
+    patches = _Patches()
+    server = FakeServiceServer(llm_latency=llm_latency, llm_chunks=llm_chunks, concepts=concepts).start()
+    workdir = Path(tempfile.mkdtemp(prefix="astrosmurf_bench_"))
+    s3_mock = mock_aws()
+    try:
+        for key, value in {
+            "NVIDIA_API_KEY": "bench",
+            "sa_aws_bucket": BENCH_BUCKET,
+            "sa_aws_access_key_id": "bench",
+            "sa_aws_secret_access_key": "bench",
+            "AWS_REGION": "us-east-1",
+            "MIRROR_TO_S3": "1",
+            "RUN_POSTING_WORKER": "0",
+            "MANIM_WORKERS": "0",
+        }.items():
+            patches.setitem(os.environ, key, value)
+        patches.setitem(sys.modules, "fal_client", fake_fal_module(server.base_url, latency=fal_latency))
+        patches.setitem(sys.modules, "tweepy", fake_tweepy_module(latency=x_latency))
+
+        import main  # noqa: F401  (loads every module the repository patches)
+        import ai.prompts as prompts
+        import ai.nemotron_manim_generator as manim_generator
+        import x.post as x_post
+        from utils.render_cache import RenderCache
+        from utils.s3_upload import get_s3_client
+        from utils.tex_cache import TexCache
+
+        llm_url = f"{server.base_url}/v1"
+        patches.setattr(prompts, "NVIDIA_BASE_URL", llm_url)
+        patches.setattr(manim_generator, "NVIDIA_BASE_URL", llm_url)
+        prompts.get_client.cache_clear()
+        x_post.get_client.cache_clear()
+        x_post.get_api.cache_clear()
+
+        # Manim writes under a throwaway directory and "renders" by sleeping
+        patches.setattr(manim_generator, "BACKEND_DIR", workdir)
+        patches.setattr(manim_generator, "MANIM_CODE_DIR", workdir / "manim" / "code")
+        patches.setattr(manim_generator, "MANIM_VIDEO_DIR", workdir / "manim" / "generated_video")
+        patches.setattr(manim_generator, "MANIM_TEX_STAGING_DIR", workdir / "manim" / "tex_staging")
+        patches.setattr(manim_generator, "RENDER_CACHE", RenderCache(workdir / "manim" / "render_cache.json"))
+        patches.setattr(manim_generator, "TEX_CACHE", TexCache(workdir / "manim" / "tex_cache", max_bytes=64 * 1024**2))
+        patches.setattr(manim_generator, "RENDER_POOL", None)
+
+        async def fake_render(scene_filepath, scene_name, output_path, quality, staging_dir, tex_dir):
+            await asyncio.sleep(render_latency)
+            video_path = output_path / "videos" / Path(scene_filepath).stem / manim_generator.QUALITY_DIRS[quality] / f"{scene_name}.mp4"
+            video_path.parent.mkdir(parents=True, exist_ok=True)
+            video_path.write_bytes(f"fake {scene_name} {quality}".encode())
+            return video_path
+
+        patches.setattr(manim_generator, "_run_manim_cli", fake_render)
+
+        s3_mock.start()
+        get_s3_client.cache_clear()
+        get_s3_client().create_bucket(Bucket=BENCH_BUCKET)
+
+        repository = repository or InMemoryRepository()
+        _install_repository(patches, repository)
+
+        yield {"server": server, "repository": repository, "article_base_url": f"{server.base_url}/article", "workdir": workdir}
+    finally:
+        patches.undo()
+        try:
+            s3_mock.stop()
+        except RuntimeError:
+            pass  # never started
+        # Drop clients that were built against the fakes
+        for module_name, cached in (("utils.s3_upload", "get_s3_client"), ("ai.prompts", "get_client"), ("x.post", "get_client"), ("x.post", "get_api")):
+            module = sys.modules.get(module_name)
+            if module is not None:
+                getattr(module, cached).cache_clear()
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
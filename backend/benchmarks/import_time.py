@@ -0,0 +1,107 @@
+"""Measure how long importing the API takes and what it pulls in
+
+Runs `python -X importtime -c "import main"` in fresh interpreters and reports
+the median total import time, the slowest modules, and any heavy dependency
+that was imported eagerly (those should only load on first use).
+
+Usage (from the backend directory):
+    python -m benchmarks.import_time --runs 5 --top 15
+    python -m benchmarks.import_time --budget-ms 1000   # exit 1 on regression
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+# Dependencies that must not be imported just by importing the API
+HEAVY_MODULES = (
+    "boto3",
+    "botocore",
+    "fal_client",
+    "markdownify",
+    "openai",
+    "requests",
+    "torch",
+    "tweepy",
+    "generate_integrated_fast",
+)
+
+
+def import_profile(module: str = "main") -> dict:
+    """Import a module in a fresh interpreter under -X importtime
+
+    Returns:
+        Dict mapping each imported module to (self_us, cumulative_us)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        profile[name.strip()] = (int(self_us), int(cumulative_us))
+    return profile
+
+
+def heavy_modules_imported(profile: dict) -> list:
+    """Heavy dependencies (top-level packages) present in an import profile"""
+    return sorted({name.split(".")[0] for name in profile} & set(HEAVY_MODULES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest modules to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if the median import exceeds this")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    profiles = [import_profile(args.module) for _ in range(args.runs)]
+    totals_ms = [p[args.module][1] / 1000 for p in profiles]
+    median_ms = statistics.median(totals_ms)
+    heavy = heavy_modules_imported(profiles[-1])
+
+    # Slowest modules by self time, median across runs
+    names = set.intersection(*(set(p) for p in profiles))
+    slowest = sorted(
+        ((statistics.median(p[name][0] for p in profiles) / 1000, name) for name in names),
+        reverse=True
+    )[:args.top]
+
+    print(f"import {args.module}: median {median_ms:.0f} ms (min {min(totals_ms):.0f}, max {max(totals_ms):.0f}) over {args.runs} runs")
+    print("\nSlowest modules (self time):")
+    for ms, name in slowest:
+        print(f"  {ms:8.1f} ms  {name}")
+    print(f"\nHeavy modules imported eagerly: {', '.join(heavy) or 'none'}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "module": args.module,
+                "runs": args.runs,
+                "median_ms": median_ms,
+                "totals_ms": totals_ms,
+                "heavy_modules": heavy,
+                "slowest": [{"module": name, "self_ms": ms} for ms, name in slowest],
+            }, f, indent=2)
+
+    failed = bool(heavy)
+    if args.budget_ms is not None and median_ms > args.budget_ms:
+        print(f"\nImport time {median_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
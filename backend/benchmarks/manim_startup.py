@@ -0,0 +1,88 @@
+"""Benchmark cold manim CLI renders against warm worker renders
+
+Usage (from the backend directory):
+    python -m benchmarks.manim_startup --runs 5 --workers 1
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from ai.manim_worker import ManimWorkerPool
+
+SCENE_CODE = '''from manim import *
+
+class BenchScene(Scene):
+    def construct(self):
+        circle = Circle(color=BLUE)
+        label = Text("warm start").next_to(circle, DOWN)
+        self.play(Create(circle), FadeIn(label))
+        self.wait(0.5)
+'''
+
+
+def time_cli(scene_file, media_dir, runs):
+    timings = []
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            ["manim", "-ql", "--media_dir", f"{media_dir}/{i}", scene_file, "BenchScene"],
+            capture_output=True,
+            check=True
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def time_warm(scene_file, media_dir, runs, workers):
+    pool = ManimWorkerPool(size=workers, max_jobs=runs + 1)
+    timings = []
+    try:
+        # Let every worker finish importing manim, as they would at app
+        # startup, and render once (idle workers are used in turn)
+        pool.wait_ready()
+        for i in range(workers):
+            pool.render_sync(scene_file, "BenchScene", f"{media_dir}/warmup-{i}")
+        for i in range(runs):
+            start = time.perf_counter()
+            pool.render_sync(scene_file, "BenchScene", f"{media_dir}/{i}")
+            timings.append(time.perf_counter() - start)
+    finally:
+        pool.shutdown()
+    return timings
+
+
+def report(name, timings):
+    print(
+        f"{name:>6}: mean {statistics.mean(timings):.2f}s  "
+        f"median {statistics.median(timings):.2f}s  "
+        f"min {min(timings):.2f}s  max {max(timings):.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold manim CLI vs warm worker render time")
+    parser.add_argument("--runs", type=int, default=5, help="Renders per mode (default: 5)")
+    parser.add_argument("--workers", type=int, default=1, help="Warm pool size (default: 1)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        scene_file = str(Path(tmp) / "bench_scene.py")
+        Path(scene_file).write_text(SCENE_CODE)
+
+        # Every render gets a fresh media dir so manim's partial-movie
+        # cache can't make either mode look faster
+        cold = time_cli(scene_file, str(Path(tmp) / "cold"), args.runs)
+        warm = time_warm(scene_file, str(Path(tmp) / "warm"), args.runs, args.workers)
+
+    report("cold", cold)
+    report("warm", warm)
+    print(f"speedup: {statistics.mean(cold) / statistics.mean(warm):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-CREATE TABLE verification_token
+CREATE TABLE IF NOT EXISTS verification_token
 (
   identifier TEXT NOT NULL,
   expires TIMESTAMPTZ NOT NULL,
@@ -7,7 +7,7 @@ CREATE TABLE verification_token
   PRIMARY KEY (identifier, token)
 );
  
-CREATE TABLE accounts
+CREATE TABLE IF NOT EXISTS accounts
 (
   id SERIAL,
   "userId" INTEGER NOT NULL,
@@ -25,7 +25,7 @@ CREATE TABLE accounts
   PRIMARY KEY (id)
 );
  
-CREATE TABLE sessions
+CREATE TABLE IF NOT EXISTS sessions
 (
   id SERIAL,
   "userId" INTEGER NOT NULL,
@@ -35,7 +35,7 @@ CREATE TABLE sessions
   PRIMARY KEY (id)
 );
  
-CREATE TABLE users
+CREATE TABLE IF NOT EXISTS users
 (
   id SERIAL,
   name VARCHAR(255),
@@ -47,26 +47,71 @@ CREATE TABLE users
 );
  
 
-CREATE TABLE articles (
+CREATE TABLE IF NOT EXISTS articles (
   id SERIAL PRIMARY KEY,
   source VARCHAR(200) NOT NULL,
   text TEXT NOT NULL,
   user_id INTEGER,
   date_created TIMESTAMPTZ DEFAULT NOW(),
-  date_written TIMESTAMPTZ
+  date_written TIMESTAMPTZ,
+  run_id VARCHAR(32) UNIQUE  -- generation run that created it (makes resumed runs idempotent)
 );
 
-CREATE TABLE media (
+-- Update mode looks up the latest article of a source
+CREATE INDEX IF NOT EXISTS articles_source_idx ON articles (source, date_created DESC);
+
+CREATE TABLE IF NOT EXISTS media (
   id SERIAL PRIMARY KEY,
   article_id INTEGER NOT NULL REFERENCES articles(id) ON DELETE CASCADE,
   prompt TEXT,
   style TEXT,
   media_type VARCHAR(50) NOT NULL,  -- 'image', 'video', 'comic', etc.
   media_url TEXT NOT NULL, -- s3 or fal link
+  date_created TIMESTAMPTZ DEFAULT NOW(),
+  run_id VARCHAR(32),
+  run_slot INTEGER,  -- position of the media within its run
+  concept TEXT,  -- the article concept the media illustrates
+  persona_id INTEGER,  -- persona in the image, if any
+  superseded_at TIMESTAMPTZ,  -- set when an article update replaced the concept (kept for scheduled posts)
+  UNIQUE (run_id, run_slot)
+);
+
+CREATE TABLE IF NOT EXISTS media_variants (
+  id SERIAL PRIMARY KEY,
+  media_id INTEGER NOT NULL REFERENCES media(id) ON DELETE CASCADE,
+  quality VARCHAR(50) NOT NULL,  -- '480p15', '1080p60', etc.
+  media_url TEXT NOT NULL,
+  date_created TIMESTAMPTZ DEFAULT NOW(),
+  UNIQUE (media_id, quality)
+);
+
+-- S3 objects of deleted media, removed in batches by utils/s3_cleanup.py
+CREATE TABLE IF NOT EXISTS s3_tombstones (
+  id SERIAL PRIMARY KEY,
+  media_url TEXT NOT NULL UNIQUE,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  last_error TEXT,
+  next_attempt_at TIMESTAMPTZ DEFAULT NOW(),
+  purging_at TIMESTAMPTZ,  -- claimed by a purge: uploads of the key wait for it
   date_created TIMESTAMPTZ DEFAULT NOW()
 );
 
-CREATE TABLE socials (
+CREATE OR REPLACE FUNCTION tombstone_media_url() RETURNS trigger AS $$
+BEGIN
+  INSERT INTO s3_tombstones (media_url) VALUES (OLD.media_url)
+  ON CONFLICT (media_url) DO NOTHING;
+  RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Row-level triggers also fire for rows removed by ON DELETE CASCADE
+CREATE OR REPLACE TRIGGER media_tombstone AFTER DELETE ON media
+  FOR EACH ROW EXECUTE FUNCTION tombstone_media_url();
+
+CREATE OR REPLACE TRIGGER media_variants_tombstone AFTER DELETE ON media_variants
+  FOR EACH ROW EXECUTE FUNCTION tombstone_media_url();
+
+CREATE TABLE IF NOT EXISTS socials (
   id SERIAL PRIMARY KEY,
   user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
   provider VARCHAR(50) NOT NULL,   -- 'twitter', 'instagram', etc.
@@ -76,20 +121,99 @@ CREATE TABLE socials (
   expires_at TIMESTAMPTZ
 ); 
 
-CREATE TABLE posts (
+CREATE TABLE IF NOT EXISTS posts (
   id SERIAL PRIMARY KEY,
   social_account_id INTEGER NOT NULL REFERENCES socials(id) ON DELETE CASCADE,
   media_id INTEGER NOT NULL REFERENCES media(id) ON DELETE CASCADE,
   caption TEXT,
   scheduled_at TIMESTAMPTZ NOT NULL,
-  posted_at TIMESTAMPTZ
+  posted_at TIMESTAMPTZ,
+  tweet_id VARCHAR(64),
+  attempts INTEGER NOT NULL DEFAULT 0,
+  last_error TEXT,
+  next_attempt_at TIMESTAMPTZ,
+  claimed_until TIMESTAMPTZ,  -- lease held by the posting worker (x/scheduler.py)
+  claimed_by VARCHAR(64)      -- worker holding the lease
 );
 
-CREATE TABLE personas (
+CREATE INDEX IF NOT EXISTS posts_due_idx ON posts (scheduled_at) WHERE posted_at IS NULL;
+
+-- X media ids of uploaded media, reusable until they expire
+CREATE TABLE IF NOT EXISTS x_media_uploads (
+  media_id INTEGER PRIMARY KEY REFERENCES media(id) ON DELETE CASCADE,
+  media_url TEXT,  -- URL the upload was made from; the id is stale once the media row's URL changes
+  x_media_id VARCHAR(64) NOT NULL,
+  expires_at TIMESTAMPTZ NOT NULL,
+  date_created TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS personas (
   id SERIAL PRIMARY KEY,
   name VARCHAR(255) NOT NULL,
   description TEXT,
   image_url TEXT,
   user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
   date_created TIMESTAMPTZ DEFAULT NOW()
-);
\ No newline at end of file
+);
+-- Asynchronous /generate and /manim runs (see ai/jobs.py)
+CREATE TABLE IF NOT EXISTS jobs (
+  id VARCHAR(32) PRIMARY KEY,
+  kind VARCHAR(32) NOT NULL,       -- 'generate', 'manim'
+  user_id INTEGER,
+  lane VARCHAR(16) NOT NULL DEFAULT 'article',  -- scheduler lane (utils/scheduler.py)
+  fair_start DOUBLE PRECISION NOT NULL DEFAULT 0,  -- fair-share tags within the lane (see db.create_job)
+  fair_tag DOUBLE PRECISION NOT NULL DEFAULT 0,
+  params JSONB NOT NULL,
+  status VARCHAR(16) NOT NULL DEFAULT 'queued',  -- queued, running, succeeded, failed
+  progress JSONB,
+  result JSONB,
+  error TEXT,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  worker_id VARCHAR(64),
+  claimed_until TIMESTAMPTZ,       -- lease held by the worker running the job
+  created_at TIMESTAMPTZ DEFAULT NOW(),
+  started_at TIMESTAMPTZ,
+  finished_at TIMESTAMPTZ,
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS jobs_queued_idx ON jobs (created_at) WHERE status IN ('queued', 'running');
+
+-- Completed stages of in-progress generation runs, so a retry resumes (see utils/checkpoints.py)
+CREATE TABLE IF NOT EXISTS run_checkpoints (
+  run_key VARCHAR(64) NOT NULL,
+  stage TEXT NOT NULL,  -- fan-out stages are prefixed with the (free text) style
+  data JSONB NOT NULL,
+  date_created TIMESTAMPTZ DEFAULT NOW(),
+  PRIMARY KEY (run_key, stage)
+);
+
+CREATE INDEX IF NOT EXISTS run_checkpoints_date_idx ON run_checkpoints (date_created);
+
+-- Upgrading an existing database: the statements above skip tables that
+-- already exist, so columns added since they were created are added here
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS run_id VARCHAR(32);
+CREATE UNIQUE INDEX IF NOT EXISTS articles_run_id_key ON articles (run_id);
+
+ALTER TABLE media ADD COLUMN IF NOT EXISTS run_id VARCHAR(32);
+ALTER TABLE media ADD COLUMN IF NOT EXISTS run_slot INTEGER;
+ALTER TABLE media ADD COLUMN IF NOT EXISTS concept TEXT;
+ALTER TABLE media ADD COLUMN IF NOT EXISTS persona_id INTEGER;
+ALTER TABLE media ADD COLUMN IF NOT EXISTS superseded_at TIMESTAMPTZ;
+CREATE UNIQUE INDEX IF NOT EXISTS media_run_id_run_slot_key ON media (run_id, run_slot);
+
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS tweet_id VARCHAR(64);
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS last_error TEXT;
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMPTZ;
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS claimed_until TIMESTAMPTZ;
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(64);
+
+ALTER TABLE x_media_uploads ADD COLUMN IF NOT EXISTS media_url TEXT;
+
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS lane VARCHAR(16) NOT NULL DEFAULT 'article';
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS fair_start DOUBLE PRECISION NOT NULL DEFAULT 0;
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS fair_tag DOUBLE PRECISION NOT NULL DEFAULT 0;
+
+ALTER TABLE run_checkpoints ALTER COLUMN stage TYPE TEXT;
+ALTER TABLE s3_tombstones ADD COLUMN IF NOT EXISTS purging_at TIMESTAMPTZ;
@@ -1,8 +1,12 @@
+import json
 import os
 import asyncpg
 from dotenv import load_dotenv
 from datetime import datetime
 
+from utils.metrics import span
+from utils.scheduler import ARTICLE_LANE, LANES
+
 load_dotenv()
 
 class Database:
@@ -24,16 +28,23 @@ class Database:
         self._pool = await asyncpg.create_pool(database_url)
     
     async def execute(self, query, *args):
-        async with self._pool.acquire() as connection:
+        async with span("db"), self._pool.acquire() as connection:
             return await connection.execute(query, *args)
     
     async def fetch(self, query, *args):
-        async with self._pool.acquire() as connection:
+        async with span("db"), self._pool.acquire() as connection:
             return await connection.fetch(query, *args)
     
     async def fetchrow(self, query, *args):
-        async with self._pool.acquire() as connection:
+        async with span("db"), self._pool.acquire() as connection:
             return await connection.fetchrow(query, *args)
+    
+    async def fetch_locked(self, lock_key, query, *args):
+        """fetch() in a transaction holding advisory lock lock_key, so only one
+        connection at a time runs it"""
+        async with span("db"), self._pool.acquire() as connection, connection.transaction():
+            await connection.execute("SELECT pg_advisory_xact_lock($1)", lock_key)
+            return await connection.fetch(query, *args)
             
     async def close(self):
         if self._pool:
@@ -41,7 +52,7 @@ class Database:
             self._pool = None
 
 # Media table operations
-async def store_media(article_id, prompt, style, media_type, media_url):
+async def store_media(article_id, prompt, style, media_type, media_url, run_id=None, run_slot=None, concept=None, persona_id=None):
     """Store media information in the database
     
     Args:
@@ -50,17 +61,61 @@ async def store_media(article_id, prompt, style, media_type, media_url):
         style: Style of the media (e.g., 'meme', 'comic', etc.)
         media_type: Type of media (e.g., 'image', 'video', etc.)
         media_url: URL where the media is stored
+        run_id: Generation run storing the media; with run_slot, storing the
+            same slot of a run again returns the existing row
+        run_slot: Position of the media within the run
+        concept: The article concept the media illustrates
+        persona_id: The persona in the media, if any
         
     Returns:
-        The newly created media row
+        The media row (id, media_url, and whether it was inserted)
+    """
+    db = await Database.get_instance()
+    query = """
+        INSERT INTO media (article_id, prompt, style, media_type, media_url, run_id, run_slot, concept, persona_id)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+        ON CONFLICT (run_id, run_slot) DO UPDATE SET run_id = EXCLUDED.run_id
+        RETURNING id, media_url, (xmax = 0) AS inserted
+    """
+    return await db.fetchrow(query, article_id, prompt, style, media_type, media_url, run_id, run_slot, concept, persona_id)
+
+async def update_media_url(media_id, media_url):
+    """Point an existing media row at a new URL
+    
+    Args:
+        media_id: ID of the media to update
+        media_url: New URL of the media
+    """
+    db = await Database.get_instance()
+    query = "UPDATE media SET media_url = $2 WHERE id = $1 RETURNING id"
+    return await db.fetchrow(query, media_id, media_url)
+
+async def store_media_variant(media_id, quality, media_url):
+    """Store (or replace) one quality variant of a media entry
+    
+    Args:
+        media_id: ID of the media the variant belongs to
+        quality: Variant label (e.g. '480p15', '1080p60')
+        media_url: URL where the variant is stored
     """
     db = await Database.get_instance()
     query = """
-        INSERT INTO media (article_id, prompt, style, media_type, media_url)
-        VALUES ($1, $2, $3, $4, $5)
+        INSERT INTO media_variants (media_id, quality, media_url)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (media_id, quality) DO UPDATE SET media_url = EXCLUDED.media_url
         RETURNING id
     """
-    return await db.fetchrow(query, article_id, prompt, style, media_type, media_url)
+    return await db.fetchrow(query, media_id, quality, media_url)
+
+async def get_media_variants(media_id):
+    """Get all quality variants of a media entry
+    
+    Args:
+        media_id: ID of the media
+    """
+    db = await Database.get_instance()
+    query = "SELECT quality, media_url, date_created FROM media_variants WHERE media_id = $1 ORDER BY id"
+    return await db.fetch(query, media_id)
 
 async def get_media_by_id(media_id):
     """Get media by ID
@@ -73,7 +128,9 @@ async def get_media_by_id(media_id):
     return await db.fetchrow(query, media_id)
 
 async def get_media_urls_by_article(article_id, media_type='image'):
-    """Get all media URLs for a specific article and media type
+    """Get the media URLs for a specific article and media type
+    
+    Media superseded by an article update are left out.
     
     Args:
         article_id: ID of the article
@@ -85,7 +142,7 @@ async def get_media_urls_by_article(article_id, media_type='image'):
     db = await Database.get_instance()
     query = """
         SELECT media_url FROM media 
-        WHERE article_id = $1 AND media_type = $2
+        WHERE article_id = $1 AND media_type = $2 AND superseded_at IS NULL
         ORDER BY id
     """
     rows = await db.fetch(query, article_id, media_type)
@@ -101,21 +158,66 @@ async def delete_media(media_id):
     query = "DELETE FROM media WHERE id = $1 RETURNING id"
     return await db.fetchrow(query, media_id)
 
+async def get_x_media_upload(media_id, media_url):
+    """Get the cached X media id of a media entry, if it hasn't expired
+    
+    Args:
+        media_id: ID of the media
+        media_url: The media's current URL; an upload of the content at an
+            earlier URL (before mirroring or an HD upgrade) doesn't count
+    """
+    db = await Database.get_instance()
+    query = "SELECT x_media_id FROM x_media_uploads WHERE media_id = $1 AND media_url = $2 AND expires_at > NOW()"
+    row = await db.fetchrow(query, media_id, media_url)
+    return row['x_media_id'] if row else None
+
+async def store_x_media_upload(media_id, media_url, x_media_id, expires_at):
+    """Cache the X media id of an uploaded media entry
+    
+    Args:
+        media_id: ID of the media
+        media_url: URL the uploaded content was downloaded from
+        x_media_id: Media id returned by the X upload
+        expires_at: When X stops accepting the media id
+    """
+    db = await Database.get_instance()
+    query = """
+        INSERT INTO x_media_uploads (media_id, media_url, x_media_id, expires_at)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (media_id) DO UPDATE
+        SET media_url = EXCLUDED.media_url, x_media_id = EXCLUDED.x_media_id,
+            expires_at = EXCLUDED.expires_at, date_created = NOW()
+    """
+    return await db.execute(query, media_id, media_url, x_media_id, expires_at)
+
 async def get_persona_by_id(persona_id):
     db = await Database.get_instance()
     query = "SELECT * FROM personas where id = $1"
     return await db.fetchrow(query, persona_id)
 
 async def get_media_by_article(article_id):
-    """Get all media associated with an article
+    """Get the current media of an article (not superseded by an update)
     
     Args:
         article_id: ID of the article
     """
     db = await Database.get_instance()
-    query = "SELECT * FROM media WHERE article_id = $1 ORDER BY date_created DESC"
+    query = "SELECT * FROM media WHERE article_id = $1 AND superseded_at IS NULL ORDER BY date_created DESC"
     return await db.fetch(query, article_id)
 
+async def supersede_media(media_ids):
+    """Mark media whose concept an article update replaced
+    
+    The rows are kept (posts may still reference them) but no longer count
+    as the article's media.
+    
+    Args:
+        media_ids: IDs of the media
+    """
+    db = await Database.get_instance()
+    query = "UPDATE media SET superseded_at = NOW() WHERE id = ANY($1::int[]) AND superseded_at IS NULL"
+    return await db.execute(query, list(media_ids))
+
 async def get_media_with_article_info(limit=50):
     """Get all media entries with article information
     
@@ -170,21 +272,46 @@ async def get_recent_articles(limit=10):
     query = "SELECT * FROM articles ORDER BY date_created DESC LIMIT $1"
     return await db.fetch(query, limit)
 
-async def create_article(source, text, user_id=None):
+async def create_article(source, text, user_id=None, run_id=None):
     """Create a new article
     
     Args:
         source: Source of the article (URL or other identifier)
         text: Text content of the article
         user_id: ID of the user who created the article
+        run_id: Generation run creating the article; creating it again for
+            the same run returns the existing row
     """
     db = await Database.get_instance()
     query = """
-        INSERT INTO articles (source, text, user_id)
-        VALUES ($1, $2, $3)
+        INSERT INTO articles (source, text, user_id, run_id)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (run_id) DO UPDATE SET text = EXCLUDED.text
         RETURNING id
     """
-    return await db.fetchrow(query, source, text, user_id)
+    return await db.fetchrow(query, source, text, user_id, run_id)
+
+async def get_latest_article_by_source(source, user_id=None):
+    """Get the most recent article created from a source
+    
+    Args:
+        source: Source of the article (URL or other identifier)
+        user_id: Only consider this user's articles (default: anyone's)
+    """
+    db = await Database.get_instance()
+    query = """
+        SELECT * FROM articles
+        WHERE source = $1 AND ($2::integer IS NULL OR user_id = $2)
+        ORDER BY date_created DESC
+        LIMIT 1
+    """
+    return await db.fetchrow(query, source, user_id)
+
+async def update_article_text(article_id, text):
+    """Replace the text (concepts) of an article"""
+    db = await Database.get_instance()
+    query = "UPDATE articles SET text = $2 WHERE id = $1 RETURNING id"
+    return await db.fetchrow(query, article_id, text)
 
 async def delete_article(article_id):
     """Delete an article and all associated media
@@ -195,4 +322,402 @@ async def delete_article(article_id):
     db = await Database.get_instance()
     # The ON DELETE CASCADE in the schema will handle deleting associated media
     query = "DELETE FROM articles WHERE id = $1 RETURNING id"
-    return await db.fetchrow(query, article_id)
\ No newline at end of file
+    return await db.fetchrow(query, article_id)
+
+# S3 tombstone operations
+async def add_tombstones(media_urls):
+    """Queue URLs whose S3 objects should be deleted
+    
+    Args:
+        media_urls: List of media URLs
+    """
+    db = await Database.get_instance()
+    query = """
+        INSERT INTO s3_tombstones (media_url)
+        SELECT unnest($1::text[])
+        ON CONFLICT (media_url) DO NOTHING
+    """
+    return await db.execute(query, list(media_urls))
+
+async def claim_due_tombstones(limit=1000, max_attempts=10, grace_seconds=300):
+    """Claim tombstones that are due for (another) deletion attempt
+    
+    Claimed tombstones are marked as being purged, so an upload of the same
+    content-addressed key waits for the purge instead of reusing the object
+    (see release_tombstone). A claim left by a crashed purge expires after
+    ten minutes.
+    
+    Args:
+        limit: Maximum number of tombstones to claim
+        max_attempts: Tombstones that failed this often are left for inspection
+        grace_seconds: Tombstones younger than this are left alone, so an
+            upload that reused the object just before it was tombstoned has
+            time to store its media row
+    """
+    db = await Database.get_instance()
+    query = """
+        UPDATE s3_tombstones SET purging_at = NOW()
+        WHERE id IN (
+            SELECT id FROM s3_tombstones
+            WHERE next_attempt_at <= NOW() AND attempts < $2
+              AND date_created <= NOW() - make_interval(secs => $3)
+              AND (purging_at IS NULL OR purging_at < NOW() - INTERVAL '10 minutes')
+            ORDER BY id
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, media_url, attempts
+    """
+    return await db.fetch(query, limit, max_attempts, float(grace_seconds))
+
+async def release_tombstone(media_url):
+    """Drop a pending tombstone because its object is wanted again
+    
+    Returns:
+        True if the object is being purged right now (its tombstone is
+        claimed), in which case it must not be reused
+    """
+    db = await Database.get_instance()
+    released = await db.fetchrow(
+        "DELETE FROM s3_tombstones WHERE media_url = $1 AND purging_at IS NULL RETURNING id", media_url
+    )
+    if released is not None:
+        return False
+    # Checked after the delete (with a fresh snapshot), so a purge that
+    # claimed the tombstone first is always seen
+    query = """
+        SELECT EXISTS (
+            SELECT 1 FROM s3_tombstones
+            WHERE media_url = $1 AND purging_at >= NOW() - INTERVAL '10 minutes'
+        ) AS purging
+    """
+    return (await db.fetchrow(query, media_url))["purging"]
+
+async def get_referenced_media_urls(media_urls):
+    """Get which of the given URLs are still used by a media row or variant
+    
+    Args:
+        media_urls: List of media URLs to check
+        
+    Returns:
+        Set of the URLs that are still referenced
+    """
+    db = await Database.get_instance()
+    query = """
+        SELECT media_url FROM media WHERE media_url = ANY($1::text[])
+        UNION
+        SELECT media_url FROM media_variants WHERE media_url = ANY($1::text[])
+    """
+    rows = await db.fetch(query, list(media_urls))
+    return {row['media_url'] for row in rows}
+
+async def delete_tombstones(tombstone_ids):
+    """Remove tombstones whose objects are gone (or must be kept)"""
+    db = await Database.get_instance()
+    query = "DELETE FROM s3_tombstones WHERE id = ANY($1::int[])"
+    return await db.execute(query, list(tombstone_ids))
+
+async def retry_tombstones(tombstone_ids, error):
+    """Record a failed deletion and back off exponentially (capped at a day)"""
+    db = await Database.get_instance()
+    query = """
+        UPDATE s3_tombstones
+        SET attempts = attempts + 1,
+            last_error = $2,
+            next_attempt_at = NOW() + LEAST(INTERVAL '1 minute' * POWER(2, attempts), INTERVAL '1 day'),
+            purging_at = NULL
+        WHERE id = ANY($1::int[])
+    """
+    return await db.execute(query, list(tombstone_ids), error)
+
+
+# Scheduled post operations
+async def create_post(social_account_id, media_id, caption, scheduled_at):
+    """Schedule a post
+    
+    Args:
+        social_account_id: ID of the social account to post from
+        media_id: ID of the media to post
+        caption: Post text
+        scheduled_at: When the post should go out
+    """
+    db = await Database.get_instance()
+    query = """
+        INSERT INTO posts (social_account_id, media_id, caption, scheduled_at)
+        VALUES ($1, $2, $3, $4)
+        RETURNING id
+    """
+    return await db.fetchrow(query, social_account_id, media_id, caption, scheduled_at)
+
+async def get_social_account(user_id, provider='twitter'):
+    """Get a user's social account for a provider"""
+    db = await Database.get_instance()
+    query = "SELECT * FROM socials WHERE user_id = $1 AND provider = $2 ORDER BY id LIMIT 1"
+    return await db.fetchrow(query, user_id, provider)
+
+# Advisory lock serializing post claims, so the per-account limit holds across workers
+POSTS_CLAIM_LOCK = 7301
+
+async def claim_due_posts(limit, lease_seconds, max_attempts, worker_id, posts_per_window, window_seconds):
+    """Claim a batch of due posts for this worker
+    
+    A claimed row is leased for lease_seconds to worker_id so other workers
+    leave it alone while it is being posted; the worker renews the lease
+    while it posts (renew_post_lease). If the worker dies the lease expires
+    and the post is picked up again.
+    
+    An account is only given as many posts as it has left in its rate
+    window: posts made in the last window_seconds and posts currently
+    claimed both count against posts_per_window. Claims run one at a time
+    under an advisory lock, so two workers cannot both see the same room.
+    
+    Args:
+        limit: Maximum number of posts to claim
+        lease_seconds: How long the claim is held
+        max_attempts: Posts that failed this often are no longer retried
+        worker_id: ID of the claiming worker
+        posts_per_window: Posts an account may make per window
+        window_seconds: Length of the rate window
+    """
+    db = await Database.get_instance()
+    query = """
+        UPDATE posts SET claimed_until = NOW() + make_interval(secs => $2), claimed_by = $4
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT p.id, p.scheduled_at,
+                       ROW_NUMBER() OVER (PARTITION BY p.social_account_id ORDER BY p.scheduled_at, p.id) AS position,
+                       (SELECT COUNT(*) FROM posts used
+                        WHERE used.social_account_id = p.social_account_id
+                          AND (used.posted_at > NOW() - make_interval(secs => $6)
+                               OR (used.posted_at IS NULL AND used.claimed_until >= NOW()))) AS used
+                FROM posts p
+                WHERE p.posted_at IS NULL
+                  AND p.scheduled_at <= NOW()
+                  AND (p.next_attempt_at IS NULL OR p.next_attempt_at <= NOW())
+                  AND (p.claimed_until IS NULL OR p.claimed_until < NOW())
+                  AND p.attempts < $3
+            ) due
+            WHERE used + position <= $5
+            ORDER BY scheduled_at
+            LIMIT $1
+        )
+        RETURNING id, social_account_id, media_id, caption, attempts
+    """
+    return await db.fetch_locked(
+        POSTS_CLAIM_LOCK, query, limit, float(lease_seconds), max_attempts, worker_id,
+        posts_per_window, float(window_seconds),
+    )
+
+async def renew_post_lease(post_id, worker_id, lease_seconds):
+    """Extend a post's lease while its worker is still posting it
+    
+    Returns:
+        False if the lease was lost (it expired and another worker claimed the post)
+    """
+    db = await Database.get_instance()
+    query = """
+        UPDATE posts SET claimed_until = NOW() + make_interval(secs => $3)
+        WHERE id = $1 AND claimed_by = $2 AND posted_at IS NULL
+        RETURNING id
+    """
+    return await db.fetchrow(query, post_id, worker_id, float(lease_seconds)) is not None
+
+async def mark_post_posted(post_id, tweet_id, worker_id):
+    """Record a successful post and release its claim
+    
+    Returns:
+        False if worker_id no longer holds the post's lease
+    """
+    db = await Database.get_instance()
+    query = """
+        UPDATE posts SET posted_at = NOW(), tweet_id = $2, claimed_until = NULL, claimed_by = NULL, last_error = NULL
+        WHERE id = $1 AND claimed_by = $3
+        RETURNING id
+    """
+    return await db.fetchrow(query, post_id, tweet_id, worker_id) is not None
+
+async def mark_post_failed(post_id, worker_id, error, retry_in_seconds):
+    """Record a failed attempt and schedule the retry
+    
+    Returns:
+        False if worker_id no longer holds the post's lease
+    """
+    db = await Database.get_instance()
+    query = """
+        UPDATE posts
+        SET attempts = attempts + 1,
+            last_error = $3,
+            next_attempt_at = NOW() + make_interval(secs => $4),
+            claimed_until = NULL,
+            claimed_by = NULL
+        WHERE id = $1 AND claimed_by = $2
+        RETURNING id
+    """
+    return await db.fetchrow(query, post_id, worker_id, error, float(retry_in_seconds)) is not None
+
+
+# Job operations
+JOB_JSON_FIELDS = ("params", "progress", "result")
+
+def _job_dict(row):
+    """Job row as a dict with its JSONB columns decoded"""
+    if row is None:
+        return None
+    job = dict(row)
+    for field in JOB_JSON_FIELDS:
+        if isinstance(job.get(field), str):
+            job[field] = json.loads(job[field])
+    return job
+
+async def create_job(job_id, kind, params, user_id=None, lane=ARTICLE_LANE, cost=1.0):
+    """Queue a job
+    
+    The job gets a start-time fair queueing tag within its lane, like
+    utils.scheduler.FairQueue: its user's latest pending tag (or the lane's
+    virtual time, the start of the jobs running now, if later) plus cost.
+    claim_job serves the lowest tag first, so a user queueing a batch
+    queues behind itself rather than ahead of everyone.
+    
+    Args:
+        job_id: Unique ID of the job
+        kind: Job kind (e.g. 'generate', 'manim')
+        params: JSON-serializable job parameters
+        user_id: ID of the user who submitted the job
+        lane: Scheduler lane of the job (see utils.scheduler)
+        cost: Tag increment (1 / the user's weight)
+    """
+    db = await Database.get_instance()
+    query = """
+        WITH pending AS (
+            SELECT
+                COALESCE(MAX(fair_start) FILTER (WHERE status = 'running'), MIN(fair_start), 0) AS virtual_time,
+                COALESCE(MAX(fair_tag) FILTER (WHERE user_id IS NOT DISTINCT FROM $3), 0) AS user_tag
+            FROM jobs
+            WHERE lane = $5 AND status IN ('queued', 'running')
+        )
+        INSERT INTO jobs (id, kind, user_id, params, lane, fair_start, fair_tag)
+        SELECT $1, $2, $3, $4::jsonb, $5,
+               GREATEST(virtual_time, user_tag), GREATEST(virtual_time, user_tag) + $6
+        FROM pending
+        RETURNING *
+    """
+    return _job_dict(await db.fetchrow(query, job_id, kind, user_id, json.dumps(params), lane, float(cost)))
+
+async def get_job(job_id):
+    """Get a job by ID"""
+    db = await Database.get_instance()
+    return _job_dict(await db.fetchrow("SELECT * FROM jobs WHERE id = $1", job_id))
+
+async def claim_job(kinds, worker_id, lease_seconds, max_attempts):
+    """Claim the next runnable job of the given kinds
+    
+    Queued jobs and running jobs whose lease expired (their worker died)
+    are runnable. Lanes are strict priorities; within a lane jobs go in
+    fair-share order (lowest fair_tag, see create_job), oldest first on a
+    tie. SKIP LOCKED keeps concurrent workers from claiming the same job.
+    
+    Returns:
+        The claimed job, or None
+    """
+    db = await Database.get_instance()
+    query = """
+        UPDATE jobs
+        SET status = 'running',
+            attempts = attempts + 1,
+            worker_id = $2,
+            claimed_until = NOW() + make_interval(secs => $3),
+            started_at = COALESCE(started_at, NOW()),
+            updated_at = NOW()
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE kind = ANY($1::text[])
+              AND attempts < $4
+              AND (status = 'queued' OR (status = 'running' AND claimed_until < NOW()))
+            ORDER BY array_position($5::text[], lane::text), fair_tag, created_at
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+    """
+    return _job_dict(await db.fetchrow(query, list(kinds), worker_id, float(lease_seconds), max_attempts, list(LANES)))
+
+async def renew_job_lease(job_id, worker_id, lease_seconds):
+    """Extend a running job's lease; returns False if the job is no longer ours"""
+    db = await Database.get_instance()
+    query = """
+        UPDATE jobs SET claimed_until = NOW() + make_interval(secs => $3)
+        WHERE id = $1 AND worker_id = $2 AND status = 'running'
+        RETURNING id
+    """
+    return await db.fetchrow(query, job_id, worker_id, float(lease_seconds)) is not None
+
+async def update_job_progress(job_id, progress):
+    """Store a running job's stage-level progress"""
+    db = await Database.get_instance()
+    query = "UPDATE jobs SET progress = $2::jsonb, updated_at = NOW() WHERE id = $1"
+    return await db.execute(query, job_id, json.dumps(progress))
+
+async def finish_job(job_id, status, result=None, error=None, progress=None):
+    """Record a job's outcome and release its lease"""
+    db = await Database.get_instance()
+    query = """
+        UPDATE jobs
+        SET status = $2, result = $3::jsonb, error = $4,
+            progress = COALESCE($5::jsonb, progress),
+            claimed_until = NULL, finished_at = NOW(), updated_at = NOW()
+        WHERE id = $1
+    """
+    return await db.execute(
+        query, job_id, status,
+        json.dumps(result, default=str) if result is not None else None,
+        error,
+        json.dumps(progress) if progress is not None else None
+    )
+
+async def fail_abandoned_jobs(max_attempts):
+    """Fail jobs whose worker died on their last allowed attempt"""
+    db = await Database.get_instance()
+    query = """
+        UPDATE jobs
+        SET status = 'failed', error = 'Worker lost while running the job',
+            claimed_until = NULL, finished_at = NOW(), updated_at = NOW()
+        WHERE status = 'running' AND claimed_until < NOW() AND attempts >= $1
+    """
+    return await db.execute(query, max_attempts)
+
+
+# Run checkpoint operations
+async def get_checkpoints(run_key, max_age_seconds):
+    """Get the saved stages of a run that are younger than max_age_seconds
+    
+    Returns:
+        Dict of stage name to its saved data
+    """
+    db = await Database.get_instance()
+    query = """
+        SELECT stage, data FROM run_checkpoints
+        WHERE run_key = $1 AND date_created > NOW() - make_interval(secs => $2)
+    """
+    rows = await db.fetch(query, run_key, float(max_age_seconds))
+    return {row["stage"]: json.loads(row["data"]) for row in rows}
+
+async def save_checkpoint(run_key, stage, data):
+    """Save (or replace) the result of one stage of a run"""
+    db = await Database.get_instance()
+    query = """
+        INSERT INTO run_checkpoints (run_key, stage, data)
+        VALUES ($1, $2, $3::jsonb)
+        ON CONFLICT (run_key, stage) DO UPDATE SET data = EXCLUDED.data, date_created = NOW()
+    """
+    return await db.execute(query, run_key, stage, json.dumps(data, default=str))
+
+async def delete_checkpoints(run_key):
+    """Drop every checkpoint of a run (once it has completed)"""
+    db = await Database.get_instance()
+    return await db.execute("DELETE FROM run_checkpoints WHERE run_key = $1", run_key)
+
+async def delete_stale_checkpoints(max_age_seconds):
+    """Drop checkpoints of runs that were never retried"""
+    db = await Database.get_instance()
+    query = "DELETE FROM run_checkpoints WHERE date_created < NOW() - make_interval(secs => $1)"
+    return await db.execute(query, float(max_age_seconds))
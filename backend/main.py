@@ -1,38 +1,48 @@
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
-from ai.nemotron_fal import process_article_and_generate_media, generate_image
-from ai.nemotron_manim_generator import process_article_and_generate_media as process_article_and_generate_manim
-from db.db import get_media_by_id, store_media, get_media_urls_by_article
+from ai.nemotron_fal import process_article_and_generate_media, update_article_media, generate_image
+from ai.nemotron_manim_generator import (
+    process_article_and_generate_media as process_article_and_generate_manim,
+    upgrade_manim_render,
+    RENDER_POOL,
+    QUALITY_DIRS,
+    PREVIEW_QUALITY,
+    HD_QUALITY,
+)
+from ai.fanout import MANIM_STYLE, process_article_and_generate_styles
+from ai.wan_video import WAN_INSTALLED
+from ai.wan_model import WanModelManager, WanSubmoduleBackend
+from ai.wan_jobs import WanJobQueue
+from ai.jobs import FINISHED_STATUSES, JobWorkerPool, job_view
+from db.db import create_post, get_job, get_media_by_id, get_social_account
 from x.post import post_media_to_twitter
-from utils.s3_upload import upload_to_s3
-import os
-import subprocess
-import requests
-import shutil
-from pathlib import Path
+from x.scheduler import POSTING_WORKER
+from utils.admission import GENERATE_GATE, GENERATE_STYLES_GATE, IMAGE_GATE, MANIM_GATE, Overloaded
+from utils.downloads import close_http_client
+from utils.metrics import render_metrics, request_timings
+from utils.progress import emit_progress
+from utils.scheduler import ARTICLE_LANE, INTERACTIVE_LANE, VIDEO_LANE, work_context
+from utils.s3_cleanup import S3_JANITOR
+from utils.singleflight import SingleFlight, normalize_url
+import asyncio
 from datetime import datetime
-import sys
+import json
+import os
 
 load_dotenv()
 
-# Add Wan-2-1 to Python path for dynamic import
-wan_path = str(Path(__file__).parent.parent / "submodules" / "Wan-2-1")
-if wan_path not in sys.path:
-    sys.path.insert(0, wan_path)
-
-# Import Wan fast generator (dynamic import from submodule)
-try:
-    from generate_integrated_fast import get_generator  # type: ignore[import-not-found]
-    WAN_AVAILABLE = True
-    WAN_GENERATOR = None  # Will be lazily initialized
-except ImportError as e:
-    print(f"Warning: Wan generator not available: {e}")
-    WAN_AVAILABLE = False
-    WAN_GENERATOR = None
-    get_generator = None  # type: ignore[assignment]
+# Wan models: WAN_RESIDENCY is resident, offload or unload (after WAN_IDLE_SECONDS)
+WAN_MODEL = WanModelManager(
+    WanSubmoduleBackend(),
+    residency=os.getenv("WAN_RESIDENCY", "resident"),
+    idle_seconds=float(os.getenv("WAN_IDLE_SECONDS", "600"))
+) if WAN_INSTALLED else None
+WAN_PRELOAD = os.getenv("WAN_PRELOAD", "0") == "1"
+WAN_QUEUE = WanJobQueue(WAN_MODEL) if WAN_MODEL is not None else None
 
 app = FastAPI()
 
@@ -43,158 +53,136 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(Overloaded)
+async def overloaded(request, exc: Overloaded):
+    """Requests refused by admission control: 429 or 503 with a Retry-After estimate"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"success": False, "error": str(exc), "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.on_event("startup")
+async def start_workers():
+    """Start the background workers that live alongside the API"""
+    # Spawn the warm manim workers so the first render doesn't pay the import
+    if RENDER_POOL is not None:
+        RENDER_POOL.start()
+    if WAN_MODEL is not None:
+        WAN_MODEL.start()
+        if WAN_PRELOAD:
+            # Load in the background; /ready reports when the models are in
+            asyncio.create_task(WAN_MODEL.preload())
+    if WAN_QUEUE is not None:
+        WAN_QUEUE.start()
+    # Deleted media leave tombstones; their S3 objects are removed in batches
+    S3_JANITOR.start()
+    # Scheduled posts; extra workers can run separately with python -m x.scheduler
+    if os.getenv("RUN_POSTING_WORKER", "1") == "1":
+        POSTING_WORKER.start()
+    # Queued /jobs runs; extra workers can run separately with python main.py worker
+    if os.getenv("RUN_JOB_WORKERS", "1") == "1":
+        JOB_POOL.start()
+
+
+@app.on_event("shutdown")
+async def stop_workers():
+    if RENDER_POOL is not None:
+        RENDER_POOL.shutdown()
+    if WAN_QUEUE is not None:
+        await WAN_QUEUE.stop()
+    if WAN_MODEL is not None:
+        await WAN_MODEL.stop()
+    await S3_JANITOR.stop()
+    await POSTING_WORKER.stop()
+    await JOB_POOL.stop()
+    await close_http_client()
+
+
+@app.get("/health")
+async def health():
+    """Liveness check with the Wan model load state"""
+    return {
+        "status": "ok",
+        "wan": WAN_MODEL.status() if WAN_MODEL is not None else {"state": "unavailable", "ready": False}
+    }
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness check: not ready until preloaded Wan models are in memory"""
+    wan_ready = WAN_MODEL is None or not WAN_PRELOAD or WAN_MODEL.ready
+    body = {
+        "ready": wan_ready,
+        "wan": WAN_MODEL.status() if WAN_MODEL is not None else {"state": "unavailable", "ready": False}
+    }
+    return JSONResponse(status_code=200 if wan_ready else 503, content=body)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Per-stage latency histograms, in-flight gauges and error counters (Prometheus format)"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 class GenerateRequest(BaseModel):
     user_id: int| None = None
     link: str | None = None
     style: str
     persona_id: int | None = None
+    include_timings: bool = False  # add a per-stage timing breakdown to the response
+    stream: str | None = None  # "ndjson" or "sse": stream progress events as they happen
+    wait_for_video: bool = False  # when streaming, keep the stream open until the Wan video finishes
+    update: bool = False  # re-process the link's latest article, regenerating only new or changed concepts
+
+
+class GenerateStylesRequest(BaseModel):
+    user_id: int | None = None
+    link: str
+    styles: list[str]  # e.g. ["meme", "comic", "manim"]
+    persona_ids: list[int] | None = None  # generate each image style once per persona
+    include_timings: bool = False
 
 
 class PostToXRequest(BaseModel):
     user_id: int
     media_id: int
     text: str = ""
+    scheduled_at: datetime | None = None
 
 
 class GenerateImageRequest(BaseModel):
     prompt: str
+    user_id: int | None = None
 
 
-async def download_image(url: str, output_path: str) -> str:
-    """Download image from URL to local path"""
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    
-    with open(output_path, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
-    
-    return output_path
+# Identical /generate requests (same user, normalized link, style and
+# persona) share one pipeline run; GENERATE_REUSE_SECONDS also hands a successful
+# response to identical requests arriving shortly after it completed
+GENERATE_FLIGHTS = SingleFlight(
+    "generate",
+    reuse_seconds=float(os.getenv("GENERATE_REUSE_SECONDS", "0")),
+    reuse_if=lambda response: response.get("success")
+)
 
 
-async def generate_wan_video_from_images(article_id: int, user_id: int = 1):
-    """Generate Wan video from article images using in-memory model"""
-    global WAN_GENERATOR
-    
-    try:
-        if not WAN_AVAILABLE:
-            print("Wan generator not available, skipping")
-            return None
-        # Get all image URLs from the article
-        print(f"\n=== Fetching images for article {article_id} ===")
-        image_urls = await get_media_urls_by_article(article_id, media_type='image')
-        
-        if not image_urls:
-            print("No images found, skipping Wan video generation")
-            return None
-        
-        print(f"Found {len(image_urls)} images for Wan video generation")
-        
-        # Create directory for this run with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        wan_dir_base = Path(__file__).parent.parent / "submodules" / "Wan-2-1"
-        run_dir = wan_dir_base / "wan_generated" / f"run_{timestamp}"
-        run_dir.mkdir(parents=True, exist_ok=True)
-        
-        print(f"Created run directory: {run_dir}")
-        
-        # Download all images locally
-        local_image_paths = []
-        for i, url in enumerate(image_urls):
-            output_path = run_dir / f"ref_image_{i}.png"
-            await download_image(url, str(output_path))
-            local_image_paths.append(str(output_path))
-        
-        # Join paths with comma for Wan input
-        # src_ref_images = ",".join(local_image_paths)
-        src_ref_images = local_image_paths[0]
-        
-        # Generate prompt for video
-        prompt = "create a coherent video animation using the reference images with smooth transitions and engaging movement"
-        
-        print(f"\n=== Generating Wan video ===")
-        print(f"Reference images: {src_ref_images}")
-        
-        # Lazy load the generator (models loaded once, kept in memory)
-        if WAN_GENERATOR is None:
-            ckpt_dir = os.getenv("WAN_CKPT_DIR", "/home/ubuntu/karthik-ragunath-ananda-kumar-utah/unianimate-dit/Wan2.1-VACE-1.3B")
-            print("🔄 Loading Wan models (first run - this will take a while)...")
-            WAN_GENERATOR = get_generator(
-                task="vace-1.3B",
-                ckpt_dir=ckpt_dir,
-                device_id=0
-            )
-            print("✓ Models loaded and cached in memory!")
-        else:
-            print("⚡ Using cached Wan models (FAST!)")
-        
-        # Define output video path in run_dir
-        output_video_filename = f"wan_video_{timestamp}.mp4"
-        output_video_path = run_dir / output_video_filename
-        
-        # Generate video using in-memory model (FAST!)
-        print("Generating video with cached models...")
-        output_file = WAN_GENERATOR.generate(
-            prompt=prompt,
-            src_ref_images=src_ref_images,
-            save_file=str(output_video_path),
-            size="832*480",
-            frame_num=41,
-            sample_steps=25,
-            sample_shift=16.0,
-            sample_solver='unipc',
-            guide_scale=5.0,
-            base_seed=-1,
-            offload_model=True
-        )
-        
-        # Check if video was generated
-        if not output_video_path.exists():
-            print(f"Video not found at expected path: {output_video_path}")
-            return None
-        
-        print(f"\n=== Video generated at: {output_video_path} ===")
-        
-        # Upload to S3
-        print("\n=== Uploading Wan video to S3 ===")
-        try:
-            s3_url = upload_to_s3(str(output_video_path), s3_folder="wan_videos")
-            print(f"Video uploaded to S3: {s3_url}")
-            media_url = s3_url
-        except Exception as e:
-            print(f"Failed to upload to S3: {e}")
-            media_url = str(output_video_path)
-        
-        # Store the media in the database
-        media_row = await store_media(
-            article_id=article_id,
-            prompt=prompt[:500],
-            style="wan_video",
-            media_type="video",
-            media_url=media_url
-        )
-        
-        print(f"\n=== Wan video stored in database with ID {media_row['id']} ===")
-        print(f"All files saved in: {run_dir}")
-        
-        return {
-            "media_id": media_row["id"],
-            "video_url": media_url,
-            "prompt": prompt,
-            "num_reference_images": len(image_urls)
-        }
-        
-    except Exception as e:
-        print(f"Error generating Wan video: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+def generate_key(req: GenerateRequest) -> tuple:
+    # Runs store the article and media under the requesting user
+    return (req.user_id or 1, normalize_url(req.link), req.style, req.persona_id, req.update)
 
 
-@app.post("/generate")
-async def generate_media(req: GenerateRequest):
-    """FastAPI endpoint to trigger media generation"""
-    result = await process_article_and_generate_media(
+async def run_generate(req: GenerateRequest) -> dict:
+    """Run the image pipeline for a request, or join an identical one in flight"""
+    return dict(await GENERATE_FLIGHTS.do(generate_key(req), generate_response, req))
+
+
+async def generate_response(req: GenerateRequest) -> dict:
+    """Run the image pipeline for a request and build the /generate response"""
+    # Update mode keeps the images of concepts that survived an edit
+    pipeline = update_article_media if req.update else process_article_and_generate_media
+    result = await pipeline(
         article_url=req.link,
         user_id=req.user_id if req.user_id else 1,
         style= req.style,
@@ -204,20 +192,22 @@ async def generate_media(req: GenerateRequest):
     if not result:
         return {"success": False, "error": "Failed to generate media"}
 
-    # After images are generated, automatically generate Wan video
-    wan_result = None
-    try:
-        print("\n=== Starting Wan video generation from generated images ===")
-        wan_result = await generate_wan_video_from_images(
+    # Queue the Wan video for the generated images; it is rendered on the
+    # GPU worker and can be polled at /wan_jobs/{job_id}
+    wan_job = None
+    update = result.get("update")
+    if update and not update["regenerated"] and not update.get("superseded_media_ids"):
+        print("No concept changed, skipping the Wan video")
+        emit_progress("video", status="unchanged")
+    elif WAN_QUEUE is not None:
+        wan_job = WAN_QUEUE.submit(
             article_id=result["article_id"],
             user_id=req.user_id if req.user_id else 1
         )
-        if wan_result:
-            print(f"Wan video generated successfully: {wan_result['video_url']}")
-    except Exception as e:
-        print(f"Wan video generation failed (non-fatal): {e}")
-        import traceback
-        traceback.print_exc()
+        emit_progress("video", status=wan_job["status"], job_id=wan_job["job_id"])
+    else:
+        print("Wan generator not available, skipping")
+        emit_progress("video", status="unavailable")
 
     # Format the response to include all generated media
     response = {
@@ -233,20 +223,27 @@ async def generate_media(req: GenerateRequest):
         ]
     }
     
-    # Add Wan video if generated
-    if wan_result:
-        response["wan_video"] = {
-            "media_id": wan_result["media_id"],
-            "video_url": wan_result["video_url"],
-            "num_reference_images": wan_result["num_reference_images"]
+    if update:
+        response["update"] = update
+    
+    # Add Wan video job if queued
+    if wan_job:
+        response["wan_job"] = {
+            "job_id": wan_job["job_id"],
+            "status": wan_job["status"]
         }
     
     return response
 
 
-@app.post("/manim")
-async def generate_manim_video(req: GenerateRequest):
-    """FastAPI endpoint to trigger Manim video generation"""
+async def run_manim(req: GenerateRequest, schedule_upgrade) -> dict:
+    """Run the Manim pipeline for a request and build the /manim response
+    
+    Args:
+        req: The generation request
+        schedule_upgrade: Called with (coroutine function, *args) to run the
+            high quality render in the background
+    """
     result = await process_article_and_generate_manim(
         article_url=req.link,
         user_id=req.user_id if req.user_id else 1,
@@ -257,16 +254,266 @@ async def generate_manim_video(req: GenerateRequest):
     if not result:
         return {"success": False, "error": "Failed to generate Manim video"}
 
+    schedule_upgrade(upgrade_manim_render, result["media_id"], result["scene_code"])
+
     # Format the response
     return {
         "success": True,
         "article_id": result["article_id"],
         "media_id": result["media_id"],
         "video_path": result["video_path"],
-        "concept": result["concept"]
+        "concept": result["concept"],
+        "variants": {
+            QUALITY_DIRS[PREVIEW_QUALITY]: result["video_path"],
+            QUALITY_DIRS[HD_QUALITY]: None  # pending background render
+        }
+    }
+
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def encode_event(event: dict, stream: str) -> str:
+    if stream == "sse":
+        data = {key: value for key, value in event.items() if key != "event"}
+        return f"event: {event['event']}\ndata: {json.dumps(data, default=str)}\n\n"
+    return json.dumps(event, default=str) + "\n"
+
+
+async def generate_events(req: GenerateRequest):
+    """Progress events of a /generate run as they happen, ending with `done`
+    (the usual response) or `error`
+    
+    Events: concepts, prompt (per concept), image (per stored image, with
+    its media_id and URL), video (Wan job queued, and finished when
+    wait_for_video is set). A request that joins an identical run in flight
+    gets that run's earlier events replayed first.
+    """
+    try:
+        async with GENERATE_GATE.admit():
+            with request_timings() as timings, work_context(req.user_id or 1, ARTICLE_LANE):
+                flight = GENERATE_FLIGHTS.join(generate_key(req), generate_response, req)
+            try:
+                async for event in flight.feed.subscribe():
+                    yield encode_event(event, req.stream)
+            except BaseException:
+                # The client went away: leave the run to the other requests sharing it
+                flight.leave()
+                raise
+            try:
+                response = dict(await flight.wait())
+            except Exception as e:
+                yield encode_event({"event": "error", "success": False, "error": str(e)}, req.stream)
+                return
+    except Overloaded as e:
+        # Filled up between the check in generate_media and the stream starting
+        yield encode_event({"event": "error", "success": False, "error": str(e), "retry_after": e.retry_after}, req.stream)
+        return
+    wan_job = response.get("wan_job")
+    if req.wait_for_video and wan_job:
+        job = await WAN_QUEUE.wait(wan_job["job_id"])
+        if job is not None:
+            response["wan_job"] = {"job_id": job["job_id"], "status": job["status"]}
+            yield encode_event({"event": "video", **job}, req.stream)
+    if req.include_timings:
+        response["timings"] = timings.as_dict()
+    yield encode_event({"event": "done" if response["success"] else "error", **response}, req.stream)
+
+
+@app.post("/generate")
+async def generate_media(req: GenerateRequest):
+    """FastAPI endpoint to trigger media generation
+    
+    With `stream` set to "ndjson" or "sse", progress events are streamed as
+    they happen instead (see generate_events).
+    
+    Admission is bounded (utils/admission.py): when the service is saturated
+    the request is refused at once with 429 or 503 and a Retry-After header.
+    """
+    if req.stream is not None:
+        if req.stream not in STREAM_MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail=f"stream must be one of: {', '.join(STREAM_MEDIA_TYPES)}")
+        # Refuse before the 200 is sent; the stream takes its slot itself
+        GENERATE_GATE.check()
+        return StreamingResponse(
+            generate_events(req),
+            media_type=STREAM_MEDIA_TYPES[req.stream],
+            headers={"Cache-Control": "no-cache"}
+        )
+    async with GENERATE_GATE.admit():
+        with request_timings() as timings, work_context(req.user_id or 1, ARTICLE_LANE):
+            response = await run_generate(req)
+    if req.include_timings:
+        response["timings"] = timings.as_dict()
+    return response
+
+
+async def run_generate_styles(req: GenerateStylesRequest, schedule_upgrade) -> dict:
+    """Run the fan-out pipeline for a request and build the /generate_styles response"""
+    result = await process_article_and_generate_styles(
+        article_url=req.link,
+        styles=req.styles,
+        persona_ids=req.persona_ids,
+        user_id=req.user_id if req.user_id else 1
+    )
+
+    if not result:
+        return {"success": False, "error": "Failed to extract concepts"}
+
+    variants = []
+    for variant in result["variants"]:
+        entry = {"style": variant["style"], "persona_id": variant["persona_id"], "success": variant["success"]}
+        if not variant["success"]:
+            entry["error"] = variant.get("error", "Failed to generate media")
+        elif variant["style"] == MANIM_STYLE:
+            schedule_upgrade(upgrade_manim_render, variant["media_id"], variant["scene_code"])
+            entry.update(
+                media_id=variant["media_id"],
+                video_path=variant["video_path"],
+                variants={
+                    QUALITY_DIRS[PREVIEW_QUALITY]: variant["video_path"],
+                    QUALITY_DIRS[HD_QUALITY]: None  # pending background render
+                }
+            )
+        else:
+            entry["media_entries"] = [
+                {
+                    "media_id": media["media_id"],
+                    "media_url": media["media_url"],
+                    "concept": media["concept"]
+                } for media in variant["media_entries"]
+            ]
+        variants.append(entry)
+
+    return {
+        "success": any(variant["success"] for variant in variants),
+        "article_id": result["article_id"],
+        "concepts": result["concepts"],
+        "variants": variants
     }
 
 
+@app.post("/generate_styles")
+async def generate_styles(req: GenerateStylesRequest, background_tasks: BackgroundTasks):
+    """Generate several styles (and personas) of one article in one call
+    
+    The article is scraped and decomposed once and all variants share one
+    article row; each variant's prompts, images or Manim render then run in
+    parallel within the global service limits.
+    """
+    if not req.styles:
+        raise HTTPException(status_code=400, detail="styles must not be empty")
+    async with GENERATE_STYLES_GATE.admit():
+        with request_timings() as timings, work_context(req.user_id or 1, ARTICLE_LANE):
+            response = await run_generate_styles(req, background_tasks.add_task)
+    if req.include_timings:
+        response["timings"] = timings.as_dict()
+    return response
+
+
+@app.get("/wan_jobs/{job_id}")
+async def get_wan_job(job_id: str):
+    """Get the status (and result once finished) of a Wan video job"""
+    job = WAN_QUEUE.get(job_id) if WAN_QUEUE is not None else None
+    if not job:
+        raise HTTPException(status_code=404, detail="Wan job not found")
+    return {"success": True, "job": job}
+
+
+@app.post("/manim")
+async def generate_manim_video(req: GenerateRequest, background_tasks: BackgroundTasks):
+    """FastAPI endpoint to trigger Manim video generation
+    
+    Returns the 480p preview as soon as it is rendered; the high quality
+    render of the same scene runs in the background and replaces the media
+    URL when it is done (see /media/{media_id}/variants).
+    """
+    async with MANIM_GATE.admit():
+        with request_timings() as timings, work_context(req.user_id or 1, VIDEO_LANE):
+            response = await run_manim(req, background_tasks.add_task)
+    if req.include_timings:
+        response["timings"] = timings.as_dict()
+    return response
+
+
+# Background tasks started by jobs (kept referenced until they finish)
+JOB_BACKGROUND_TASKS = set()
+
+
+def spawn_background(fn, *args):
+    task = asyncio.create_task(fn(*args))
+    JOB_BACKGROUND_TASKS.add(task)
+    task.add_done_callback(JOB_BACKGROUND_TASKS.discard)
+
+
+async def generate_job(params: dict) -> dict:
+    with work_context(params.get("user_id") or 1, ARTICLE_LANE):
+        response = await run_generate(GenerateRequest(**params))
+    if not response["success"]:
+        raise RuntimeError(response["error"])
+    return response
+
+
+async def manim_job(params: dict) -> dict:
+    with work_context(params.get("user_id") or 1, VIDEO_LANE):
+        response = await run_manim(GenerateRequest(**params), spawn_background)
+    if not response["success"]:
+        raise RuntimeError(response["error"])
+    return response
+
+
+JOB_POOL = JobWorkerPool(
+    {"generate": generate_job, "manim": manim_job},
+    lanes={"generate": ARTICLE_LANE, "manim": VIDEO_LANE},
+    concurrency=int(os.getenv("JOB_WORKERS", "2")),
+    lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "120")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+)
+
+
+@app.post("/jobs/{kind}", status_code=202)
+async def submit_job(kind: str, req: GenerateRequest):
+    """Queue a /generate or /manim run and return its job id at once
+    
+    Poll GET /jobs/{job_id} or stream GET /jobs/{job_id}/events for
+    stage-level progress and the result (same shape as the synchronous
+    endpoint's response).
+    """
+    if kind not in JOB_POOL.handlers:
+        raise HTTPException(status_code=404, detail=f"Unknown job kind: {kind}")
+    params = req.model_dump(exclude={"include_timings", "stream", "wait_for_video"})
+    job = await JOB_POOL.submit(kind, params, user_id=req.user_id)
+    return {"success": True, "job_id": job["id"], "status": job["status"]}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_endpoint(job_id: str):
+    """Get the status, stage-level progress and (once finished) result of a job"""
+    job = await get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, "job": job_view(job)}
+
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-sent events for a job: a `progress` event on every change and a
+    final `done` event when it finishes"""
+    if not await get_job(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        async for job in JOB_POOL.watch(job_id):
+            if job is None:
+                yield ": keep-alive\n\n"
+                continue
+            view = job_view(job)
+            event = "done" if view["status"] in FINISHED_STATUSES else "progress"
+            yield f"event: {event}\ndata: {json.dumps(view, default=str)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 @app.get("/media")
 async def get_all_media(limit: int = 50, search: str|None = None):
     """Get all media entries from the database
@@ -288,6 +535,25 @@ async def get_all_media(limit: int = 50, search: str|None = None):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/media/{media_id}/variants")
+async def get_media_variants_endpoint(media_id: int):
+    """Get every rendered quality of a media entry
+    
+    Args:
+        media_id: ID of the media
+    """
+    from db.db import get_media_variants
+    media = await get_media_by_id(media_id)
+    if not media:
+        raise HTTPException(status_code=404, detail="Media not found")
+    variants = await get_media_variants(media_id)
+    return {
+        "success": True,
+        "media_id": media_id,
+        "media_url": media["media_url"],
+        "variants": {row["quality"]: row["media_url"] for row in variants}
+    }
+
 @app.delete("/media/{media_id}")
 async def delete_media_endpoint(media_id: int):
     """Delete a media entry
@@ -333,8 +599,16 @@ async def post_to_x(req: PostToXRequest):
 
     media_url = media["media_url"]
 
+    if req.scheduled_at is not None:
+        # Leave it to the posting worker
+        account = await get_social_account(req.user_id, "twitter")
+        if not account:
+            raise HTTPException(status_code=400, detail="No X account linked for this user")
+        post = await create_post(account["id"], req.media_id, req.text, req.scheduled_at)
+        return {"success": True, "scheduled": True, "post_id": post["id"], "scheduled_at": req.scheduled_at}
+
     try:
-        result = await post_media_to_twitter(media_url, req.text)
+        result = await post_media_to_twitter(media_url, req.text, media_row_id=req.media_id)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -342,30 +616,46 @@ async def post_to_x(req: PostToXRequest):
 
 @app.post("/generate_image")
 async def generate_image_endpoint(req: GenerateImageRequest):
-    """Generate an image from a text prompt"""
-    try:
-        result = await generate_image(req.prompt)
+    """Generate an image from a text prompt
+    
+    Interactive: its fal call is scheduled ahead of article and video work.
+    """
+    async with IMAGE_GATE.admit():
+        try:
+            with work_context(req.user_id or 1, INTERACTIVE_LANE):
+                result = await generate_image(req.prompt)
 
-        if not result or "images" not in result:
-            raise HTTPException(status_code=500, detail="Failed to generate image")
+            if not result or "images" not in result:
+                raise HTTPException(status_code=500, detail="Failed to generate image")
 
-        image_url = result["images"][0]["url"]
+            image_url = result["images"][0]["url"]
 
-        return {
-            "success": True,
-            "image_url": image_url,
-            "metadata": result["images"][0]
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            return {
+                "success": True,
+                "image_url": image_url,
+                "metadata": result["images"][0]
+            }
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True
-    )
+async def run_job_worker():
+    """Run only the job workers (no HTTP server)"""
+    try:
+        await JOB_POOL.run_forever()
+    finally:
+        await close_http_client()
+
 
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] == ["worker"]:
+        asyncio.run(run_job_worker())
+    else:
+        import uvicorn
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True
+        )
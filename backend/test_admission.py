@@ -0,0 +1,87 @@
+import asyncio
+
+import httpx
+import pytest
+
+from utils.admission import AdmissionGate, Overloaded
+
+
+@pytest.mark.asyncio
+async def test_gate_queues_then_refuses_with_retry_after():
+    gate = AdmissionGate("test", max_running=1, max_queued=1, expected_seconds=10)
+    release = asyncio.Event()
+    order = []
+
+    async def request(name):
+        async with gate.admit():
+            order.append(name)
+            await release.wait()
+
+    first = asyncio.create_task(request("first"))
+    await asyncio.sleep(0)
+    queued = asyncio.create_task(request("queued"))
+    await asyncio.sleep(0)
+    assert (gate.running, gate.queued) == (1, 1)
+
+    with pytest.raises(Overloaded) as refused:
+        await gate.acquire()
+    assert refused.value.status_code == 429
+    # The queued request and the caller, one at a time, 10s each
+    assert refused.value.retry_after == 20
+
+    release.set()
+    await asyncio.gather(first, queued)
+    assert order == ["first", "queued"]
+    assert (gate.running, gate.queued) == (0, 0)
+    # Both ran for ~0s, pulling the latency estimate down
+    assert gate.latency < 10
+
+
+@pytest.mark.asyncio
+async def test_global_gate_and_queue_timeout_refuse_with_503():
+    parent = AdmissionGate("global-test", max_running=1)
+    gate = AdmissionGate("test", max_running=1, max_queued=5, queue_timeout=0.01, parent=parent)
+    other = AdmissionGate("other", max_running=5, parent=parent)
+
+    async with gate.admit():
+        # The service as a whole is full, whichever endpoint is asked
+        with pytest.raises(Overloaded) as refused:
+            await other.acquire()
+        assert refused.value.status_code == 503
+        with pytest.raises(Overloaded):
+            other.check()
+    assert parent.running == 0
+
+    parent.max_running = 5
+    async with gate.admit():
+        with pytest.raises(Overloaded) as refused:
+            await gate.acquire()
+        assert refused.value.status_code == 503
+    assert (gate.running, gate.queued, parent.running) == (0, 0, 0)
+
+
+@pytest.mark.asyncio
+async def test_saturated_endpoint_answers_429_with_retry_after(monkeypatch):
+    import main
+
+    release = asyncio.Event()
+
+    async def slow_image(prompt):
+        await release.wait()
+        return {"images": [{"url": "https://example.com/image.png"}]}
+
+    monkeypatch.setattr(main, "generate_image", slow_image)
+    monkeypatch.setattr(main, "IMAGE_GATE", AdmissionGate("generate_image-test", max_running=1, expected_seconds=5))
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        running = asyncio.create_task(client.post("/generate_image", json={"prompt": "a comet"}))
+        while main.IMAGE_GATE.running == 0:
+            await asyncio.sleep(0.001)
+        refused = await client.post("/generate_image", json={"prompt": "a comet"})
+        release.set()
+        assert (await running).status_code == 200
+
+    assert refused.status_code == 429
+    assert refused.headers["Retry-After"] == "5"
+    assert refused.json()["retry_after"] == 5
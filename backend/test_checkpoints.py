@@ -0,0 +1,92 @@
+import sys
+
+import pytest
+
+from benchmarks.fakes import offline_services
+from utils.checkpoints import run_key_for
+
+
+def failing_fal(fal_module, failures):
+    """Make the first `failures` fal submissions raise"""
+    submit_async = fal_module.submit_async
+    calls = {"n": 0}
+
+    async def flaky_submit_async(application, arguments):
+        calls["n"] += 1
+        if calls["n"] <= failures:
+            raise RuntimeError("fal unavailable")
+        return await submit_async(application, arguments)
+
+    fal_module.submit_async = flaky_submit_async
+
+
+def test_run_key_is_stable_for_the_same_inputs():
+    assert run_key_for("generate", "https://a.b/x ", "meme", 1) == run_key_for("generate", "https://a.b/x", "meme", 1)
+    assert run_key_for("generate", "https://a.b/x", "meme", 1) != run_key_for("generate", "https://a.b/x", "comic", 1)
+
+
+@pytest.mark.asyncio
+async def test_failed_generation_resumes_without_duplicating_media():
+    with offline_services(llm_latency=0, fal_latency=0, render_latency=0) as services:
+        from ai.nemotron_fal import process_article_and_generate_media
+        from utils.mirror import MEDIA_MIRROR
+
+        repository = services["repository"]
+        server = services["server"]
+        url = f"{services['article_base_url']}/1"
+
+        # Every image of the first attempt fails after the LLM work is done
+        failing_fal(sys.modules["fal_client"], failures=3)
+        assert await process_article_and_generate_media(article_url=url, style="meme") is None
+        llm_calls = server.requests["chat"]
+        assert llm_calls > 0
+        assert not repository.media
+        assert repository.checkpoints
+
+        result = await process_article_and_generate_media(article_url=url, style="meme")
+        await MEDIA_MIRROR.join()
+        assert server.requests["chat"] == llm_calls
+        assert len(result["media_entries"]) == 3
+        assert len(repository.media) == 3
+        assert len(repository.articles) == 1
+        assert not repository.checkpoints
+
+        # A completed run starts fresh
+        await process_article_and_generate_media(article_url=url, style="meme")
+        await MEDIA_MIRROR.join()
+        assert server.requests["chat"] > llm_calls
+        assert len(repository.articles) == 2
+
+
+@pytest.mark.asyncio
+async def test_resumed_run_reuses_its_stored_rows():
+    with offline_services(llm_latency=0, fal_latency=0, render_latency=0) as services:
+        import ai.nemotron_fal as nemotron_fal
+        from utils.mirror import MEDIA_MIRROR
+
+        repository = services["repository"]
+        url = f"{services['article_base_url']}/2"
+
+        # The second image's row fails to store, so the run is left open
+        store_media = repository.store_media
+        calls = {"n": 0}
+
+        async def flaky_store_media(*args, **kwargs):
+            calls["n"] += 1
+            if calls["n"] == 2:
+                raise RuntimeError("connection reset")
+            return await store_media(*args, **kwargs)
+
+        nemotron_fal.store_media = flaky_store_media
+        try:
+            first = await nemotron_fal.process_article_and_generate_media(article_url=url, style="meme")
+        finally:
+            nemotron_fal.store_media = store_media
+        assert len(first["media_entries"]) == 2
+
+        second = await nemotron_fal.process_article_and_generate_media(article_url=url, style="meme")
+        await MEDIA_MIRROR.join()
+        assert len(second["media_entries"]) == 3
+        assert len(repository.media) == 3
+        assert len(repository.articles) == 1
+        assert {m["media_id"] for m in first["media_entries"]} <= {m["media_id"] for m in second["media_entries"]}
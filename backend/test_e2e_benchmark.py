@@ -0,0 +1,26 @@
+import pytest
+
+from benchmarks.e2e import percentile, run_benchmark
+
+
+def test_percentile_interpolates():
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile([5], 99) == 5
+    assert percentile([], 95) == 0.0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("endpoint", ["generate", "generate-stream", "manim", "media"])
+async def test_offline_benchmark_runs_every_endpoint(endpoint):
+    result = await run_benchmark(
+        endpoint=endpoint,
+        requests=2,
+        concurrency=2,
+        seed_articles=1 if endpoint == "media" else 0,
+        llm_latency=0,
+        fal_latency=0,
+        render_latency=0,
+    )
+    assert result["failed"] == 0, result["errors"]
+    assert result["succeeded"] == 2
+    assert result["latency_seconds"]["p99"] >= result["latency_seconds"]["p50"]
@@ -0,0 +1,94 @@
+import asyncio
+
+import httpx
+import pytest
+
+from ai.fanout import fan_out_variants
+from benchmarks.fakes import offline_services
+from utils.limits import ConcurrencyLimit
+
+
+def test_fan_out_variants_cross_image_styles_with_personas():
+    assert fan_out_variants(["meme", "manim", "meme"]) == [("meme", None), ("manim", None)]
+    assert fan_out_variants(["meme", "manim"], [1, 2]) == [("meme", 1), ("meme", 2), ("manim", None)]
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_caps_parallel_calls():
+    limit = ConcurrencyLimit("test", 2)
+    running = []
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with limit:
+            running.append(1)
+            peak = max(peak, len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+    await asyncio.gather(*(call() for _ in range(6)))
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_styles_share_one_scrape_and_article():
+    with offline_services(llm_latency=0, fal_latency=0.02, render_latency=0) as services:
+        import main
+        from utils.downloads import close_http_client
+        from utils.mirror import MEDIA_MIRROR
+
+        repository = services["repository"]
+        server = services["server"]
+        body = {"link": f"{services['article_base_url']}/5", "styles": ["meme", "comic", "manim"], "persona_ids": [1]}
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            try:
+                response = (await client.post("/generate_styles", json=body)).json()
+                await MEDIA_MIRROR.join()
+                assert (await client.post("/generate_styles", json=dict(body, styles=[]))).status_code == 400
+            finally:
+                await close_http_client()
+
+        assert response["success"]
+        assert [(v["style"], v["success"]) for v in response["variants"]] == [("meme", True), ("comic", True), ("manim", True)]
+        assert server.requests["article"] == 1
+        # One decomposition, a prompt per concept and image style, one scene
+        assert server.requests["chat"] == 1 + 3 * 2 + 1
+        assert len(repository.articles) == 1
+        assert {m["article_id"] for m in repository.media.values()} == {response["article_id"]}
+        assert sorted(m["style"] for m in repository.media.values()) == ["comic"] * 3 + ["manim"] + ["meme"] * 3
+        assert not repository.checkpoints
+
+
+@pytest.mark.asyncio
+async def test_long_style_names_fan_out_with_a_persona():
+    with offline_services(llm_latency=0, fal_latency=0, render_latency=0) as services:
+        import main
+        import utils.checkpoints as checkpoints
+        from utils.downloads import close_http_client
+        from utils.mirror import MEDIA_MIRROR
+
+        style = "watercolor illustration"
+        saved_stages = []
+        save_checkpoint = checkpoints.save_checkpoint
+
+        async def record_stage(run_key, stage, data):
+            saved_stages.append(stage)
+            await save_checkpoint(run_key, stage, data)
+
+        checkpoints.save_checkpoint = record_stage
+        body = {"link": f"{services['article_base_url']}/6", "styles": [style], "persona_ids": [12]}
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            try:
+                response = (await client.post("/generate_styles", json=body)).json()
+                await MEDIA_MIRROR.join()
+            finally:
+                checkpoints.save_checkpoint = save_checkpoint
+                await close_http_client()
+
+        assert response["success"]
+        assert [(v["style"], v["persona_id"], len(v["media_entries"])) for v in response["variants"]] == [(style, 12, 3)]
+        # Stage names longer than the old VARCHAR(32) column
+        assert f"{style}/12/prompts" in saved_stages and len(f"{style}/12/prompts") > 32
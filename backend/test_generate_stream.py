@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from benchmarks.fakes import offline_services
+from utils.metrics import TIME_TO_FIRST_IMAGE
+from utils.progress import ProgressFeed
+
+
+@pytest.mark.asyncio
+async def test_progress_feed_replays_to_late_subscribers():
+    feed = ProgressFeed()
+    feed.emit("concepts", concepts=["a"])
+
+    async def read():
+        return [event["event"] async for event in feed.subscribe()]
+
+    early = asyncio.create_task(read())
+    await asyncio.sleep(0)
+    feed.emit("image", index=0)
+    late = asyncio.create_task(read())
+    await asyncio.sleep(0)
+    feed.close()
+    assert await early == await late == ["concepts", "image"]
+
+
+async def read_ndjson(client, body):
+    async with client.stream("POST", "/generate", json=body) as response:
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        return [json.loads(line) async for line in response.aiter_lines() if line]
+
+
+@pytest.mark.asyncio
+async def test_generate_streams_events_as_they_happen():
+    with offline_services(llm_latency=0.02, fal_latency=0.05, render_latency=0) as services:
+        import main
+        from utils.downloads import close_http_client
+        from utils.mirror import MEDIA_MIRROR
+
+        first_images = TIME_TO_FIRST_IMAGE.count(style="meme")
+        body = {"link": f"{services['article_base_url']}/3", "style": "meme", "stream": "ndjson"}
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            try:
+                # The second request joins the first's run and still sees every event
+                leader, joiner = await asyncio.gather(read_ndjson(client, body), read_ndjson(client, body))
+
+                response = await client.post("/generate", json=dict(body, stream="sse"))
+                assert response.headers["content-type"].startswith("text/event-stream")
+                assert response.text.startswith("event: concepts\ndata: ")
+                await MEDIA_MIRROR.join()
+
+                assert (await client.post("/generate", json=dict(body, stream="xml"))).status_code == 400
+            finally:
+                await close_http_client()
+
+        names = [event["event"] for event in leader]
+        assert names[0] == "concepts"
+        assert names[-1] == "done"
+        assert names.count("prompt") == 3 and names.count("image") == 3
+        assert names.index("prompt") < names.index("image")
+        assert "video" in names
+
+        images = [event for event in leader if event["event"] == "image"]
+        done = leader[-1]
+        assert {image["media_id"] for image in images} == {entry["media_id"] for entry in done["media_entries"]}
+        assert [event["event"] for event in joiner] == names
+        assert done["article_id"] == joiner[-1]["article_id"]
+        assert TIME_TO_FIRST_IMAGE.count(style="meme") == first_images + 2
@@ -0,0 +1,7 @@
+from benchmarks.import_time import heavy_modules_imported, import_profile
+
+
+def test_importing_the_api_defers_heavy_dependencies():
+    profile = import_profile("main")
+    assert "main" in profile
+    assert heavy_modules_imported(profile) == []
@@ -0,0 +1,121 @@
+import asyncio
+import json
+from datetime import timedelta
+
+import httpx
+import pytest
+
+from ai.jobs import JobWorkerPool
+from benchmarks.fakes import offline_services
+from utils.scheduler import VIDEO_LANE
+
+
+async def read_events(client, job_id):
+    events = []
+    async with client.stream("GET", f"/jobs/{job_id}/events") as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+
+@pytest.mark.asyncio
+async def test_generate_job_reports_progress_and_result():
+    with offline_services(llm_latency=0, fal_latency=0.05, render_latency=0) as services:
+        import main
+        from utils.downloads import close_http_client
+        from utils.mirror import MEDIA_MIRROR
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            response = await client.post("/jobs/generate", json={"link": f"{services['article_base_url']}/1", "style": "meme"})
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+
+            main.JOB_POOL.start()
+            try:
+                events = await asyncio.wait_for(read_events(client, job_id), timeout=30)
+            finally:
+                await main.JOB_POOL.stop()
+                await MEDIA_MIRROR.join()
+                await close_http_client()
+
+            assert events[-1][0] == "done"
+            assert all(event == "progress" for event, _ in events[:-1])
+
+            job = (await client.get(f"/jobs/{job_id}")).json()["job"]
+            assert job["status"] == "succeeded"
+            assert job["result"]["media_count"] == 3
+            assert job["progress"]["stages"]["fal"]["count"] == 3
+            assert {"scrape", "decompose", "prompts"} <= set(job["progress"]["stages"])
+
+            assert (await client.post("/jobs/nope", json={"style": "meme"})).status_code == 404
+            assert (await client.get("/jobs/missing")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_job_of_a_lost_worker_is_retried():
+    with offline_services(llm_latency=0, fal_latency=0, render_latency=0) as services:
+        repository = services["repository"]
+        runs = []
+
+        async def handler(params):
+            runs.append(params)
+            return {"ok": True}
+
+        pool = JobWorkerPool({"echo": handler}, concurrency=1, poll_interval=0.05, lease_seconds=30, max_attempts=2)
+        job = await pool.submit("echo", {"n": 1})
+        # Another worker claimed it and died: its lease has run out
+        await repository.claim_job(["echo"], "dead-worker", 30, 2)
+        repository.jobs[job["id"]]["claimed_until"] -= timedelta(seconds=60)
+
+        pool.start()
+        try:
+            for _ in range(100):
+                if repository.jobs[job["id"]]["status"] == "succeeded":
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            await pool.stop()
+
+        assert runs == [{"n": 1}]
+        assert repository.jobs[job["id"]]["attempts"] == 2
+        assert repository.jobs[job["id"]]["result"] == {"ok": True}
+
+
+@pytest.mark.asyncio
+async def test_jobs_are_claimed_by_lane_then_fair_share():
+    with offline_services(llm_latency=0, fal_latency=0, render_latency=0) as services:
+        repository = services["repository"]
+        runs = []
+
+        async def handler(params):
+            runs.append(params["name"])
+            return {"ok": True}
+
+        pool = JobWorkerPool(
+            {"article": handler, "video": handler}, lanes={"video": VIDEO_LANE},
+            concurrency=1, poll_interval=0.05, weights={},
+        )
+        await pool.submit("video", {"name": "video"}, user_id=3)
+        # User 1 queues a batch before user 2 shows up
+        for n in range(3):
+            await pool.submit("article", {"name": f"a{n}"}, user_id=1)
+        for n in range(2):
+            await pool.submit("article", {"name": f"b{n}"}, user_id=2)
+
+        pool.start()
+        try:
+            for _ in range(100):
+                if all(job["status"] == "succeeded" for job in repository.jobs.values()):
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            await pool.stop()
+
+        # Users take turns in the article lane; the video lane waits for it
+        assert runs == ["a0", "b0", "a1", "b1", "a2", "video"]
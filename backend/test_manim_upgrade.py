@@ -0,0 +1,78 @@
+from pathlib import Path
+
+import pytest
+
+import ai.nemotron_manim_generator as manim_generator
+from utils.render_cache import RenderCache
+
+SCENE_CODE = "class Demo(Scene):\n    pass"
+
+
+@pytest.fixture
+def upgrade(tmp_path, monkeypatch):
+    video = tmp_path / "Demo.mp4"
+    video.write_bytes(b"mp4")
+    writes = []
+
+    async def fake_run_manim_scene(scene_filepath, quality="l"):
+        assert Path(scene_filepath).read_text() == SCENE_CODE
+        return str(video)
+
+    async def fake_store_media_variant(media_id, quality, media_url):
+        writes.append(("variant", media_id, quality, media_url))
+
+    async def fake_update_media_url(media_id, media_url):
+        writes.append(("media_url", media_id, media_url))
+
+    monkeypatch.setattr(manim_generator, "BACKEND_DIR", tmp_path)
+    monkeypatch.setattr(manim_generator, "MANIM_CODE_DIR", tmp_path / "manim" / "code")
+    monkeypatch.setattr(manim_generator, "MANIM_VIDEO_DIR", tmp_path / "manim" / "generated_video")
+    monkeypatch.setattr(manim_generator, "RENDER_CACHE", RenderCache(tmp_path / "render_cache.json"))
+    monkeypatch.setattr(manim_generator, "run_manim_scene", fake_run_manim_scene)
+    monkeypatch.setattr(manim_generator, "store_media_variant", fake_store_media_variant)
+    monkeypatch.setattr(manim_generator, "update_media_url", fake_update_media_url)
+    return writes
+
+
+@pytest.mark.asyncio
+async def test_upgrade_swaps_in_the_uploaded_render(upgrade, monkeypatch):
+    async def fake_upload(path, s3_folder):
+        return "https://s3.example.com/manim_videos/hd.mp4"
+
+    monkeypatch.setattr(manim_generator, "upload_to_s3_async", fake_upload)
+
+    assert await manim_generator.upgrade_manim_render(7, SCENE_CODE, quality="h") == "https://s3.example.com/manim_videos/hd.mp4"
+    assert upgrade == [
+        ("variant", 7, "1080p60", "https://s3.example.com/manim_videos/hd.mp4"),
+        ("media_url", 7, "https://s3.example.com/manim_videos/hd.mp4"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_upgrade_survives_gc_of_the_preview_scene(upgrade, monkeypatch):
+    async def fake_upload(path, s3_folder):
+        return "https://s3.example.com/manim_videos/hd.mp4"
+
+    monkeypatch.setattr(manim_generator, "upload_to_s3_async", fake_upload)
+    scene_file = Path(manim_generator.save_manim_code(SCENE_CODE))
+    # Another request's render collects artifacts before the upgrade runs
+    monkeypatch.setattr(manim_generator, "MANIM_ARTIFACT_MAX_AGE_SECONDS", -1)
+    manim_generator.collect_manim_artifacts()
+    assert not scene_file.exists()
+
+    assert await manim_generator.upgrade_manim_render(7, SCENE_CODE, quality="h") == "https://s3.example.com/manim_videos/hd.mp4"
+    assert scene_file.exists()
+
+
+@pytest.mark.asyncio
+async def test_failed_upgrade_upload_keeps_the_preview(upgrade, monkeypatch):
+    async def failing_upload(path, s3_folder):
+        raise ConnectionError("S3 unreachable")
+
+    monkeypatch.setattr(manim_generator, "upload_to_s3_async", failing_upload)
+
+    assert await manim_generator.upgrade_manim_render(7, SCENE_CODE, quality="h") is None
+    # Neither the media row nor a variant points at the server's disk
+    assert upgrade == []
+    scene_file = manim_generator.save_manim_code(SCENE_CODE)
+    assert manim_generator.RENDER_CACHE.get(manim_generator.scene_code_hash(scene_file), "h") is None
@@ -0,0 +1,102 @@
+import pytest
+
+import ai.manim_worker as manim_worker
+from ai.manim_worker import QUALITY_NAMES, ManimRenderError, ManimWorkerPool
+from ai.nemotron_manim_generator import QUALITY_DIRS
+
+
+class StubConnection:
+    def __init__(self, worker):
+        self.worker = worker
+        self.reply = None
+
+    def send(self, job):
+        if job is None:
+            return
+        self.worker.jobs.append(job)
+        if job["scene_name"] == "Crash":
+            self.worker.alive = False
+            raise BrokenPipeError()
+        if job["scene_name"] == "Broken":
+            self.reply = {"ok": False, "error": "ValueError: bad scene", "traceback": "Traceback ..."}
+        else:
+            self.reply = {"ok": True, "video_path": f"{job['media_dir']}/{job['scene_name']}_{job['quality']}.mp4"}
+
+    def poll(self, timeout):
+        return True
+
+    def recv(self):
+        return self.reply
+
+
+class StubProcess:
+    def __init__(self, worker):
+        self.worker = worker
+
+    def is_alive(self):
+        return self.worker.alive
+
+
+class StubWorker:
+    """Stands in for a manim process: answers jobs over a fake pipe"""
+    started = []
+
+    def __init__(self, ctx):
+        self.conn = StubConnection(self)
+        self.process = StubProcess(self)
+        self.jobs = []
+        self.jobs_done = 0
+        self.alive = True
+        self.ready = False
+        self.stopped = False
+        StubWorker.started.append(self)
+
+    def wait_ready(self, timeout):
+        self.ready = True
+
+    def stop(self):
+        self.stopped = True
+
+
+@pytest.fixture
+def stub_workers(monkeypatch):
+    StubWorker.started = []
+    monkeypatch.setattr(manim_worker, "_Worker", StubWorker)
+    return StubWorker.started
+
+
+def test_every_worker_quality_has_an_output_directory():
+    assert set(QUALITY_NAMES) <= set(QUALITY_DIRS)
+
+
+@pytest.mark.asyncio
+async def test_pool_renders_and_recycles_workers(stub_workers):
+    pool = ManimWorkerPool(size=1, max_jobs=2)
+
+    assert await pool.render("scene.py", "Demo", media_dir="/media", quality="p") == "/media/Demo_p.mp4"
+    assert stub_workers[0].jobs[0]["quality"] == "p"
+    await pool.render("scene.py", "Demo", media_dir="/media")
+    # Recycled after max_jobs renders
+    assert stub_workers[0].stopped and len(stub_workers) == 2
+
+    with pytest.raises(ManimRenderError, match="bad scene"):
+        await pool.render("scene.py", "Broken", media_dir="/media")
+    # A failed scene does not cost the worker
+    assert not stub_workers[1].stopped
+
+    with pytest.raises(ManimRenderError, match="died"):
+        await pool.render("scene.py", "Crash", media_dir="/media")
+    assert stub_workers[1].stopped and len(stub_workers) == 3
+
+    pool.shutdown()
+    assert stub_workers[2].stopped
+
+
+def test_pool_waits_for_every_worker(stub_workers):
+    pool = ManimWorkerPool(size=3)
+    pool.wait_ready()
+
+    assert len(stub_workers) == 3 and all(worker.ready for worker in stub_workers)
+    # The workers are still available for renders
+    assert pool.render_sync("scene.py", "Demo", media_dir="/media") == "/media/Demo_l.mp4"
+    pool.shutdown()
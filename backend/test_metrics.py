@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from utils.metrics import STAGE_DURATION, STAGE_ERRORS, STAGE_IN_FLIGHT, render_metrics, request_timings, span
+
+
+@pytest.mark.asyncio
+async def test_span_records_latency_errors_and_request_breakdown():
+    labels = {"stage": "test_fal", "model": "fake-model", "style": "meme"}
+    before = STAGE_DURATION.count(**labels)
+
+    async def fake_fal(fail):
+        async with span("test_fal", model="fake-model", style="meme"):
+            assert STAGE_IN_FLIGHT.value(**labels) >= 1
+            await asyncio.sleep(0.01)
+            if fail:
+                raise RuntimeError("fal is down")
+
+    with request_timings() as timings:
+        # Spans in tasks started inside the block count towards the request
+        results = await asyncio.gather(fake_fal(False), fake_fal(False), fake_fal(True), return_exceptions=True)
+        with span("test_scrape", style="meme"):
+            pass
+
+    assert isinstance(results[2], RuntimeError)
+    assert STAGE_DURATION.count(**labels) == before + 3
+    assert STAGE_IN_FLIGHT.value(**labels) == 0
+    assert STAGE_ERRORS.value(error="RuntimeError", **labels) >= 1
+
+    breakdown = timings.as_dict()
+    assert breakdown["stages"]["test_fal"]["count"] == 3
+    assert breakdown["stages"]["test_fal"]["errors"] == 1
+    assert breakdown["stages"]["test_fal"]["seconds"] >= 0.03
+    assert breakdown["stages"]["test_scrape"]["count"] == 1
+
+    # Spans outside a request are still exported but not attributed to it
+    with span("test_scrape", style="meme"):
+        pass
+    assert timings.as_dict()["stages"]["test_scrape"]["count"] == 1
+
+    text = render_metrics()
+    assert "# TYPE astrosmurf_stage_duration_seconds histogram" in text
+    assert 'astrosmurf_stage_duration_seconds_bucket{stage="test_fal",model="fake-model",style="meme",le="+Inf"}' in text
+    assert 'astrosmurf_stage_errors_total{stage="test_fal",model="fake-model",style="meme",error="RuntimeError"} 1' in text
+
+
+def test_cancelled_span_is_not_an_error():
+    labels = {"stage": "test_cancel", "model": "", "style": ""}
+
+    async def cancelled():
+        task = asyncio.create_task(asyncio.sleep(10))
+
+        async def run():
+            async with span("test_cancel"):
+                await task
+
+        runner = asyncio.create_task(run())
+        await asyncio.sleep(0)
+        runner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await runner
+
+    asyncio.run(cancelled())
+    assert STAGE_DURATION.count(**labels) == 1
+    assert STAGE_IN_FLIGHT.value(**labels) == 0
+    assert STAGE_ERRORS.value(error="CancelledError", **labels) == 0
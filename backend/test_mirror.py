@@ -0,0 +1,110 @@
+import hashlib
+
+import boto3
+import httpx
+import pytest
+from moto import mock_aws
+
+import db.db as db_module
+
+from utils import mirror, s3_upload
+from utils.mirror import MediaMirror
+from utils.s3_upload import MB
+
+SMALL_IMAGE = b"\x89PNG" + b"0" * 4096
+LARGE_VIDEO = bytes(range(256)) * (11 * MB // 256)
+
+
+async def no_tombstone(media_url):
+    return False
+
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    monkeypatch.setenv("sa_aws_bucket", "astrosmurf-test")
+    monkeypatch.setenv("sa_aws_access_key_id", "testing")
+    monkeypatch.setenv("sa_aws_secret_access_key", "testing")
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+    monkeypatch.setattr(db_module, "release_tombstone", no_tombstone)
+    with mock_aws():
+        s3_upload.get_s3_client.cache_clear()
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="astrosmurf-test")
+        yield "astrosmurf-test"
+    s3_upload.get_s3_client.cache_clear()
+
+
+@pytest.fixture
+def fal(monkeypatch):
+    """Source files served over HTTP, and the media URL updates made"""
+    files = {"/image.png": SMALL_IMAGE, "/video.mp4": LARGE_VIDEO}
+    updates = []
+
+    def handler(request):
+        body = files.get(request.url.path)
+        if body is None:
+            return httpx.Response(404)
+        return httpx.Response(200, content=body)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def fake_update_media_url(media_id, media_url):
+        updates.append((media_id, media_url))
+
+    monkeypatch.setattr(mirror, "get_http_client", lambda: client)
+    monkeypatch.setattr(mirror, "update_media_url", fake_update_media_url)
+    yield updates
+
+
+def _object(bucket, url):
+    key = url.split(".amazonaws.com/", 1)[1]
+    return boto3.client("s3", region_name="us-east-1").get_object(Bucket=bucket, Key=key)
+
+
+@pytest.mark.asyncio
+async def test_mirror_copies_media_and_repoints_the_row(s3_bucket, fal):
+    media_mirror = MediaMirror()
+    task = media_mirror.schedule(5, "https://fal.example.com/image.png")
+    await media_mirror.join()
+
+    s3_url = task.result()
+    assert fal == [(5, s3_url)]
+    assert s3_url.endswith(f"fal_images/{hashlib.sha256(SMALL_IMAGE).hexdigest()}.png")
+    assert _object(s3_bucket, s3_url)["Body"].read() == SMALL_IMAGE
+    assert media_mirror.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_source_fetch_keeps_the_original_url(s3_bucket, fal):
+    media_mirror = MediaMirror(attempts=1)
+    task = media_mirror.schedule(5, "https://fal.example.com/expired.png")
+    await media_mirror.join()
+
+    assert task.result() is None
+    assert fal == []
+
+
+@pytest.mark.asyncio
+async def test_large_files_are_mirrored_in_parts(s3_bucket, fal, monkeypatch):
+    monkeypatch.setattr(mirror, "MIRROR_PART_SIZE", 5 * MB)
+
+    s3_url = await mirror.mirror_url_to_s3("https://fal.example.com/video.mp4", s3_folder="fal_videos")
+
+    stored = _object(s3_bucket, s3_url)
+    assert "/fal_videos/url-" in s3_url
+    assert stored["Body"].read() == LARGE_VIDEO
+    # Three parts: 5 MB, 5 MB and the rest
+    assert stored["ETag"].strip('"').endswith("-3")
+
+
+@pytest.mark.asyncio
+async def test_crashed_mirror_tasks_are_reported(s3_bucket, fal, monkeypatch, capsys):
+    async def crash(media_id, url):
+        raise RuntimeError("boom")
+
+    media_mirror = MediaMirror()
+    monkeypatch.setattr(media_mirror, "_mirror", crash)
+    media_mirror.schedule(5, "https://fal.example.com/image.png")
+    await media_mirror.join()
+
+    assert "Mirroring media 5 crashed: RuntimeError('boom')" in capsys.readouterr().out
+    assert media_mirror.pending == 0
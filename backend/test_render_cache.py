@@ -0,0 +1,67 @@
+import os
+import time
+
+from utils.artifacts import gc_directory
+from utils.render_cache import RenderCache
+
+
+def test_render_cache_hits_misses_and_survives_restarts(tmp_path):
+    video = tmp_path / "Scene.mp4"
+    video.write_bytes(b"mp4")
+    cache = RenderCache(tmp_path / "index.json")
+
+    assert cache.get("abc", "l") is None
+    cache.put("abc", "l", video_path=str(video))
+    cache.put("abc", "l", s3_url="https://s3.example.com/scene.mp4")
+
+    # Merged entry, also seen by another process loading the index
+    for reader in (cache, RenderCache(tmp_path / "index.json")):
+        entry = reader.get("abc", "l")
+        assert entry["video_path"] == str(video)
+        assert entry["s3_url"] == "https://s3.example.com/scene.mp4"
+    # Keyed by quality too
+    assert cache.get("abc", "h") is None
+
+
+def test_render_cache_drops_stale_local_paths(tmp_path):
+    video = tmp_path / "Scene.mp4"
+    video.write_bytes(b"mp4")
+    cache = RenderCache(tmp_path / "index.json")
+    cache.put("abc", "l", video_path=str(video), s3_url="https://s3.example.com/scene.mp4")
+    cache.put("local", "l", video_path=str(video))
+
+    video.unlink()
+    # The upload is still usable; an entry with nothing left is a miss
+    assert cache.get("abc", "l")["video_path"] is None
+    assert cache.get("abc", "l")["s3_url"] == "https://s3.example.com/scene.mp4"
+    assert cache.get("local", "l") is None
+
+
+def _write(path, size, age_seconds):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"0" * size)
+    mtime = time.time() - age_seconds
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_gc_directory_removes_old_files_then_oldest_over_budget(tmp_path):
+    expired = _write(tmp_path / "old" / "expired.mp4", 10, age_seconds=7200)
+    oldest = _write(tmp_path / "a.mp4", 100, age_seconds=300)
+    protected = _write(tmp_path / "b.mp4", 100, age_seconds=200)
+    newest = _write(tmp_path / "c.mp4", 100, age_seconds=100)
+
+    stats = gc_directory(tmp_path, max_bytes=150, max_age_seconds=3600, protect=[protected])
+
+    assert not expired.exists() and not (tmp_path / "old").exists()
+    # Over budget: the oldest unprotected files go first
+    assert not oldest.exists() and not newest.exists()
+    assert protected.exists()
+    assert stats == {"removed_files": 3, "freed_bytes": 210}
+
+
+def test_gc_directory_without_limits_keeps_everything(tmp_path):
+    kept = _write(tmp_path / "a.mp4", 100, age_seconds=10**6)
+    assert gc_directory(tmp_path) == {"removed_files": 0, "freed_bytes": 0}
+    assert gc_directory(tmp_path / "missing", max_bytes=0) == {"removed_files": 0, "freed_bytes": 0}
+    assert kept.exists()
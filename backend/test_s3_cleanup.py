@@ -0,0 +1,204 @@
+import asyncio
+from datetime import timedelta
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import db.db as db_module
+
+import ai.nemotron_manim_generator as manim_generator
+from utils import s3_cleanup, s3_upload
+from utils.render_cache import RenderCache
+from utils.s3_upload import get_s3_url
+
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    monkeypatch.setenv("sa_aws_bucket", "astrosmurf-test")
+    monkeypatch.setenv("sa_aws_access_key_id", "testing")
+    monkeypatch.setenv("sa_aws_secret_access_key", "testing")
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+    with mock_aws():
+        s3_upload.get_s3_client.cache_clear()
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="astrosmurf-test")
+        yield "astrosmurf-test"
+    s3_upload.get_s3_client.cache_clear()
+
+
+class FakeTombstones:
+    """In-memory s3_tombstones table and media references"""
+
+    def __init__(self):
+        self.rows = {}
+        self.referenced = set()
+
+    async def add(self, media_urls):
+        for url in media_urls:
+            if url not in {row["media_url"] for row in self.rows.values()}:
+                row_id = len(self.rows) + 1
+                self.rows[row_id] = {"id": row_id, "media_url": url, "attempts": 0, "due": True, "purging": False, "last_error": None}
+
+    async def claim(self, limit=1000, max_attempts=10, grace_seconds=300):
+        # No grace period here: tests add tombstones and purge right away
+        claimed = [row for row in self.rows.values() if row["due"] and not row["purging"] and row["attempts"] < max_attempts][:limit]
+        for row in claimed:
+            row["purging"] = True
+        return [dict(row) for row in claimed]
+
+    async def release(self, media_url):
+        for row_id, row in list(self.rows.items()):
+            if row["media_url"] == media_url:
+                if row["purging"]:
+                    return True
+                del self.rows[row_id]
+        return False
+
+    async def get_referenced(self, media_urls):
+        return {url for url in media_urls if url in self.referenced}
+
+    async def delete(self, ids):
+        for row_id in ids:
+            self.rows.pop(row_id, None)
+
+    async def retry(self, ids, error):
+        for row_id in ids:
+            # Backed off: not due again within this run
+            self.rows[row_id].update(attempts=self.rows[row_id]["attempts"] + 1, due=False, purging=False, last_error=error)
+
+
+@pytest.fixture
+def tombstones(monkeypatch):
+    table = FakeTombstones()
+    monkeypatch.setattr(s3_cleanup, "add_tombstones", table.add)
+    monkeypatch.setattr(s3_cleanup, "claim_due_tombstones", table.claim)
+    monkeypatch.setattr(s3_cleanup, "get_referenced_media_urls", table.get_referenced)
+    monkeypatch.setattr(s3_cleanup, "delete_tombstones", table.delete)
+    monkeypatch.setattr(s3_cleanup, "retry_tombstones", table.retry)
+    monkeypatch.setattr(db_module, "release_tombstone", table.release)
+    return table
+
+
+def _put(bucket, key):
+    boto3.client("s3", region_name="us-east-1").put_object(Bucket=bucket, Key=key, Body=b"data")
+    return get_s3_url(bucket, key)
+
+
+def _keys(bucket):
+    listing = boto3.client("s3", region_name="us-east-1").list_objects_v2(Bucket=bucket)
+    return sorted(obj["Key"] for obj in listing.get("Contents", []))
+
+
+@pytest.mark.asyncio
+async def test_purge_deletes_in_batches_and_keeps_shared_objects(s3_bucket, tombstones, monkeypatch):
+    urls = [_put(s3_bucket, f"fal_images/{i}.png") for i in range(5)]
+    tombstones.referenced = {urls[4]}
+    await tombstones.add(urls + ["https://fal.media/outside.png"])
+    client = s3_upload.get_s3_client()
+    batches = []
+    delete_objects = client.delete_objects
+    monkeypatch.setattr(client, "delete_objects", lambda **kwargs: batches.append(len(kwargs["Delete"]["Objects"])) or delete_objects(**kwargs))
+
+    stats = await s3_cleanup.purge_tombstones(batch_size=2)
+
+    assert stats == {"deleted": 4, "skipped": 2, "failed": 0}
+    assert max(batches) <= 2 and sum(batches) == 4
+    assert _keys(s3_bucket) == ["fal_images/4.png"]
+    assert tombstones.rows == {}
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_retried_later(s3_bucket, tombstones, monkeypatch):
+    urls = [_put(s3_bucket, f"wan_videos/{i}.mp4") for i in range(3)]
+    await tombstones.add(urls)
+
+    def failing_delete(**kwargs):
+        raise ConnectionError("S3 unreachable")
+
+    monkeypatch.setattr(s3_upload.get_s3_client(), "delete_objects", failing_delete)
+    stats = await s3_cleanup.purge_tombstones(batch_size=2)
+
+    # The run stops at the first failure; the rest wait for the next run
+    assert stats == {"deleted": 0, "skipped": 0, "failed": 2}
+    assert [row["attempts"] for row in tombstones.rows.values()] == [1, 1, 0]
+    assert tombstones.rows[1]["last_error"] == "S3 unreachable"
+    assert len(_keys(s3_bucket)) == 3
+
+
+@pytest.mark.asyncio
+async def test_reconcile_queues_unreferenced_objects_past_the_grace_window(s3_bucket, tombstones):
+    kept = _put(s3_bucket, "manim_videos/kept.mp4")
+    stray = _put(s3_bucket, "manim_videos/stray.mp4")
+    _put(s3_bucket, "other/unmanaged.mp4")
+    tombstones.referenced = {kept}
+
+    # Everything was just written: within the grace window
+    assert await s3_cleanup.reconcile_bucket(grace=timedelta(days=1)) == 0
+    assert tombstones.rows == {}
+
+    assert await s3_cleanup.reconcile_bucket(grace=timedelta(seconds=-60)) == 1
+    assert [row["media_url"] for row in tombstones.rows.values()] == [stray]
+
+
+@pytest.mark.asyncio
+async def test_purged_render_is_uploaded_again(s3_bucket, tombstones, tmp_path, monkeypatch):
+    scene_file = tmp_path / "scene.py"
+    scene_file.write_text("class Demo(Scene):\n    pass\n")
+    video = tmp_path / "Demo.mp4"
+    video.write_bytes(b"mp4")
+    monkeypatch.setattr(manim_generator, "RENDER_CACHE", RenderCache(tmp_path / "render_cache.json"))
+
+    url = await manim_generator.upload_render(str(video), str(scene_file), "l")
+    await tombstones.add([url])
+    await s3_cleanup.purge_tombstones()
+    assert _keys(s3_bucket) == []
+
+    # The render cache still knows the URL, but the object is gone
+    assert await manim_generator.upload_render(str(video), str(scene_file), "l") == url
+    assert _keys(s3_bucket) == [url.split(".amazonaws.com/", 1)[1]]
+
+
+@pytest.mark.asyncio
+async def test_upload_of_a_tombstoned_object_cancels_its_purge(s3_bucket, tombstones, tmp_path):
+    image = tmp_path / "image.png"
+    image.write_bytes(b"png")
+    url = await s3_upload.upload_to_s3_async(str(image), s3_folder="fal_images")
+    await tombstones.add([url])
+
+    # Dedupes onto the existing object, which must now stay
+    assert await s3_upload.upload_to_s3_async(str(image), s3_folder="fal_images") == url
+    assert tombstones.rows == {}
+    assert await s3_cleanup.purge_tombstones() == {"deleted": 0, "skipped": 0, "failed": 0}
+    assert _keys(s3_bucket) == [url.split(".amazonaws.com/", 1)[1]]
+
+
+@pytest.mark.asyncio
+async def test_upload_waits_for_a_purge_in_flight(s3_bucket, tombstones, tmp_path, monkeypatch):
+    image = tmp_path / "image.png"
+    image.write_bytes(b"png")
+    url = await s3_upload.upload_to_s3_async(str(image), s3_folder="fal_images")
+    await tombstones.add([url])
+    monkeypatch.setattr(s3_upload, "PURGE_POLL_SECONDS", 0.01)
+
+    # The purge has claimed the tombstone and checked references when the upload starts
+    purge_checked = asyncio.Event()
+    upload_started = asyncio.Event()
+    get_referenced = tombstones.get_referenced
+
+    async def slow_get_referenced(media_urls):
+        referenced = await get_referenced(media_urls)
+        purge_checked.set()
+        await upload_started.wait()
+        return referenced
+
+    monkeypatch.setattr(s3_cleanup, "get_referenced_media_urls", slow_get_referenced)
+    purge = asyncio.create_task(s3_cleanup.purge_tombstones())
+    await purge_checked.wait()
+    upload = asyncio.create_task(s3_upload.upload_to_s3_async(str(image), s3_folder="fal_images"))
+    await asyncio.sleep(0.05)
+    upload_started.set()
+
+    assert await purge == {"deleted": 1, "skipped": 0, "failed": 0}
+    assert await upload == url
+    # Stored again after the delete, not deduped onto the deleted object
+    assert _keys(s3_bucket) == [url.split(".amazonaws.com/", 1)[1]]
@@ -0,0 +1,72 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+import db.db as db_module
+
+from utils import s3_upload
+from utils.metrics import UPLOAD_BYTES_SAVED, UPLOADS, UPLOADS_DEDUPED, render_metrics
+
+
+async def no_tombstone(media_url):
+    return False
+
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    monkeypatch.setenv("sa_aws_bucket", "astrosmurf-test")
+    monkeypatch.setenv("sa_aws_access_key_id", "testing")
+    monkeypatch.setenv("sa_aws_secret_access_key", "testing")
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+    monkeypatch.setattr(db_module, "release_tombstone", no_tombstone)
+    with mock_aws():
+        s3_upload.get_s3_client.cache_clear()
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="astrosmurf-test")
+        yield "astrosmurf-test"
+    s3_upload.get_s3_client.cache_clear()
+
+
+def test_client_is_shared(s3_bucket):
+    assert s3_upload.get_s3_client() is s3_upload.get_s3_client()
+
+
+@pytest.mark.parametrize("name,content_type", [
+    ("clip.mp4", "video/mp4"),
+    ("image.png", "image/png"),
+    ("photo.jpg", "image/jpeg"),
+    ("blob.unknownext", "application/octet-stream"),
+])
+def test_content_type_is_inferred(name, content_type):
+    assert s3_upload.guess_content_type(name) == content_type
+
+
+@pytest.mark.asyncio
+async def test_async_upload_reports_progress(s3_bucket, tmp_path):
+    local_file = tmp_path / "image.png"
+    local_file.write_bytes(b"\x89PNG" + b"0" * 4096)
+    progress = []
+
+    url = await s3_upload.upload_to_s3_async(str(local_file), s3_folder="images", progress=lambda sent, total: progress.append((sent, total)))
+
+    key = url.split(".amazonaws.com/", 1)[1]
+    head = boto3.client("s3", region_name="us-east-1").head_object(Bucket=s3_bucket, Key=key)
+    assert head["ContentType"] == "image/png"
+    assert head["ContentLength"] == local_file.stat().st_size
+    assert progress[-1] == (local_file.stat().st_size, local_file.stat().st_size)
+
+
+def test_identical_content_is_uploaded_once(s3_bucket, tmp_path):
+    first = tmp_path / "wan_video_a.mp4"
+    second = tmp_path / "wan_video_b.mp4"
+    first.write_bytes(b"same video bytes")
+    second.write_bytes(b"same video bytes")
+    before = (UPLOADS.value(), UPLOADS_DEDUPED.value(), UPLOAD_BYTES_SAVED.value())
+
+    url_a = s3_upload.upload_to_s3(str(first), s3_folder="wan_videos")
+    url_b = s3_upload.upload_to_s3(str(second), s3_folder="wan_videos")
+
+    assert url_a == url_b
+    assert url_a.endswith(f"wan_videos/{s3_upload.sha256_file(str(first))}.mp4")
+    after = (UPLOADS.value(), UPLOADS_DEDUPED.value(), UPLOAD_BYTES_SAVED.value())
+    assert [a - b for a, b in zip(after, before)] == [1, 1, first.stat().st_size]
+    assert "astrosmurf_upload_bytes_saved_total" in render_metrics()
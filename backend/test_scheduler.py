@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from ai.wan_jobs import WanJobQueue
+from utils.limits import ConcurrencyLimit
+from utils.scheduler import ARTICLE_LANE, INTERACTIVE_LANE, VIDEO_LANE, FairQueue, parse_user_weights, work_context
+
+
+def test_fair_queue_interleaves_users_and_serves_lanes_by_priority():
+    queue = FairQueue(weights={})
+    for i in range(4):
+        queue.push(f"a{i}", user_id="a")
+    queue.push("b0", user_id="b")
+    queue.push("b1", user_id="b")
+    queue.push("video", user_id="b", lane=VIDEO_LANE)
+    queue.push("image", user_id="c", lane=INTERACTIVE_LANE)
+
+    assert queue.ordered()[0] == "image"
+    assert [queue.pop() for _ in range(len(queue))] == ["image", "a0", "b0", "a1", "b1", "a2", "a3", "video"]
+
+
+def test_fair_queue_shares_by_weight():
+    queue = FairQueue(weights=parse_user_weights("1:2"))
+    for i in range(4):
+        queue.push(f"heavy{i}", user_id=1)
+        queue.push(f"light{i}", user_id=2)
+    served = [queue.pop() for _ in range(6)]
+    assert sum(item.startswith("heavy") for item in served) == 4
+
+
+@pytest.mark.asyncio
+async def test_limit_hands_slots_to_interactive_work_first():
+    limit = ConcurrencyLimit("test", 1)
+    served = []
+    release = asyncio.Event()
+
+    async def call(name, user_id, lane):
+        with work_context(user_id, lane):
+            async with limit:
+                served.append(name)
+                if name == "holder":
+                    await release.wait()
+
+    holder = asyncio.create_task(call("holder", 1, ARTICLE_LANE))
+    await asyncio.sleep(0)
+    batch = [asyncio.create_task(call(f"batch{i}", 1, ARTICLE_LANE)) for i in range(3)]
+    cancelled = asyncio.create_task(call("cancelled", 3, ARTICLE_LANE))
+    other = asyncio.create_task(call("other", 2, ARTICLE_LANE))
+    image = asyncio.create_task(call("image", 2, INTERACTIVE_LANE))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    release.set()
+    await asyncio.gather(holder, *batch, other, image, return_exceptions=True)
+
+    assert served == ["holder", "image", "batch0", "other", "batch1", "batch2"]
+    assert limit.in_use == 0
+
+
+@pytest.mark.asyncio
+async def test_wan_jobs_are_taken_fairly_across_users():
+    ran = []
+
+    async def run_job(article_id, model=None, user_id=1):
+        ran.append(article_id)
+        return {"video_url": f"https://example.com/{article_id}.mp4"}
+
+    queue = WanJobQueue(model=None, run_job=run_job)
+    jobs = [queue.submit(article_id=article_id, user_id=1) for article_id in (1, 2, 3)]
+    late = queue.submit(article_id=10, user_id=2)
+    assert late["queue_position"] == 1
+    assert queue.get(jobs[2]["job_id"])["queue_position"] == 3
+
+    await asyncio.wait_for(queue.join(), timeout=5)
+    await queue.stop()
+    assert ran == [1, 10, 2, 3]
@@ -0,0 +1,127 @@
+import asyncio
+
+import httpx
+import pytest
+
+from benchmarks.fakes import offline_services
+from utils.singleflight import SingleFlight, normalize_url
+
+
+def test_normalize_url_drops_noise():
+    assert normalize_url("HTTPS://Example.com:443/a/b/?utm_source=x&b=2&a=1#top") == "https://example.com/a/b?a=1&b=2"
+    assert normalize_url("http://example.com") == normalize_url("http://example.com/")
+    assert normalize_url("http://example.com:8080/a") == "http://example.com:8080/a"
+    assert normalize_url(None) == ""
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_run():
+    flights = SingleFlight("test")
+    calls = []
+    release = asyncio.Event()
+
+    async def work(n):
+        calls.append(n)
+        await release.wait()
+        return {"n": n}
+
+    waiters = [asyncio.create_task(flights.do("key", work, i)) for i in range(5)]
+    await asyncio.sleep(0)
+    assert flights.in_flight() == 1
+    release.set()
+    results = await asyncio.gather(*waiters)
+
+    assert calls == [0]
+    assert all(result is results[0] for result in results)
+    # Without a reuse window the next call runs again
+    assert await flights.do("key", work, 9) == {"n": 9}
+
+
+@pytest.mark.asyncio
+async def test_failures_are_shared_but_not_reused():
+    flights = SingleFlight("test", reuse_seconds=60)
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    results = await asyncio.gather(flights.do("k", fail), flights.do("k", fail), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results)
+    with pytest.raises(RuntimeError):
+        await flights.do("k", fail)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_reuse_window_and_cancellation():
+    flights = SingleFlight("test", reuse_seconds=60)
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    first = asyncio.create_task(flights.do("k", work))
+    second = asyncio.create_task(flights.do("k", work))
+    await asyncio.sleep(0.01)
+    # One caller giving up does not cancel the run the other waits for
+    first.cancel()
+    assert await second == "done"
+    assert await flights.do("k", work) == "done"
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_identical_generate_requests_coalesce():
+    with offline_services(llm_latency=0.05, fal_latency=0.05, render_latency=0) as services:
+        import main
+        from utils.downloads import close_http_client
+        from utils.mirror import MEDIA_MIRROR
+
+        url = f"{services['article_base_url']}/7"
+        links = [url, url + "/", url + "?utm_source=slack", url + "#comments"]
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            try:
+                responses = await asyncio.gather(*(
+                    client.post("/generate", json={"user_id": 1, "link": link, "style": "meme"})
+                    for link in links
+                ))
+                await MEDIA_MIRROR.join()
+            finally:
+                await close_http_client()
+
+        bodies = [response.json() for response in responses]
+        assert all(body["success"] for body in bodies)
+        assert len({body["article_id"] for body in bodies}) == 1
+        assert len(services["repository"].articles) == 1
+        assert services["server"].requests["article"] == 1
+
+
+@pytest.mark.asyncio
+async def test_generate_requests_of_different_users_do_not_coalesce():
+    with offline_services(llm_latency=0.05, fal_latency=0.05, render_latency=0) as services:
+        import main
+        from utils.downloads import close_http_client
+        from utils.mirror import MEDIA_MIRROR
+
+        url = f"{services['article_base_url']}/7"
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            try:
+                responses = await asyncio.gather(*(
+                    client.post("/generate", json={"user_id": user_id, "link": url, "style": "meme"})
+                    for user_id in (1, 2)
+                ))
+                await MEDIA_MIRROR.join()
+            finally:
+                await close_http_client()
+
+        bodies = [response.json() for response in responses]
+        assert all(body["success"] for body in bodies)
+        articles = services["repository"].articles
+        # Each user gets their own article
+        assert [articles[body["article_id"]]["user_id"] for body in bodies] == [1, 2]
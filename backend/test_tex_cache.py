@@ -0,0 +1,74 @@
+import pytest
+
+import ai.nemotron_manim_generator as manim_generator
+from utils.metrics import TEX_CACHE_LOOKUPS
+from utils.render_cache import RenderCache
+from utils.tex_cache import TexCache
+
+
+def _render(tex_dir, expressions):
+    """What manim leaves in a tex_dir: a .tex per expression, an .svg per compiled one"""
+    for stem in expressions:
+        (tex_dir / f"{stem}.tex").write_text(stem)
+        if not (tex_dir / f"{stem}.svg").exists():
+            (tex_dir / f"{stem}.svg").write_text(f"<svg>{stem}</svg>")
+
+
+def test_tex_cache_publishes_misses_and_seeds_hits(tmp_path):
+    cache = TexCache(tmp_path / "cache", max_bytes=10**6)
+    before = (TEX_CACHE_LOOKUPS.value(outcome="hit"), TEX_CACHE_LOOKUPS.value(outcome="miss"))
+
+    first = tmp_path / "render1" / "Tex"
+    assert cache.stage(first) == set()
+    _render(first, ["aaa", "bbb"])
+    assert cache.publish(first, set()) == {"hits": 0, "misses": 2}
+    assert sorted(p.name for p in (tmp_path / "cache").iterdir()) == ["aaa.svg", "bbb.svg"]
+
+    # A later render is seeded with the compiled SVGs only
+    second = tmp_path / "render2" / "Tex"
+    seeded = cache.stage(second)
+    assert seeded == {"aaa", "bbb"}
+    assert sorted(p.name for p in second.iterdir()) == ["aaa.svg", "bbb.svg"]
+    assert (second / "aaa.svg").read_text() == "<svg>aaa</svg>"
+
+    _render(second, ["aaa", "ccc"])
+    assert cache.publish(second, seeded) == {"hits": 1, "misses": 1}
+    assert (tmp_path / "cache" / "ccc.svg").exists()
+    assert cache.stats()["entries"] == 3
+    assert cache.stats()["hit_rate"] == pytest.approx(1 / 4)
+    # Reported in /metrics too
+    after = (TEX_CACHE_LOOKUPS.value(outcome="hit"), TEX_CACHE_LOOKUPS.value(outcome="miss"))
+    assert (after[0] - before[0], after[1] - before[1]) == (1, 3)
+
+
+@pytest.mark.asyncio
+async def test_tex_staging_happens_within_the_render_limit(tmp_path, monkeypatch):
+    scene_file = tmp_path / "scene.py"
+    scene_file.write_text("class Demo(Scene):\n    pass\n")
+    video = tmp_path / "Demo.mp4"
+    video.write_bytes(b"mp4")
+    tex_cache = TexCache(tmp_path / "tex_cache", max_bytes=10**6)
+    in_use_when_staging = []
+    stage = tex_cache.stage
+
+    def tracked_stage(staging_dir):
+        in_use_when_staging.append(manim_generator.RENDER_LIMIT.in_use)
+        return stage(staging_dir)
+
+    class StubPool:
+        async def render(self, scene_filepath, scene_name, media_dir, quality, tex_dir):
+            return str(video)
+
+    monkeypatch.setattr(tex_cache, "stage", tracked_stage)
+    monkeypatch.setattr(manim_generator, "TEX_CACHE", tex_cache)
+    monkeypatch.setattr(manim_generator, "MANIM_TEX_STAGING_DIR", tmp_path / "staging")
+    monkeypatch.setattr(manim_generator, "RENDER_CACHE", RenderCache(tmp_path / "render_cache.json"))
+    monkeypatch.setattr(manim_generator, "RENDER_POOL", StubPool())
+    monkeypatch.setattr(manim_generator, "collect_manim_artifacts", lambda protect=(): None)
+
+    path = await manim_generator.run_manim_scene(str(scene_file), output_dir=str(tmp_path / "out"))
+
+    assert path == str(video)
+    assert in_use_when_staging == [1]
+    # The private staging directory is removed after the render
+    assert list((tmp_path / "staging").iterdir()) == []
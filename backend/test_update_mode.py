@@ -0,0 +1,90 @@
+import httpx
+import pytest
+
+from ai.article import match_concepts, split_concepts
+from benchmarks.fakes import offline_services
+
+CONCEPTS = [
+    "Black holes bend light around them, creating gravitational lenses.",
+    "The event horizon marks the point of no return for matter.",
+    "Hawking radiation slowly evaporates black holes over time.",
+]
+
+
+def test_match_concepts_pairs_exact_then_near_duplicates():
+    new = [
+        "the event horizon marks the point of no return for matter",  # exact after normalizing
+        "Black holes bend light around them, creating gravitational lensing.",  # near duplicate
+        "Quasars are powered by supermassive black holes.",  # new
+    ]
+    matches = match_concepts(CONCEPTS, new, threshold=0.85)
+    assert matches[0] == (1, 1.0)
+    assert matches[1][0] == 0 and 0.85 <= matches[1][1] < 1.0
+    assert 2 not in matches
+    # Each old concept is used once
+    assert match_concepts(["a b c"], ["a b c", "a b c"]) == {0: (0, 1.0)}
+
+
+def test_split_concepts_reads_article_text():
+    assert split_concepts("\n ".join(CONCEPTS)) == CONCEPTS
+    assert split_concepts(None) == []
+
+
+@pytest.mark.asyncio
+async def test_update_regenerates_only_changed_concepts():
+    with offline_services(llm_latency=0, fal_latency=0, render_latency=0) as services:
+        import main
+        from utils.downloads import close_http_client
+        from utils.mirror import MEDIA_MIRROR
+
+        repository = services["repository"]
+        server = services["server"]
+        body = {"user_id": 1, "link": f"{services['article_base_url']}/8", "style": "meme"}
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            try:
+                server.fixed_concepts = CONCEPTS
+                first = (await client.post("/generate", json=body)).json()
+
+                # The post is edited: one concept reworded, one replaced
+                server.fixed_concepts = [CONCEPTS[0], CONCEPTS[1].replace("matter", "all matter"), "Quasars are powered by supermassive black holes."]
+                chats_before = server.requests["chat"]
+                updated = (await client.post("/generate", json=dict(body, update=True))).json()
+                update_chats = server.requests["chat"] - chats_before
+
+                # Nothing changed since: nothing is regenerated
+                unchanged = (await client.post("/generate", json=dict(body, update=True))).json()
+
+                # Images of another persona are a separate set
+                persona = (await client.post("/generate", json=dict(body, update=True, persona_id=5))).json()
+                await MEDIA_MIRROR.join()
+            finally:
+                await close_http_client()
+
+        first_ids = [entry["media_id"] for entry in first["media_entries"]]
+        report = updated["update"]
+        assert updated["article_id"] == first["article_id"]
+        assert (report["unchanged"], report["near_duplicates"], report["regenerated"]) == (1, 1, 1)
+        assert report["skipped_image_calls"] == 2
+        # One decomposition and one prompt
+        assert update_chats == 2
+        assert len(report["superseded_media_ids"]) == 1 and report["superseded_media_ids"][0] in first_ids
+        updated_ids = [entry["media_id"] for entry in updated["media_entries"]]
+        assert updated_ids[:2] == first_ids[:2]
+        # The replaced image is kept but no longer one of the article's
+        superseded = repository.media[report["superseded_media_ids"][0]]
+        assert superseded["superseded_at"] is not None
+        assert sorted(row["id"] for row in await repository.get_media_by_article(first["article_id"]) if row["persona_id"] is None) == sorted(updated_ids)
+        assert len(repository.articles) == 1
+        assert split_concepts(repository.articles[first["article_id"]]["text"])[2].startswith("Quasars")
+
+        assert unchanged["update"]["regenerated"] == 0
+        assert unchanged["update"]["skipped_image_calls"] == 3
+        assert unchanged["update"]["superseded_media_ids"] == []
+
+        assert persona["update"]["regenerated"] == 3
+        assert persona["update"]["superseded_media_ids"] == []
+        assert all(repository.media[entry["media_id"]]["persona_id"] == 5 for entry in persona["media_entries"])
+        assert len(repository.media) == 7
+        # Wan reference images come from the current media only
+        assert len(await repository.get_media_urls_by_article(first["article_id"])) == 6
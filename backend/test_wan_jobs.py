@@ -0,0 +1,116 @@
+import asyncio
+import pytest
+
+import ai.wan_video as wan_video
+from ai.wan_jobs import WanJobQueue
+from ai.wan_model import WanBackend, WanModelManager
+
+
+class FakeBackend(WanBackend):
+    """CPU stand-in for the Wan generator: writes a dummy video file"""
+
+    def __init__(self):
+        self.loads = 0
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+
+    def load(self):
+        self.loads += 1
+
+    def generate(self, prompt, src_ref_images, save_file, **kwargs):
+        self.calls += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        with open(save_file, "wb") as f:
+            f.write(b"fake mp4")
+        self.running -= 1
+        return save_file
+
+
+@pytest.fixture
+def fake_services(monkeypatch, tmp_path):
+    stored = []
+
+    async def fake_get_media_urls_by_article(article_id, media_type="image"):
+        return [] if article_id == 404 else [f"https://example.com/{article_id}.png"]
+
+    async def fake_fetch_many(urls):
+        paths = []
+        for i, url in enumerate(urls):
+            path = tmp_path / f"ref_{i}.png"
+            path.write_bytes(b"png")
+            paths.append(path)
+        return paths
+
+    async def fake_store_media(**kwargs):
+        stored.append(kwargs)
+        return {"id": len(stored)}
+
+    async def fake_upload_to_s3_async(path, s3_folder):
+        return f"https://s3.example.com/{s3_folder}/video.mp4"
+
+    monkeypatch.setattr(wan_video, "WAN_SCRATCH_DIR", tmp_path / "scratch")
+    monkeypatch.setattr(wan_video, "get_media_urls_by_article", fake_get_media_urls_by_article)
+    monkeypatch.setattr(wan_video.REF_IMAGE_CACHE, "fetch_many", fake_fetch_many)
+    monkeypatch.setattr(wan_video, "upload_to_s3_async", fake_upload_to_s3_async)
+    monkeypatch.setattr(wan_video, "store_media", fake_store_media)
+    return stored
+
+
+@pytest.mark.asyncio
+async def test_wan_jobs_run_one_at_a_time(fake_services):
+    backend = FakeBackend()
+    queue = WanJobQueue(WanModelManager(backend))
+
+    jobs = [queue.submit(article_id=i) for i in (1, 2, 404)]
+    assert [job["status"] for job in jobs] == ["queued"] * 3
+    assert queue.get(jobs[2]["job_id"])["queue_position"] == 2
+
+    await asyncio.wait_for(queue.join(), timeout=5)
+    await queue.stop()
+
+    done = [queue.get(job["job_id"]) for job in jobs]
+    assert [job["status"] for job in done] == ["succeeded", "succeeded", "failed"]
+    assert done[0]["result"]["video_url"] == "https://s3.example.com/wan_videos/video.mp4"
+    assert backend.loads == 1
+    assert backend.calls == 2
+    assert backend.max_running == 1
+    assert len(fake_services) == 2
+
+
+@pytest.mark.asyncio
+async def test_wan_workspaces_are_unique_and_removed_after_upload(fake_services, tmp_path):
+    backend = FakeBackend()
+    save_files = []
+    generate = backend.generate
+    backend.generate = lambda **kwargs: save_files.append(kwargs["save_file"]) or generate(**kwargs)
+    queue = WanJobQueue(WanModelManager(backend))
+
+    for article_id in (1, 1):
+        queue.submit(article_id=article_id)
+    await asyncio.wait_for(queue.join(), timeout=5)
+    await queue.stop()
+
+    assert len(set(save_files)) == 2
+    assert list((tmp_path / "scratch").iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_failed_upload_fails_the_job_without_storing_a_local_path(fake_services, tmp_path, monkeypatch):
+    async def failing_upload(path, s3_folder):
+        raise ConnectionError("S3 unreachable")
+
+    monkeypatch.setattr(wan_video, "upload_to_s3_async", failing_upload)
+    queue = WanJobQueue(WanModelManager(FakeBackend()))
+
+    job = queue.submit(article_id=1)
+    await asyncio.wait_for(queue.join(), timeout=5)
+    await queue.stop()
+
+    job = queue.get(job["job_id"])
+    assert job["status"] == "failed"
+    assert "S3 unreachable" in job["error"]
+    assert fake_services == []
+    # Nothing left on the scratch volume for GC to pull out from under a row
+    assert list((tmp_path / "scratch").iterdir()) == []
@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+
+import ai.wan_video as wan_video
+from ai.wan_model import WanBackend, WanModelManager
+
+
+class StubBackend(WanBackend):
+    def __init__(self):
+        self.events = []
+
+    def load(self):
+        self.events.append("load")
+
+    def generate(self, **kwargs):
+        self.events.append(("generate", kwargs["offload_model"]))
+        return kwargs.get("save_file")
+
+    def offload(self):
+        self.events.append("offload")
+
+    def unload(self):
+        self.events.append("unload")
+
+
+@pytest.mark.asyncio
+async def test_preload_then_generate_keeps_weights_resident():
+    backend = StubBackend()
+    manager = WanModelManager(backend, residency="resident")
+    assert manager.status()["state"] == "unloaded"
+
+    await manager.preload()
+    assert manager.ready
+    await manager.generate(save_file="a.mp4")
+    await manager.generate(save_file="b.mp4")
+
+    assert backend.events == ["load", ("generate", False), ("generate", False)]
+    assert manager.status()["jobs_done"] == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("residency,released,state", [("offload", "offload", "offloaded"), ("unload", "unload", "unloaded")])
+async def test_idle_models_are_released(residency, released, state):
+    backend = StubBackend()
+    manager = WanModelManager(backend, residency=residency, idle_seconds=0)
+    await manager.generate(save_file="a.mp4")
+
+    await asyncio.to_thread(manager._release_if_idle)
+    assert backend.events[-1] == released
+    assert manager.state == state
+
+    # The next job brings the models back (a full load only after unload)
+    await manager.generate(save_file="b.mp4")
+    assert backend.events.count("load") == (2 if residency == "unload" else 1)
+
+
+def test_unknown_residency_is_rejected():
+    with pytest.raises(ValueError):
+        WanModelManager(StubBackend(), residency="sometimes")
+
+
+def test_broken_wan_install_fails_once_and_is_cached(tmp_path, monkeypatch):
+    # Found by find_spec, but its dependencies are missing
+    (tmp_path / "generate_integrated_fast.py").write_text('raise ImportError("No module named \'torch\'")\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    wan_video.load_wan_generator.cache_clear()
+    try:
+        for _ in range(2):
+            with pytest.raises(RuntimeError, match="not available"):
+                wan_video.get_generator(task="vace-1.3B")
+        assert wan_video.load_wan_generator.cache_info().misses == 1
+    finally:
+        wan_video.load_wan_generator.cache_clear()
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import x.post as x_post
+from benchmarks.fakes import InMemoryRepository
+
+
+@pytest.fixture
+def x_api(monkeypatch):
+    """Uploads made and tweets posted, against an in-memory media id cache"""
+    repository = InMemoryRepository()
+    calls = {"uploads": [], "tweets": []}
+
+    async def fake_upload_media(media_url):
+        calls["uploads"].append(media_url)
+        return f"x-{len(calls['uploads'])}", datetime.now(timezone.utc) + timedelta(hours=23)
+
+    def create_tweet(text, media_ids):
+        calls["tweets"].append(media_ids)
+        return SimpleNamespace(data={"id": str(len(calls["tweets"]))})
+
+    monkeypatch.setattr(x_post, "upload_media", fake_upload_media)
+    monkeypatch.setattr(x_post, "get_client", lambda: SimpleNamespace(create_tweet=create_tweet))
+    monkeypatch.setattr(x_post, "get_x_media_upload", repository.get_x_media_upload)
+    monkeypatch.setattr(x_post, "store_x_media_upload", repository.store_x_media_upload)
+    calls["repository"] = repository
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_x_media_id_is_reused_until_the_url_changes_or_it_expires(x_api):
+    fal_url = "https://fal.media/files/image.png"
+    s3_url = "https://bucket.s3.us-east-1.amazonaws.com/fal_images/image.png"
+
+    first = await x_post.post_media_to_twitter(fal_url, "first", media_row_id=7)
+    hit = await x_post.post_media_to_twitter(fal_url, "again", media_row_id=7)
+    assert hit["media_id"] == first["media_id"] == "x-1"
+    assert x_api["uploads"] == [fal_url]
+
+    # The row was mirrored to S3: the cached id is for the old URL
+    moved = await x_post.post_media_to_twitter(s3_url, "moved", media_row_id=7)
+    assert moved["media_id"] == "x-2"
+    assert x_api["uploads"] == [fal_url, s3_url]
+
+    x_api["repository"].x_media_uploads[7]["expires_at"] = datetime.now(timezone.utc) - timedelta(minutes=1)
+    expired = await x_post.post_media_to_twitter(s3_url, "expired", media_row_id=7)
+    assert expired["media_id"] == "x-3"
+    assert x_api["tweets"] == [["x-1"], ["x-1"], ["x-2"], ["x-3"]]
+
+    # Without a media row nothing is cached
+    await x_post.post_media_to_twitter(s3_url, "adhoc")
+    assert len(x_api["uploads"]) == 4
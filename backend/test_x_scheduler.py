@@ -0,0 +1,183 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import x.scheduler as scheduler
+from x.scheduler import PostingWorker
+
+
+@pytest.fixture
+def fake_posts(monkeypatch):
+    """In-memory posts table with the claim/lease semantics of the SQL"""
+    state = {"posts": {}, "posted": [], "calls": [], "renewals": []}
+
+    async def claim_due_posts(limit, lease_seconds, max_attempts, worker_id, posts_per_window, window_seconds):
+        since = datetime.now(timezone.utc) - timedelta(seconds=window_seconds)
+        used = {}
+        for post in state["posts"].values():
+            if (post["posted_at"] and post["posted_at"] > since) or (not post["posted_at"] and post["claimed_by"]):
+                used[post["social_account_id"]] = used.get(post["social_account_id"], 0) + 1
+        claimed = []
+        for post in state["posts"].values():
+            if len(claimed) == limit:
+                break
+            if post["posted_at"] or post["claimed_by"] or post["attempts"] >= max_attempts:
+                continue
+            if used.get(post["social_account_id"], 0) >= posts_per_window:
+                continue
+            used[post["social_account_id"]] = used.get(post["social_account_id"], 0) + 1
+            post["claimed_by"] = worker_id
+            claimed.append(dict(post))
+        return claimed
+
+    async def renew_post_lease(post_id, worker_id, lease_seconds):
+        state["renewals"].append(post_id)
+        return state["posts"][post_id]["claimed_by"] == worker_id
+
+    async def mark_post_posted(post_id, tweet_id, worker_id):
+        post = state["posts"][post_id]
+        if post["claimed_by"] != worker_id:
+            return False
+        post.update(posted_at=datetime.now(timezone.utc), tweet_id=tweet_id, claimed_by=None)
+        state["posted"].append(post_id)
+        return True
+
+    async def mark_post_failed(post_id, worker_id, error, retry_in_seconds):
+        post = state["posts"][post_id]
+        if post["claimed_by"] != worker_id:
+            return False
+        post.update(attempts=post["attempts"] + 1, last_error=error, claimed_by=None, retry_in=retry_in_seconds)
+        return True
+
+    async def get_media_by_id(media_id):
+        return {"id": media_id, "media_url": f"https://example.com/{media_id}.png"}
+
+    for fn in (claim_due_posts, renew_post_lease, mark_post_posted, mark_post_failed, get_media_by_id):
+        monkeypatch.setattr(scheduler, fn.__name__, fn)
+
+    def add(post_id, social_account_id=1):
+        state["posts"][post_id] = {
+            "id": post_id, "social_account_id": social_account_id, "media_id": post_id,
+            "caption": f"post {post_id}", "attempts": 0, "posted_at": None, "claimed_by": None,
+        }
+
+    state["add"] = add
+    return state
+
+
+def make_poster(state, fail=0, delay=0):
+    async def post(media_url, text="", media_row_id=None):
+        state["calls"].append(media_row_id)
+        await asyncio.sleep(delay)
+        if len(state["calls"]) <= fail:
+            raise RuntimeError("X is down")
+        return {"success": True, "tweet_id": f"t{media_row_id}"}
+    return post
+
+
+@pytest.mark.asyncio
+async def test_posts_due_rows_once(fake_posts):
+    for post_id in range(1, 6):
+        fake_posts["add"](post_id, social_account_id=post_id % 2)
+    worker = PostingWorker(batch_size=3, concurrency=2, post=make_poster(fake_posts))
+
+    assert await worker.run_once() == 3
+    assert await worker.run_once() == 2
+    assert await worker.run_once() == 0
+    assert sorted(fake_posts["posted"]) == [1, 2, 3, 4, 5]
+    assert sorted(fake_posts["calls"]) == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.asyncio
+async def test_failed_post_is_retried_with_backoff(fake_posts):
+    fake_posts["add"](1)
+    worker = PostingWorker(backoff_base=10, backoff_max=100, post=make_poster(fake_posts, fail=1))
+
+    await worker.run_once()
+    post = fake_posts["posts"][1]
+    assert post["attempts"] == 1
+    assert post["last_error"] == "X is down"
+    assert 8 <= post["retry_in"] <= 12
+
+    await worker.run_once()
+    assert fake_posts["posted"] == [1]
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_account_is_not_claimed(fake_posts):
+    for post_id in range(1, 4):
+        fake_posts["add"](post_id)
+    fake_posts["add"](4, social_account_id=2)
+    worker = PostingWorker(posts_per_window=2, window_seconds=3600, post=make_poster(fake_posts))
+
+    assert await worker.run_once() == 3
+    assert sorted(fake_posts["posted"]) == [1, 2, 4]
+    # Account 1 is out of room: its third post stays due, unclaimed and unattempted
+    assert await worker.run_once() == 0
+    assert fake_posts["posts"][3]["claimed_by"] is None
+    assert fake_posts["posts"][3]["attempts"] == 0
+
+
+@pytest.mark.asyncio
+async def test_posts_claimed_elsewhere_count_against_the_limit(fake_posts):
+    for post_id in range(1, 4):
+        fake_posts["add"](post_id)
+    fake_posts["posts"][1]["claimed_by"] = "other-worker"
+    worker = PostingWorker(posts_per_window=2, window_seconds=3600, post=make_poster(fake_posts))
+
+    assert await worker.run_once() == 1
+    assert fake_posts["posted"] == [2]
+
+
+@pytest.mark.asyncio
+async def test_lease_is_renewed_while_posting(fake_posts):
+    fake_posts["add"](1)
+    worker = PostingWorker(lease_seconds=0.03, post=make_poster(fake_posts, delay=0.05))
+
+    await worker.run_once()
+    assert fake_posts["posted"] == [1]
+    assert fake_posts["renewals"][:1] == [1]
+    renewals = len(fake_posts["renewals"])
+    # The heartbeat stops with the post
+    await asyncio.sleep(0.03)
+    assert len(fake_posts["renewals"]) == renewals
+
+
+@pytest.mark.asyncio
+async def test_post_taken_over_by_another_worker_is_not_marked(fake_posts, capsys):
+    fake_posts["add"](1)
+    poster = make_poster(fake_posts)
+
+    async def slow_post(media_url, text="", media_row_id=None):
+        # The lease ran out mid-post and another worker claimed the row
+        fake_posts["posts"][1]["claimed_by"] = "other-worker"
+        return await poster(media_url, text, media_row_id)
+
+    worker = PostingWorker(post=slow_post)
+    await worker.run_once()
+
+    assert fake_posts["posted"] == []
+    assert fake_posts["posts"][1]["claimed_by"] == "other-worker"
+    assert "another worker had taken over its lease" in capsys.readouterr().out
+
+
+@pytest.mark.asyncio
+async def test_published_post_is_not_retried_when_recording_fails(fake_posts, monkeypatch):
+    fake_posts["add"](1)
+    mark_post_posted = scheduler.mark_post_posted
+    outages = [ConnectionError("database unavailable")]
+
+    async def flaky_mark_post_posted(post_id, tweet_id, worker_id):
+        if outages:
+            raise outages.pop()
+        return await mark_post_posted(post_id, tweet_id, worker_id)
+
+    monkeypatch.setattr(scheduler, "mark_post_posted", flaky_mark_post_posted)
+    worker = PostingWorker(record_retry_delay=0, post=make_poster(fake_posts))
+
+    await worker.run_once()
+    assert await worker.run_once() == 0
+    assert fake_posts["calls"] == [1]
+    assert fake_posts["posted"] == [1]
+    assert fake_posts["posts"][1]["attempts"] == 0
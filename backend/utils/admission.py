@@ -0,0 +1,195 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from utils.metrics import Counter, Gauge, Histogram, register
+
+ADMISSION_RUNNING = register(Gauge(
+    "astrosmurf_admission_running", "Requests admitted past an admission gate and running", ("gate",)
+))
+ADMISSION_QUEUED = register(Gauge(
+    "astrosmurf_admission_queued", "Requests waiting in an admission gate's queue", ("gate",)
+))
+ADMISSION_REJECTED = register(Counter(
+    "astrosmurf_admission_rejected_total", "Requests turned away by admission control", ("gate", "status")
+))
+ADMISSION_WAIT = register(Histogram(
+    "astrosmurf_admission_wait_seconds", "Time admitted requests spent queued before running", ("gate",)
+))
+ADMISSION_LATENCY = register(Gauge(
+    "astrosmurf_admission_latency_seconds", "Recent request latency behind a gate's Retry-After estimates", ("gate",)
+))
+
+# Bounds of Retry-After estimates, in seconds
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = int(os.getenv("ADMISSION_MAX_RETRY_AFTER", "300"))
+# Weight of the latest request in a gate's moving latency average
+LATENCY_SMOOTHING = 0.2
+
+
+class Overloaded(Exception):
+    """A request turned away by an admission gate
+
+    main.py answers it with `status_code` (429 when an endpoint's queue is
+    full, 503 when the service as a whole is) and a Retry-After header.
+    """
+
+    def __init__(self, gate: str, status_code: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.gate = gate
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """Bounded admission for one kind of expensive request
+
+    At most `max_running` requests run at once and at most `max_queued` more
+    wait for a slot, first come first served, for up to `queue_timeout`
+    seconds. A request beyond that is refused at once with 429, and one that
+    times out in the queue with 503. A gate may have a `parent` (the global
+    gate) capping the requests admitted, running or queued, across every
+    endpoint; when it is full requests are refused with 503 without queueing.
+
+    Refusals carry a Retry-After estimate: the requests ahead of the caller
+    drained `max_running` at a time at the gate's recent latency (a moving
+    average of admitted requests, starting at `expected_seconds`).
+    """
+
+    def __init__(self, name: str, max_running: int, max_queued: int = 0, queue_timeout: float | None = None,
+                 expected_seconds: float = 30.0, parent: "AdmissionGate | None" = None):
+        self.name = name
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.parent = parent
+        self.latency = expected_seconds
+        self.running = 0
+        self._queue = deque()
+        ADMISSION_LATENCY.set(expected_seconds, gate=name)
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def retry_after(self, ahead: int = None) -> int:
+        """Seconds until `ahead` requests (default: the queue and the caller) have drained"""
+        if ahead is None:
+            ahead = self.queued + 1
+        seconds = self.latency * ahead / max(self.max_running, 1)
+        return min(max(math.ceil(seconds), MIN_RETRY_AFTER), MAX_RETRY_AFTER)
+
+    def _refuse(self, status_code: int, reason: str, ahead: int = None) -> Overloaded:
+        ADMISSION_REJECTED.inc(gate=self.name, status=str(status_code))
+        return Overloaded(self.name, status_code, self.retry_after(ahead), reason)
+
+    def check(self):
+        """Raise Overloaded if a request arriving now would be refused
+
+        For responses that must be started before the work is admitted
+        (streams); does not reserve a slot.
+        """
+        if self.parent is not None and self.parent.running >= self.parent.max_running:
+            raise self.parent._refuse(503, "Service is at capacity, try again later", ahead=1)
+        if self.running >= self.max_running and self.queued >= self.max_queued:
+            raise self._refuse(429, f"Too many {self.name} requests, try again later")
+
+    def try_acquire(self) -> bool:
+        """Take a slot if one is free right now, without queueing"""
+        if self.running < self.max_running and not self._queue:
+            self.running += 1
+            ADMISSION_RUNNING.inc(gate=self.name)
+            return True
+        return False
+
+    async def acquire(self):
+        """Wait for a slot, or raise Overloaded"""
+        if self.parent is not None and not self.parent.try_acquire():
+            raise self.parent._refuse(503, "Service is at capacity, try again later", ahead=1)
+        try:
+            await self._acquire()
+        except BaseException:
+            if self.parent is not None:
+                self.parent.release()
+            raise
+
+    async def _acquire(self):
+        if self.try_acquire():
+            ADMISSION_WAIT.observe(0, gate=self.name)
+            return
+        if self.queued >= self.max_queued:
+            raise self._refuse(429, f"Too many {self.name} requests, try again later")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queue.append(waiter)
+        ADMISSION_QUEUED.inc(gate=self.name)
+        queued_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Handed a slot just as we gave up: pass it on
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._refuse(503, f"Timed out waiting for a {self.name} slot, try again later") from None
+            raise
+        else:
+            ADMISSION_WAIT.observe(time.perf_counter() - queued_at, gate=self.name)
+        finally:
+            if waiter in self._queue:
+                self._queue.remove(waiter)
+            ADMISSION_QUEUED.dec(gate=self.name)
+
+    def release(self, seconds: float | None = None):
+        """Give a slot back, recording how long its request ran"""
+        if seconds is not None:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+            ADMISSION_LATENCY.set(self.latency, gate=self.name)
+        # Hand the slot straight to the longest waiting request
+        while self._queue:
+            waiter = self._queue.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.running -= 1
+        ADMISSION_RUNNING.dec(gate=self.name)
+
+    @asynccontextmanager
+    async def admit(self):
+        """`async with gate.admit():` around a request's work"""
+        await self.acquire()
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            seconds = time.perf_counter() - started
+            self.release(seconds)
+            if self.parent is not None:
+                self.parent.release(seconds)
+
+
+def admission_gate(name: str, max_running: int, max_queued: int, expected_seconds: float) -> AdmissionGate:
+    """An endpoint's gate under GLOBAL_GATE, sized by {NAME}_MAX_RUNNING and {NAME}_MAX_QUEUED"""
+    prefix = name.upper()
+    return AdmissionGate(
+        name,
+        max_running=int(os.getenv(f"{prefix}_MAX_RUNNING", str(max_running))),
+        max_queued=int(os.getenv(f"{prefix}_MAX_QUEUED", str(max_queued))),
+        queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "60")),
+        expected_seconds=expected_seconds,
+        parent=GLOBAL_GATE
+    )
+
+
+# Requests admitted (running or queued) across every gated endpoint
+GLOBAL_GATE = AdmissionGate("global", max_running=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64")), expected_seconds=60.0)
+# Article pipelines: scrape, LLM prompts, fal images (and a Wan video job)
+GENERATE_GATE = admission_gate("generate", max_running=4, max_queued=16, expected_seconds=60.0)
+GENERATE_STYLES_GATE = admission_gate("generate_styles", max_running=2, max_queued=8, expected_seconds=120.0)
+# LLM code generation and a Manim render
+MANIM_GATE = admission_gate("manim", max_running=2, max_queued=8, expected_seconds=120.0)
+# One fal image
+IMAGE_GATE = admission_gate("generate_image", max_running=8, max_queued=32, expected_seconds=10.0)
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+
+
+def sha256_text(text: str) -> str:
+    """Return the hex sha256 digest of a string"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def atomic_write_text(path, text: str) -> Path:
+    """Write text to a file atomically
+
+    The content is written to a temporary file in the same directory and then
+    renamed over the target, so readers never see a partially written file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return path
+
+
+def _list_files(root: Path):
+    files = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            file_path = Path(dirpath) / name
+            try:
+                stat = file_path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, file_path))
+    return files
+
+
+def _prune_empty_dirs(root: Path):
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        if Path(dirpath) == root:
+            continue
+        if not dirnames and not filenames:
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+
+
+def gc_directory(root, max_bytes: int | None = None, max_age_seconds: float | None = None, protect=()) -> dict:
+    """Garbage-collect files under a directory to stay within a size/age budget
+
+    Files older than max_age_seconds are removed first, then the oldest
+    remaining files are removed until the directory fits in max_bytes.
+
+    Args:
+        root: Directory to collect
+        max_bytes: Maximum total size of the directory (None for no limit)
+        max_age_seconds: Maximum file age based on mtime (None for no limit)
+        protect: Paths that must never be removed (e.g. the render in progress)
+
+    Returns:
+        Dict with the number of removed files and freed bytes
+    """
+    root = Path(root)
+    stats = {"removed_files": 0, "freed_bytes": 0}
+    if not root.exists():
+        return stats
+
+    protected = {Path(p).resolve() for p in protect}
+    now = time.time()
+    files = sorted(_list_files(root), key=lambda f: f[0])
+    total = sum(size for _, size, _ in files)
+    kept = []
+
+    def remove(size, file_path):
+        nonlocal total
+        try:
+            file_path.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+        stats["removed_files"] += 1
+        stats["freed_bytes"] += size
+
+    for mtime, size, file_path in files:
+        if file_path.resolve() in protected:
+            kept.append((mtime, size, file_path))
+        elif max_age_seconds is not None and now - mtime > max_age_seconds:
+            remove(size, file_path)
+        else:
+            kept.append((mtime, size, file_path))
+
+    if max_bytes is not None:
+        for mtime, size, file_path in kept:
+            if total <= max_bytes:
+                break
+            if file_path.resolve() in protected:
+                continue
+            remove(size, file_path)
+
+    _prune_empty_dirs(root)
+    return stats
+
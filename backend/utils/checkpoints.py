@@ -0,0 +1,75 @@
+import asyncio
+import os
+import uuid
+
+from db.db import delete_checkpoints, delete_stale_checkpoints, get_checkpoints, save_checkpoint
+from utils.artifacts import sha256_text
+
+CHECKPOINT_MAX_AGE_SECONDS = float(os.getenv("RUN_CHECKPOINT_MAX_AGE_HOURS", "24")) * 3600
+
+
+def run_key_for(*parts) -> str:
+    """Key of a generation run from its inputs (e.g. kind, URL, style, user)
+
+    A retry of the same request maps to the same key and resumes the run.
+    """
+    return sha256_text("\x1f".join("" if part is None else str(part).strip() for part in parts))
+
+
+class RunCheckpoints:
+    """Saved stage results of one generation run
+
+    Each stage's result is stored in run_checkpoints as soon as it completes;
+    a retried run with the same key gets them back instead of paying for the
+    LLM and fal calls again. Every run also gets a run_id that DB writes are
+    keyed by, so a resumed run updates the rows the failed attempt created
+    instead of adding new ones. Checkpoints are dropped once the run
+    completes, and ignored after CHECKPOINT_MAX_AGE_SECONDS.
+    """
+
+    def __init__(self, run_key: str, stages: dict):
+        self.run_key = run_key
+        self._stages = stages
+        self._save_lock = asyncio.Lock()
+        self.run_id = stages.get("run", {}).get("run_id")
+
+    @classmethod
+    async def open(cls, run_key: str, max_age_seconds: float = CHECKPOINT_MAX_AGE_SECONDS) -> "RunCheckpoints":
+        await delete_stale_checkpoints(max_age_seconds)
+        stages = await get_checkpoints(run_key, max_age_seconds)
+        if "run" not in stages:
+            # Stages saved without their run are from an expired attempt
+            stages = {}
+        checkpoints = cls(run_key, stages)
+        if checkpoints.run_id:
+            resumed = [stage for stage in stages if stage != "run"]
+            print(f"Resuming run {checkpoints.run_id} with saved stages: {', '.join(resumed) or 'none'}")
+        else:
+            checkpoints.run_id = uuid.uuid4().hex
+            await checkpoints.save("run", {"run_id": checkpoints.run_id})
+        return checkpoints
+
+    def get(self, stage: str):
+        """Saved result of a stage, or None"""
+        return self._stages.get(stage)
+
+    async def save(self, stage: str, data):
+        # Serialized, so concurrent saves of a stage land in the order made
+        async with self._save_lock:
+            self._stages[stage] = data
+            await save_checkpoint(self.run_key, stage, data)
+
+    async def run(self, stage: str, fn):
+        """Result of a stage: the saved one, or `await fn()` (saved unless empty)"""
+        saved = self.get(stage)
+        if saved:
+            print(f"Using saved {stage} for run {self.run_id}")
+            return saved
+        result = await fn()
+        if result:
+            await self.save(stage, result)
+        return result
+
+    async def complete(self):
+        """Drop the checkpoints: the next run with this key starts fresh"""
+        await delete_checkpoints(self.run_key)
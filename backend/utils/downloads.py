@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:
+    import httpx
+
+from utils.artifacts import gc_directory, sha256_text
+
+_client: "httpx.AsyncClient | None" = None
+
+
+def get_http_client() -> "httpx.AsyncClient":
+    """Shared async HTTP client so downloads reuse pooled connections"""
+    global _client
+    if _client is None or _client.is_closed:
+        import httpx
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            follow_redirects=True
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class DownloadCache:
+    """Local content-addressed cache of downloaded files
+
+    Files are stored once under blobs/<sha256 of content><ext>; index/<sha256
+    of url> records which blob a URL resolved to, so a repeated download of
+    the same URL is served from disk and identical content is stored once.
+    """
+
+    def __init__(self, cache_dir, max_bytes: int | None = None):
+        self.cache_dir = Path(cache_dir)
+        self.blob_dir = self.cache_dir / "blobs"
+        self.index_dir = self.cache_dir / "index"
+        self.max_bytes = max_bytes
+
+    def lookup(self, url: str) -> Path | None:
+        """Get the cached file for a URL, if it is still on disk"""
+        try:
+            blob_name = (self.index_dir / sha256_text(url)).read_text().strip()
+        except FileNotFoundError:
+            return None
+        blob_path = self.blob_dir / blob_name
+        if not blob_path.exists():
+            return None
+        # Keep recently used blobs safe from eviction
+        os.utime(blob_path)
+        return blob_path
+
+    async def fetch(self, url: str, chunk_size: int = 64 * 1024) -> Path:
+        """Download a URL into the cache (streamed to disk) unless it is cached
+
+        Returns:
+            Path of the cached file
+        """
+        cached = self.lookup(url)
+        if cached is not None:
+            print(f"Download cache hit: {url}")
+            return cached
+
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        suffix = Path(urlparse(url).path).suffix or ".bin"
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, prefix=".download.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async with get_http_client().stream("GET", url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes(chunk_size):
+                        digest.update(chunk)
+                        f.write(chunk)
+            blob_name = f"{digest.hexdigest()}{suffix}"
+            os.replace(tmp_path, self.blob_dir / blob_name)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        index_file = self.index_dir / sha256_text(url)
+        index_tmp = index_file.with_suffix(f".{os.getpid()}.tmp")
+        index_tmp.write_text(blob_name)
+        os.replace(index_tmp, index_file)
+        return self.blob_dir / blob_name
+
+    async def fetch_many(self, urls: list[str], concurrency: int = 8) -> list[Path]:
+        """Download several URLs concurrently, preserving their order"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch_one(url):
+            async with semaphore:
+                return await self.fetch(url)
+
+        paths = await asyncio.gather(*(fetch_one(url) for url in urls))
+        if self.max_bytes is not None:
+            gc_directory(self.blob_dir, max_bytes=self.max_bytes, protect=paths)
+        return paths
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import time
+
+from utils.metrics import Gauge, Histogram, register
+from utils.scheduler import FairQueue, current_work
+
+LIMIT_WAITING = register(Gauge(
+    "astrosmurf_limit_waiting", "Calls waiting for a slot under a global concurrency limit", ("limit", "lane")
+))
+LIMIT_IN_USE = register(Gauge(
+    "astrosmurf_limit_in_use", "Calls holding a slot under a global concurrency limit", ("limit",)
+))
+LIMIT_WAIT = register(Histogram(
+    "astrosmurf_limit_wait_seconds", "Time calls waited for a slot under a global concurrency limit", ("limit", "lane")
+))
+
+
+class ConcurrencyLimit:
+    """Process-wide cap on concurrent calls to one external service
+
+    Use as `async with LLM_LIMIT:` around the call. However many requests,
+    styles or concepts fan out at once, at most `limit` calls run; the rest
+    wait their turn (counted in astrosmurf_limit_waiting). Turns are handed
+    out by a FairQueue (utils/scheduler.py) on the caller's work_context:
+    interactive work first, and users sharing each lane fairly.
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.in_use = 0
+        self._waiters = FairQueue()
+        self._loop = None
+
+    def _check_loop(self):
+        # Reset on first use, and again if the event loop changes (tests)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self.in_use = 0
+            self._waiters = FairQueue(self._waiters.weights)
+            self._loop = loop
+        return loop
+
+    async def __aenter__(self):
+        loop = self._check_loop()
+        user_id, lane = current_work()
+        waited_from = time.perf_counter()
+        if self.in_use < self.limit and not len(self._waiters):
+            self.in_use += 1
+        else:
+            waiter = loop.create_future()
+            self._waiters.push(waiter, user_id, lane)
+            LIMIT_WAITING.inc(limit=self.name, lane=lane)
+            try:
+                await waiter
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    # Handed a slot just as we were cancelled: pass it on
+                    self._release()
+                else:
+                    self._waiters.discard(waiter)
+                raise
+            finally:
+                LIMIT_WAITING.dec(limit=self.name, lane=lane)
+        LIMIT_WAIT.observe(time.perf_counter() - waited_from, limit=self.name, lane=lane)
+        LIMIT_IN_USE.inc(limit=self.name)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        LIMIT_IN_USE.dec(limit=self.name)
+        self._release()
+        return False
+
+    def _release(self):
+        # Hand the slot straight to the next waiter in fair order
+        while len(self._waiters):
+            waiter = self._waiters.pop()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_use -= 1
+
+
+# NVIDIA chat completions (decomposition, image prompts, Manim code)
+LLM_LIMIT = ConcurrencyLimit("llm", int(os.getenv("LLM_CONCURRENCY", "8")))
+# fal image generations
+FAL_LIMIT = ConcurrencyLimit("fal", int(os.getenv("FAL_CONCURRENCY", "8")))
+# Manim renders (warm workers or the CLI); match MANIM_WORKERS when set
+RENDER_LIMIT = ConcurrencyLimit("render", int(os.getenv("RENDER_CONCURRENCY", "2")))
@@ -0,0 +1,270 @@
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets (seconds) cover fast DB calls up to multi-minute renders
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_LABELS = ("stage", "model", "style")
+
+_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A labelled metric rendered in the Prometheus text format"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with _lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with _lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def count(self, **labels) -> int:
+        with _lock:
+            series = self._values.get(self._key(labels))
+            return series["count"] if series else 0
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with _lock:
+            items = sorted((key, dict(series, counts=list(series["counts"]))) for key, series in self._values.items())
+        for key, series in items:
+            for bound, count in zip(self.buckets, series["counts"]):
+                labels = _format_labels(self.label_names, key, [("le", _format_number(bound))])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(series['sum'])}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+REGISTRY = []
+
+
+def register(metric: Metric) -> Metric:
+    REGISTRY.append(metric)
+    return metric
+
+
+STAGE_DURATION = register(Histogram(
+    "astrosmurf_stage_duration_seconds", "Latency of pipeline stages", STAGE_LABELS
+))
+STAGE_IN_FLIGHT = register(Gauge(
+    "astrosmurf_stage_in_flight", "Pipeline stages currently running", STAGE_LABELS
+))
+STAGE_ERRORS = register(Counter(
+    "astrosmurf_stage_errors_total", "Pipeline stages that raised", STAGE_LABELS + ("error",)
+))
+CONCEPTS_DIFFED = register(Counter(
+    "astrosmurf_update_concepts_total", "Concepts of updated articles by outcome (unchanged, near_duplicate, regenerated)", ("outcome",)
+))
+TIME_TO_FIRST_IMAGE = register(Histogram(
+    "astrosmurf_time_to_first_image_seconds", "From the start of a /generate run to its first stored image", ("style",)
+))
+TEX_CACHE_LOOKUPS = register(Counter(
+    "astrosmurf_tex_cache_lookups_total", "TeX expressions manim renders looked up in the shared TeX cache", ("outcome",)
+))
+UPLOADS = register(Counter(
+    "astrosmurf_uploads_total", "Files uploaded to S3"
+))
+UPLOAD_BYTES = register(Counter(
+    "astrosmurf_upload_bytes_total", "Bytes uploaded to S3"
+))
+UPLOADS_DEDUPED = register(Counter(
+    "astrosmurf_uploads_deduped_total", "S3 uploads skipped because the content was already stored"
+))
+UPLOAD_BYTES_SAVED = register(Counter(
+    "astrosmurf_upload_bytes_saved_total", "Bytes not uploaded to S3 thanks to content dedupe"
+))
+
+
+def render_metrics() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Stages too fine-grained to count as "the stage a request is in"
+QUIET_STAGES = ("db",)
+
+
+class RequestTimings:
+    """Per-stage time spent on behalf of one request
+
+    Stages running in parallel (e.g. one fal call per concept) are summed, so
+    the stage totals can exceed the request's wall time. on_change, if set,
+    is called (with no arguments) whenever a stage starts or finishes.
+    """
+
+    def __init__(self, on_change=None):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.current_stage = None
+        self.on_change = on_change
+
+    def _entry(self, stage: str) -> dict:
+        return self.stages.setdefault(stage, {"seconds": 0.0, "count": 0, "errors": 0, "running": 0})
+
+    def start(self, stage: str):
+        self._entry(stage)["running"] += 1
+        if stage not in QUIET_STAGES:
+            self.current_stage = stage
+        self._changed()
+
+    def add(self, stage: str, seconds: float, error: bool):
+        entry = self._entry(stage)
+        entry["seconds"] += seconds
+        entry["count"] += 1
+        entry["errors"] += int(error)
+        entry["running"] = max(0, entry["running"] - 1)
+        self._changed()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def as_dict(self) -> dict:
+        return {
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+            "current_stage": self.current_stage,
+            "stages": {
+                stage: dict(entry, seconds=round(entry["seconds"], 4))
+                for stage, entry in self.stages.items()
+            },
+        }
+
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def request_timings(on_change=None):
+    """Collect the spans of everything run inside the block (including tasks it starts)"""
+    timings = RequestTimings(on_change=on_change)
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+class Span:
+    """Times one run of a pipeline stage
+
+    Use as a (sync or async) context manager. Records the stage latency
+    histogram, the in-flight gauge and, if the block raises, the error
+    counter, all labelled by stage, model and style. Cancellation is not
+    counted as an error.
+    """
+
+    def __init__(self, stage: str, model: str = "", style: str = ""):
+        self.labels = {"stage": stage, "model": model or "", "style": style or ""}
+        self.start = None
+        self.duration = None
+        self._timings = None
+
+    def __enter__(self) -> "Span":
+        STAGE_IN_FLIGHT.inc(**self.labels)
+        self._timings = _request_timings.get()
+        if self._timings is not None:
+            self._timings.start(self.labels["stage"])
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        STAGE_IN_FLIGHT.dec(**self.labels)
+        STAGE_DURATION.observe(self.duration, **self.labels)
+        error = exc_type is not None and not issubclass(exc_type, asyncio.CancelledError)
+        if error:
+            STAGE_ERRORS.inc(error=exc_type.__name__, **self.labels)
+        if self._timings is not None:
+            self._timings.add(self.labels["stage"], self.duration, error)
+        return False
+
+    async def __aenter__(self) -> "Span":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def span(stage: str, model: str = "", style: str = "") -> Span:
+    """Time a pipeline stage: `with span("fal", model=...):` or `async with ...`"""
+    return Span(stage, model=model, style=style)
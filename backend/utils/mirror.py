@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import os
+import traceback
+from pathlib import Path
+from urllib.parse import urlparse
+
+from db.db import update_media_url
+from utils.artifacts import sha256_text
+from utils.downloads import get_http_client
+from utils.metrics import span
+from utils.s3_upload import MB, get_s3_client, get_s3_url, guess_content_type, object_exists, record_upload, reserve_key
+
+# S3 requires every part except the last to be at least 5 MB
+MIRROR_PART_SIZE = max(5, int(os.getenv("MIRROR_PART_SIZE_MB", "8"))) * MB
+
+
+async def mirror_url_to_s3(url: str, s3_folder: str = "fal_images", bucket_name: str = None) -> str:
+    """Stream a remote file straight into S3 without a local temp file
+
+    At most one part (MIRROR_PART_SIZE) is held in memory. Files that fit in
+    one part are stored under their content hash (and skipped if already
+    there); larger files go through a multipart upload keyed by the hash of
+    the source URL, since the content hash is only known at the end.
+
+    Returns:
+        Public URL of the S3 object
+    """
+    bucket_name = bucket_name or os.getenv("sa_aws_bucket")
+    if not bucket_name:
+        raise ValueError("S3 bucket name not provided and sa_aws_bucket env variable not set")
+
+    client = get_s3_client()
+    suffix = Path(urlparse(url).path).suffix.lower() or ".bin"
+
+    async with get_http_client().stream("GET", url) as response:
+        response.raise_for_status()
+        content_type = response.headers.get("content-type") or guess_content_type(f"file{suffix}")
+        chunks = response.aiter_bytes(MB)
+
+        buffer = bytearray()
+        async for chunk in chunks:
+            buffer.extend(chunk)
+            if len(buffer) >= MIRROR_PART_SIZE:
+                break
+        else:
+            # The whole file fits in one part
+            s3_key = f"{s3_folder}/{hashlib.sha256(buffer).hexdigest()}{suffix}"
+            await reserve_key(bucket_name, s3_key)
+            if await asyncio.to_thread(object_exists, bucket_name, s3_key):
+                record_upload(len(buffer), deduplicated=True)
+            else:
+                await asyncio.to_thread(
+                    client.put_object,
+                    Bucket=bucket_name,
+                    Key=s3_key,
+                    Body=bytes(buffer),
+                    ContentType=content_type
+                )
+                record_upload(len(buffer), deduplicated=False)
+            return get_s3_url(bucket_name, s3_key)
+
+        s3_key = f"{s3_folder}/url-{sha256_text(url)}{suffix}"
+        await reserve_key(bucket_name, s3_key)
+        upload = await asyncio.to_thread(
+            client.create_multipart_upload,
+            Bucket=bucket_name,
+            Key=s3_key,
+            ContentType=content_type
+        )
+        upload_id = upload["UploadId"]
+        parts = []
+        total = 0
+
+        async def send_part(data: bytes):
+            nonlocal total
+            part_number = len(parts) + 1
+            result = await asyncio.to_thread(
+                client.upload_part,
+                Bucket=bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=data
+            )
+            parts.append({"ETag": result["ETag"], "PartNumber": part_number})
+            total += len(data)
+
+        try:
+            async for chunk in chunks:
+                buffer.extend(chunk)
+                while len(buffer) >= MIRROR_PART_SIZE:
+                    await send_part(bytes(buffer[:MIRROR_PART_SIZE]))
+                    del buffer[:MIRROR_PART_SIZE]
+            if buffer or not parts:
+                await send_part(bytes(buffer))
+            await asyncio.to_thread(
+                client.complete_multipart_upload,
+                Bucket=bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+        except BaseException:
+            await asyncio.to_thread(client.abort_multipart_upload, Bucket=bucket_name, Key=s3_key, UploadId=upload_id)
+            raise
+
+    record_upload(total, deduplicated=False)
+    return get_s3_url(bucket_name, s3_key)
+
+
+class MediaMirror:
+    """Background stage that copies generated media from fal to S3
+
+    fal URLs are ephemeral; once a copy finishes the media row is pointed at
+    the durable S3 URL. At most `concurrency` copies run at a time.
+    """
+
+    def __init__(self, concurrency: int = 4, attempts: int = 3, s3_folder: str = "fal_images"):
+        self.concurrency = concurrency
+        self.attempts = attempts
+        self.s3_folder = s3_folder
+        self._semaphore = None
+        self._tasks = set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(os.getenv("sa_aws_bucket")) and os.getenv("MIRROR_TO_S3", "1") == "1"
+
+    def schedule(self, media_id: int, url: str):
+        """Mirror a media row's URL in the background (no-op if S3 isn't configured)"""
+        if not self.enabled:
+            return None
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        task = asyncio.create_task(self._mirror(media_id, url))
+        # Keep a reference so the task isn't garbage-collected mid-copy
+        self._tasks.add(task)
+        task.add_done_callback(lambda task: self._finished(media_id, task))
+        return task
+
+    def _finished(self, media_id: int, task: asyncio.Task):
+        self._tasks.discard(task)
+        # Nobody awaits the task: report what _mirror didn't handle itself
+        if task.cancelled():
+            print(f"Mirroring media {media_id} was cancelled")
+        elif task.exception() is not None:
+            print(f"Mirroring media {media_id} crashed: {task.exception()!r}")
+            traceback.print_exception(task.exception())
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def join(self):
+        """Wait for every scheduled copy to finish"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def _mirror(self, media_id: int, url: str):
+        async with self._semaphore:
+            for attempt in range(1, self.attempts + 1):
+                try:
+                    async with span("s3_mirror", model=self.s3_folder):
+                        s3_url = await mirror_url_to_s3(url, s3_folder=self.s3_folder)
+                    await update_media_url(media_id, s3_url)
+                    print(f"Mirrored media {media_id} to {s3_url}")
+                    return s3_url
+                except Exception as e:
+                    print(f"Mirroring media {media_id} failed (attempt {attempt}/{self.attempts}): {e}")
+                    if attempt == self.attempts:
+                        traceback.print_exc()
+                        return None
+                    await asyncio.sleep(2 ** attempt)
+
+
+MEDIA_MIRROR = MediaMirror(concurrency=int(os.getenv("MIRROR_CONCURRENCY", "4")))
@@ -0,0 +1,63 @@
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+
+
+class ProgressFeed:
+    """Events published by one pipeline run, for streaming responses
+
+    Every event is kept, so a subscriber that arrives late (e.g. a request
+    that joined a run already in flight) gets the earlier events replayed
+    before the live ones. Each event is a dict with its name, the seconds
+    since the feed was created and its data.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.events = []
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    def emit(self, event: str, **data):
+        if self.closed:
+            return
+        self.events.append({"event": event, "elapsed_seconds": round(time.perf_counter() - self.started, 4), **data})
+        self._changed.set()
+
+    def close(self):
+        """No more events: subscribers finish once they have read them all"""
+        self.closed = True
+        self._changed.set()
+
+    async def subscribe(self):
+        """Yield every event, past and future, until the feed is closed"""
+        sent = 0
+        while True:
+            while sent < len(self.events):
+                sent += 1
+                yield self.events[sent - 1]
+            if self.closed:
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+
+_progress_feed = contextvars.ContextVar("progress_feed", default=None)
+
+
+@contextmanager
+def progress_feed(feed: ProgressFeed):
+    """Publish the progress of everything run inside the block (including tasks it starts) on feed"""
+    token = _progress_feed.set(feed)
+    try:
+        yield feed
+    finally:
+        _progress_feed.reset(token)
+
+
+def emit_progress(event: str, **data):
+    """Publish a pipeline event to the current run's feed, if anyone is listening"""
+    feed = _progress_feed.get()
+    if feed is not None:
+        feed.emit(event, **data)
@@ -0,0 +1,70 @@
+import json
+import threading
+import time
+from pathlib import Path
+
+from utils.artifacts import atomic_write_text
+
+
+class RenderCache:
+    """Maps a scene code hash and render quality to its video and S3 URL
+
+    The index is a small JSON file so it survives restarts. Entries whose
+    local video was garbage-collected are still useful as long as the S3 URL
+    is known.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = Path(index_path)
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @staticmethod
+    def _key(code_hash: str, quality: str) -> str:
+        return f"{code_hash}:{quality}"
+
+    def get(self, code_hash: str, quality: str) -> dict | None:
+        """Get the cached render for a code hash and quality
+
+        Returns:
+            Dict with video_path (None if no longer on disk) and s3_url,
+            or None if nothing usable is cached
+        """
+        with self._lock:
+            key = self._key(code_hash, quality)
+            if key not in self._entries:
+                # Another worker process may have rendered it since we loaded
+                self._entries = self._load()
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            entry = dict(entry)
+
+        video_path = entry.get("video_path")
+        if video_path and not Path(video_path).exists():
+            entry["video_path"] = None
+        if not entry.get("video_path") and not entry.get("s3_url"):
+            return None
+        return entry
+
+    def put(self, code_hash: str, quality: str, video_path: str | None = None, s3_url: str | None = None) -> dict:
+        """Record a render, merging with any existing entry"""
+        with self._lock:
+            key = self._key(code_hash, quality)
+            self._entries = self._load()
+            entry = dict(self._entries.get(key, {}))
+            if video_path is not None:
+                entry["video_path"] = str(video_path)
+            if s3_url is not None:
+                entry["s3_url"] = s3_url
+            entry["updated_at"] = time.time()
+            self._entries[key] = entry
+            atomic_write_text(self.index_path, json.dumps(self._entries, indent=2))
+            return dict(entry)
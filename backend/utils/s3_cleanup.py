@@ -0,0 +1,151 @@
+import asyncio
+import os
+import traceback
+from datetime import datetime, timedelta, timezone
+
+from db.db import add_tombstones, claim_due_tombstones, delete_tombstones, get_referenced_media_urls, retry_tombstones
+from utils.s3_upload import get_s3_client, get_s3_url, s3_key_from_url
+
+# DeleteObjects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+
+# Tombstones this young are left alone: an upload that reused the object
+# just before it was tombstoned may not have stored its media row yet
+TOMBSTONE_GRACE_SECONDS = float(os.getenv("S3_TOMBSTONE_GRACE_SECONDS", "300"))
+
+# Folders written by this backend (the reconciliation sweep only looks here)
+MANAGED_PREFIXES = ("manim_videos/", "wan_videos/", "fal_images/")
+
+
+async def purge_tombstones(bucket_name: str = None, batch_size: int = DELETE_BATCH_SIZE) -> dict:
+    """Delete the S3 objects of due tombstones in DeleteObjects batches
+
+    Objects that are still referenced by another media row (content-addressed
+    keys are shared) and URLs outside the bucket are dropped from the queue
+    without touching S3. Failed deletions are retried with backoff.
+
+    Tombstones are claimed before their references are checked, and uploads
+    of a claimed key wait for the purge to finish (utils.s3_upload.reserve_key),
+    so no upload can reuse an object between the check and the delete.
+
+    Returns:
+        Dict with the number of deleted, skipped and failed objects
+    """
+    bucket_name = bucket_name or os.getenv("sa_aws_bucket")
+    stats = {"deleted": 0, "skipped": 0, "failed": 0}
+    client = get_s3_client()
+
+    while True:
+        tombstones = await claim_due_tombstones(limit=batch_size, grace_seconds=TOMBSTONE_GRACE_SECONDS)
+        if not tombstones:
+            return stats
+
+        still_used = await get_referenced_media_urls([t["media_url"] for t in tombstones])
+        keys = {}
+        skipped = []
+        for tombstone in tombstones:
+            key = s3_key_from_url(bucket_name, tombstone["media_url"])
+            if key is None or tombstone["media_url"] in still_used:
+                skipped.append(tombstone["id"])
+            else:
+                keys.setdefault(key, []).append(tombstone["id"])
+        if skipped:
+            await delete_tombstones(skipped)
+            stats["skipped"] += len(skipped)
+        if not keys:
+            continue
+
+        try:
+            response = await asyncio.to_thread(
+                client.delete_objects,
+                Bucket=bucket_name,
+                Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+            )
+        except Exception as e:
+            print(f"S3 batch delete failed: {e}")
+            await retry_tombstones([i for ids in keys.values() for i in ids], str(e))
+            stats["failed"] += len(keys)
+            # Back off until the next run rather than hammering S3
+            return stats
+
+        # Quiet mode only reports the keys that failed
+        errors = {error["Key"]: error.get("Message", error.get("Code", "")) for error in response.get("Errors", [])}
+        for key, message in errors.items():
+            await retry_tombstones(keys[key], message)
+        done = [i for key, ids in keys.items() if key not in errors for i in ids]
+        if done:
+            await delete_tombstones(done)
+        stats["deleted"] += len(keys) - len(errors)
+        stats["failed"] += len(errors)
+        print(f"S3 cleanup: deleted {len(keys) - len(errors)} objects, {len(errors)} failed")
+
+
+async def reconcile_bucket(bucket_name: str = None, grace: timedelta = timedelta(days=1)) -> int:
+    """Find objects in the managed folders that no media row references
+
+    Objects younger than the grace period are ignored, since their media row
+    may not have been written yet. Strays are queued as tombstones.
+
+    Returns:
+        Number of stray objects found
+    """
+    bucket_name = bucket_name or os.getenv("sa_aws_bucket")
+    client = get_s3_client()
+    cutoff = datetime.now(timezone.utc) - grace
+    strays = 0
+
+    for prefix in MANAGED_PREFIXES:
+        # One list page (up to 1000 keys) in memory at a time
+        pages = iter(client.get_paginator("list_objects_v2").paginate(Bucket=bucket_name, Prefix=prefix))
+        while (page := await asyncio.to_thread(next, pages, None)) is not None:
+            urls = [get_s3_url(bucket_name, obj["Key"]) for obj in page.get("Contents", []) if obj["LastModified"] < cutoff]
+            if not urls:
+                continue
+            referenced = await get_referenced_media_urls(urls)
+            orphaned = [url for url in urls if url not in referenced]
+            if orphaned:
+                await add_tombstones(orphaned)
+                strays += len(orphaned)
+
+    print(f"S3 reconciliation found {strays} stray objects")
+    return strays
+
+
+class S3Janitor:
+    """Periodically purges tombstones and reconciles the bucket"""
+
+    def __init__(self, purge_interval: float = 60, reconcile_interval: float = 24 * 3600):
+        self.purge_interval = purge_interval
+        self.reconcile_interval = reconcile_interval
+        self._tasks = []
+
+    def start(self):
+        """Start the periodic loops (must be called from the running event loop)"""
+        if self._tasks or not os.getenv("sa_aws_bucket"):
+            return
+        self._tasks = [
+            asyncio.create_task(self._every(self.purge_interval, purge_tombstones)),
+            asyncio.create_task(self._every(self.reconcile_interval, reconcile_bucket)),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @staticmethod
+    async def _every(interval, fn):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await fn()
+            except Exception as e:
+                print(f"S3 janitor {fn.__name__} failed: {e}")
+                traceback.print_exc()
+
+
+S3_JANITOR = S3Janitor(
+    purge_interval=float(os.getenv("S3_PURGE_INTERVAL_SECONDS", "60")),
+    reconcile_interval=float(os.getenv("S3_RECONCILE_INTERVAL_HOURS", "24")) * 3600
+)
@@ -1,71 +1,240 @@
+import asyncio
+import hashlib
+import mimetypes
 import os
-import boto3
+import threading
+from functools import lru_cache
 from pathlib import Path
-from datetime import datetime
-from botocore.exceptions import ClientError
 
-def upload_to_s3(local_file_path: str, bucket_name: str = None, s3_folder: str = "manim-videos") -> str:
+from utils.metrics import UPLOAD_BYTES, UPLOAD_BYTES_SAVED, UPLOADS, UPLOADS_DEDUPED, span
+
+MB = 1024 ** 2
+
+# Multipart tuning: files above the threshold are uploaded in parallel parts
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "16")) * MB
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNK_MB", "16")) * MB
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+
+# Types mimetypes doesn't know everywhere
+CONTENT_TYPES = {
+    ".mp4": "video/mp4",
+    ".webp": "image/webp",
+    ".webm": "video/webm",
+}
+
+
+def record_upload(size: int, deduplicated: bool):
+    """Count an upload (or one skipped by dedupe) in /metrics"""
+    if deduplicated:
+        UPLOADS_DEDUPED.inc()
+        UPLOAD_BYTES_SAVED.inc(size)
+    else:
+        UPLOADS.inc()
+        UPLOAD_BYTES.inc(size)
+
+
+@lru_cache(maxsize=1)
+def get_transfer_config():
+    """boto3 TransferConfig for uploads (boto3 is imported on first use)"""
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+        max_concurrency=S3_MAX_CONCURRENCY,
+        use_threads=True
+    )
+
+
+@lru_cache(maxsize=1)
+def get_s3_client():
+    """Shared S3 client (boto3 clients are thread-safe and pool connections)"""
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client(
+        's3',
+        aws_access_key_id=os.getenv("sa_aws_access_key_id"),
+        aws_secret_access_key=os.getenv("sa_aws_secret_access_key"),
+        aws_session_token=os.getenv("sa_aws_session_token"),  # Add session token support
+        region_name=os.getenv("AWS_REGION", "us-east-1"),
+        # Enough pooled connections for every concurrent multipart part
+        config=Config(max_pool_connections=max(10, S3_MAX_CONCURRENCY * 2))
+    )
+
+
+def guess_content_type(file_name: str) -> str:
+    """Content type for an upload based on the file extension"""
+    suffix = Path(file_name).suffix.lower()
+    if suffix in CONTENT_TYPES:
+        return CONTENT_TYPES[suffix]
+    content_type, _ = mimetypes.guess_type(file_name)
+    return content_type or "application/octet-stream"
+
+
+def sha256_file(path: str, chunk_size: int = MB) -> str:
+    """Hex sha256 digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_addressed_key(local_file_path: str, s3_folder: str) -> str:
+    """S3 key derived from the file content: <folder>/<sha256><ext>"""
+    suffix = Path(local_file_path).suffix.lower()
+    return f"{s3_folder}/{sha256_file(local_file_path)}{suffix}"
+
+
+def object_exists(bucket_name: str, s3_key: str) -> bool:
+    """HEAD an object to check whether it is already stored"""
+    from botocore.exceptions import ClientError
+
+    try:
+        get_s3_client().head_object(Bucket=bucket_name, Key=s3_key)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+
+def get_s3_url(bucket_name: str, s3_key: str) -> str:
+    """Public URL of an object: https://{bucket}.s3.{region}.amazonaws.com/{key}"""
+    region = os.getenv("AWS_REGION", "us-east-1")
+    return f"https://{bucket_name}.s3.{region}.amazonaws.com/{s3_key}"
+
+
+def s3_key_from_url(bucket_name: str, url: str) -> str | None:
+    """Inverse of get_s3_url: the object key, or None if the URL isn't in the bucket"""
+    prefix = get_s3_url(bucket_name, "")
+    if not url or not url.startswith(prefix):
+        return None
+    return url[len(prefix):] or None
+
+
+def url_exists(url: str, bucket_name: str = None) -> bool:
+    """Whether a URL from get_s3_url still names an object in the bucket"""
+    bucket_name = bucket_name or os.getenv("sa_aws_bucket")
+    key = s3_key_from_url(bucket_name, url) if bucket_name else None
+    return key is not None and object_exists(bucket_name, key)
+
+
+class _ProgressTracker:
+    """Turns boto3's per-chunk byte counts into (sent, total) progress calls"""
+
+    def __init__(self, total: int, progress):
+        self.total = total
+        self.sent = 0
+        self.progress = progress
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_amount):
+        with self._lock:
+            self.sent += bytes_amount
+            sent = self.sent
+        self.progress(sent, self.total)
+
+
+# How often an upload checks whether a purge of its key has finished
+PURGE_POLL_SECONDS = 1.0
+PURGE_WAIT_SECONDS = 300
+
+
+async def reserve_url(url: str):
+    """Keep the S3 cleanup from deleting an object a new upload is about to use
+
+    A pending tombstone of the URL is dropped, since the object is wanted
+    again. If the cleanup is deleting the object right now, wait until it is
+    done: the caller then stores it again instead of reusing it.
+    """
+    from db.db import release_tombstone
+
+    waited = 0.0
+    while await release_tombstone(url):
+        if waited >= PURGE_WAIT_SECONDS:
+            raise TimeoutError(f"{url} is still being purged")
+        await asyncio.sleep(PURGE_POLL_SECONDS)
+        waited += PURGE_POLL_SECONDS
+
+
+async def reserve_key(bucket_name: str, s3_key: str):
+    """reserve_url for a key in the bucket"""
+    await reserve_url(get_s3_url(bucket_name, s3_key))
+
+
+def upload_to_s3(local_file_path: str, bucket_name: str = None, s3_folder: str = "manim-videos", progress=None, s3_key: str = None) -> str:
     """
     Upload a file to S3 and return the public URL
-    
+
+    The key is derived from the file content, so identical files share one
+    object: if it already exists the transfer is skipped and the existing
+    URL is returned.
+
     Args:
         local_file_path: Path to the local file to upload
         bucket_name: S3 bucket name (defaults to env variable)
         s3_folder: Folder in S3 bucket (default: "manim-videos")
-    
+        progress: Optional callable(bytes_sent, total_bytes), called from
+            the transfer threads as parts are sent
+        s3_key: The file's content-addressed key, if already computed
+
     Returns:
         Public URL of the uploaded file
     """
     # Get bucket name from environment variable if not provided
     if bucket_name is None:
         bucket_name = os.getenv("sa_aws_bucket")
-    
+
     if not bucket_name:
         raise ValueError("S3 bucket name not provided and sa_aws_bucket env variable not set")
-    
+
     # Check if file exists
     if not os.path.exists(local_file_path):
         raise FileNotFoundError(f"File not found: {local_file_path}")
-    
-    # Generate S3 key (path in bucket)
+
+    from botocore.exceptions import ClientError
+
+    # Generate S3 key (path in bucket) from the content hash
     file_name = Path(local_file_path).name
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    s3_key = f"{s3_folder}/{timestamp}_{file_name}"
-    
-    # Initialize S3 client
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=os.getenv("sa_aws_access_key_id"),
-        aws_secret_access_key=os.getenv("sa_aws_secret_access_key"),
-        aws_session_token=os.getenv("sa_aws_session_token"),  # Add session token support
-        region_name=os.getenv("AWS_REGION", "us-east-1")
-    )
-    
+    file_size = os.path.getsize(local_file_path)
+    s3_key = s3_key or content_addressed_key(local_file_path, s3_folder)
+
     try:
+        if object_exists(bucket_name, s3_key):
+            record_upload(file_size, deduplicated=True)
+            s3_url = get_s3_url(bucket_name, s3_key)
+            print(f"Already in S3, skipped upload ({file_size} bytes saved): {s3_url}")
+            if progress is not None:
+                progress(file_size, file_size)
+            return s3_url
+
         # Upload file
         print(f"Uploading {local_file_path} to s3://{bucket_name}/{s3_key}")
-        
-        # Determine content type based on file extension
-        content_type = "video/mp4" if file_name.endswith(".mp4") else "application/octet-stream"
-        
-        s3_client.upload_file(
+
+        callback = None
+        if progress is not None:
+            callback = _ProgressTracker(file_size, progress)
+
+        get_s3_client().upload_file(
             local_file_path,
             bucket_name,
             s3_key,
             ExtraArgs={
-                'ContentType': content_type
+                'ContentType': guess_content_type(file_name)
                 # Note: ACL removed - use bucket policy for public access instead
-            }
+            },
+            Config=get_transfer_config(),
+            Callback=callback
         )
-        
-        # Construct public URL
-        # Format: https://{bucket}.s3.{region}.amazonaws.com/{key}
-        region = os.getenv("AWS_REGION", "us-east-1")
-        s3_url = f"https://{bucket_name}.s3.{region}.amazonaws.com/{s3_key}"
-        
+
+        record_upload(file_size, deduplicated=False)
+        s3_url = get_s3_url(bucket_name, s3_key)
+
         print(f"Upload successful! URL: {s3_url}")
         return s3_url
-        
+
     except ClientError as e:
         print(f"Error uploading to S3: {e}")
         raise
@@ -73,3 +242,20 @@ def upload_to_s3(local_file_path: str, bucket_name: str = None, s3_folder: str =
         print(f"Unexpected error: {e}")
         raise
 
+
+async def upload_to_s3_async(local_file_path: str, bucket_name: str = None, s3_folder: str = "manim-videos", progress=None) -> str:
+    """Upload a file to S3 without blocking the event loop
+
+    Same arguments as upload_to_s3. The progress callback is still invoked
+    from the transfer threads, so it must not touch asyncio objects directly.
+    The key is reserved first (see reserve_key), so a dedupe hit is never an
+    object the S3 cleanup is deleting.
+    """
+    bucket_name = bucket_name or os.getenv("sa_aws_bucket")
+    async with span("s3_upload", model=s3_folder):
+        if not bucket_name or not os.path.exists(local_file_path):
+            # upload_to_s3 reports the problem
+            return await asyncio.to_thread(upload_to_s3, local_file_path, bucket_name, s3_folder, progress)
+        s3_key = await asyncio.to_thread(content_addressed_key, local_file_path, s3_folder)
+        await reserve_key(bucket_name, s3_key)
+        return await asyncio.to_thread(upload_to_s3, local_file_path, bucket_name, s3_folder, progress, s3_key)
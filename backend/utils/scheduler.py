@@ -0,0 +1,107 @@
+import contextvars
+import heapq
+import itertools
+import os
+from contextlib import contextmanager
+
+# Priority lanes, served strictly in this order: single images someone is
+# waiting on, then article pipelines, then videos (Manim and Wan)
+INTERACTIVE_LANE = "interactive"
+ARTICLE_LANE = "article"
+VIDEO_LANE = "video"
+LANES = (INTERACTIVE_LANE, ARTICLE_LANE, VIDEO_LANE)
+
+
+def parse_user_weights(spec: str) -> dict:
+    """{user_id: weight} from "user_id:weight,..." (e.g. "1:4,7:0.5")"""
+    weights = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        user_id, weight = entry.split(":")
+        weights[int(user_id)] = float(weight)
+    return weights
+
+
+# Users' shares of each lane relative to each other (default 1)
+USER_WEIGHTS = parse_user_weights(os.getenv("SCHEDULER_USER_WEIGHTS", ""))
+
+_current_work = contextvars.ContextVar("current_work", default=(None, ARTICLE_LANE))
+
+
+@contextmanager
+def work_context(user_id=None, lane: str | None = None):
+    """Schedule everything run inside the block (including tasks it starts)
+    as `user_id`'s work in `lane`; either left out is inherited"""
+    current_user, current_lane = _current_work.get()
+    if lane is not None and lane not in LANES:
+        raise ValueError(f"Unknown lane: {lane}")
+    token = _current_work.set((current_user if user_id is None else user_id, lane or current_lane))
+    try:
+        yield
+    finally:
+        _current_work.reset(token)
+
+
+def current_work() -> tuple:
+    """(user_id, lane) the current work is scheduled as"""
+    return _current_work.get()
+
+
+class FairQueue:
+    """Items waiting for a shared resource, in weighted fair order
+
+    Lanes are strict priorities: an item is only served when every higher
+    lane is empty. Within a lane, users get turns in proportion to their
+    weight however many items each has queued (start-time fair queueing):
+    an item's tag is its user's previous tag (or the lane's virtual time,
+    if later) plus cost / weight, and the lowest tag goes first. A user
+    submitting a batch thus queues behind itself, not ahead of everyone.
+    """
+
+    def __init__(self, weights: dict = None):
+        self.weights = USER_WEIGHTS if weights is None else weights
+        self._lanes = {lane: [] for lane in LANES}
+        self._virtual_time = dict.fromkeys(LANES, 0.0)
+        # (lane, user_id) -> tag of the user's last queued item
+        self._tags = {}
+        self._order = itertools.count()
+
+    def __len__(self) -> int:
+        return sum(len(heap) for heap in self._lanes.values())
+
+    def push(self, item, user_id=None, lane: str = ARTICLE_LANE, cost: float = 1.0):
+        start = max(self._virtual_time[lane], self._tags.get((lane, user_id), 0.0))
+        tag = start + cost / self.weights.get(user_id, 1.0)
+        self._tags[(lane, user_id)] = tag
+        heapq.heappush(self._lanes[lane], (tag, next(self._order), start, item))
+
+    def pop(self):
+        """The next item to serve (IndexError if empty)"""
+        for lane in LANES:
+            heap = self._lanes[lane]
+            if heap:
+                _, _, start, item = heapq.heappop(heap)
+                self._virtual_time[lane] = max(self._virtual_time[lane], start)
+                if not heap:
+                    # Nobody is backlogged: past usage no longer counts
+                    self._forget(lane)
+                return item
+        raise IndexError("pop from an empty FairQueue")
+
+    def discard(self, item):
+        """Remove an item that no longer needs serving (e.g. a cancelled waiter)"""
+        for lane, heap in self._lanes.items():
+            for i, entry in enumerate(heap):
+                if entry[3] is item:
+                    heap.pop(i)
+                    heapq.heapify(heap)
+                    if not heap:
+                        self._forget(lane)
+                    return
+
+    def ordered(self) -> list:
+        """Queued items in the order they would be served now"""
+        return [entry[3] for lane in LANES for entry in sorted(self._lanes[lane])]
+
+    def _forget(self, lane: str):
+        for key in [key for key in self._tags if key[0] == lane]:
+            del self._tags[key]
@@ -0,0 +1,140 @@
+import asyncio
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from utils.metrics import Counter, register
+from utils.progress import ProgressFeed, progress_feed
+
+# Query parameters that only track where a link was shared
+TRACKING_PARAMS = ("fbclid", "gclid", "mc_cid", "mc_eid", "ref", "ref_src", "igshid", "si")
+
+FLIGHTS = register(Counter(
+    "astrosmurf_singleflight_total",
+    "Calls through a single-flight group by outcome (leader, joined or reused)",
+    ("flight", "outcome")
+))
+
+
+def normalize_url(url: str | None) -> str:
+    """Canonical form of a link, so trivially different copies coalesce
+
+    Lowercases the scheme and host, drops default ports, the fragment,
+    tracking parameters (utm_* etc.) and a trailing slash, and sorts the
+    remaining query parameters.
+    """
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+class Flight:
+    """One run of a single-flight group, as seen by a caller that joined it
+
+    feed carries the run's progress events (see utils.progress); wait()
+    returns its result.
+    """
+
+    def __init__(self, task: asyncio.Future, feed: ProgressFeed):
+        self.task = task
+        self.feed = feed
+        self.waiters = 0
+
+    async def wait(self):
+        """The run's result (or exception), then leave()"""
+        try:
+            return await asyncio.shield(self.task)
+        finally:
+            self.leave()
+
+    def leave(self):
+        """Stop waiting for the run; it is cancelled once every caller has left"""
+        self.waiters -= 1
+        if self.waiters == 0 and not self.task.done():
+            self.task.cancel()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one run
+
+    The first caller for a key starts the work as a task; callers arriving
+    while it runs wait for the same task and all get its result (or its
+    exception). The task is cancelled only when every caller waiting on it
+    has gone. With reuse_seconds > 0, a successful result (as judged by
+    reuse_if) is also handed to callers arriving that long after it
+    completed. Results are shared, so callers must not mutate them.
+
+    The work runs with a progress feed of its own, so every caller of a
+    run, including ones that joined late, can follow its events.
+    """
+
+    def __init__(self, name: str, reuse_seconds: float = 0, reuse_if=bool):
+        self.name = name
+        self.reuse_seconds = reuse_seconds
+        self.reuse_if = reuse_if
+        # key -> Flight in progress
+        self._flights = {}
+        # key -> (completed at, result)
+        self._recent = {}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def join(self, key, fn, *args, **kwargs) -> Flight:
+        """Join the run for key, starting `fn(*args, **kwargs)` if there is none
+
+        The caller must then call the flight's wait() or leave() exactly once.
+        """
+        recent = self._recent.get(key)
+        if recent is not None:
+            completed_at, result = recent
+            if time.monotonic() - completed_at <= self.reuse_seconds:
+                FLIGHTS.inc(flight=self.name, outcome="reused")
+                done = asyncio.get_running_loop().create_future()
+                done.set_result(result)
+                feed = ProgressFeed()
+                feed.close()
+                flight = Flight(done, feed)
+                flight.waiters += 1
+                return flight
+            del self._recent[key]
+
+        flight = self._flights.get(key)
+        if flight is None:
+            feed = ProgressFeed()
+            with progress_feed(feed):
+                task = asyncio.create_task(fn(*args, **kwargs))
+            flight = self._flights[key] = Flight(task, feed)
+            task.add_done_callback(lambda task: self._finished(key, flight))
+            FLIGHTS.inc(flight=self.name, outcome="leader")
+        else:
+            FLIGHTS.inc(flight=self.name, outcome="joined")
+        flight.waiters += 1
+        return flight
+
+    async def do(self, key, fn, *args, **kwargs):
+        """Result of `await fn(*args, **kwargs)`, shared with identical calls"""
+        return await self.join(key, fn, *args, **kwargs).wait()
+
+    def _finished(self, key, flight: Flight):
+        flight.feed.close()
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        task = flight.task
+        if self.reuse_seconds > 0 and not task.cancelled() and task.exception() is None:
+            result = task.result()
+            if self.reuse_if(result):
+                self._recent[key] = (time.monotonic(), result)
+        # Drop expired results so the map doesn't grow with every key seen
+        now = time.monotonic()
+        for stale in [k for k, (at, _) in self._recent.items() if now - at > self.reuse_seconds]:
+            del self._recent[stale]
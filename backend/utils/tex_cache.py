@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+from utils.artifacts import gc_directory
+from utils.metrics import TEX_CACHE_LOOKUPS
+
+
+class TexCache:
+    """Shared, concurrency-safe cache of compiled TeX SVGs for manim renders
+
+    Manim names every TeX file after the hash of its expression and skips
+    LaTeX when the matching .svg already exists in its tex_dir. Each render
+    gets a private staging tex_dir seeded with hard links to the cached SVGs;
+    after the render, newly compiled SVGs are published back into the shared
+    directory with an atomic rename. Renders never write into the shared
+    directory directly, so parallel renders cannot see half-written files.
+    """
+
+    def __init__(self, cache_dir, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def stage(self, staging_dir) -> set[str]:
+        """Seed a render's tex_dir with the cached SVGs
+
+        Returns:
+            Set of the SVG stems (TeX hashes) that were seeded
+        """
+        staging_dir = Path(staging_dir)
+        staging_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        seeded = set()
+        for svg_file in self.cache_dir.glob("*.svg"):
+            target = staging_dir / svg_file.name
+            try:
+                os.link(svg_file, target)
+            except FileNotFoundError:
+                # Evicted by another render in the meantime
+                continue
+            except OSError:
+                shutil.copy2(svg_file, target)
+            seeded.add(svg_file.stem)
+        return seeded
+
+    def publish(self, staging_dir, seeded: set[str]) -> dict:
+        """Publish newly compiled SVGs from a render's tex_dir and count hits
+
+        Manim writes the .tex source for every expression it needs, so each
+        .tex file is a lookup: a hit if its SVG was seeded, a miss otherwise.
+        Lookups are counted in /metrics (astrosmurf_tex_cache_lookups_total).
+
+        Returns:
+            Dict with the hits and misses of this render
+        """
+        staging_dir = Path(staging_dir)
+        hits = 0
+        misses = 0
+        for tex_file in staging_dir.glob("*.tex"):
+            stem = tex_file.stem
+            if stem in seeded:
+                hits += 1
+                # Refresh the mtime so eviction is least-recently-used
+                try:
+                    os.utime(self.cache_dir / f"{stem}.svg")
+                except FileNotFoundError:
+                    pass
+                continue
+
+            misses += 1
+            svg_file = staging_dir / f"{stem}.svg"
+            if svg_file.exists():
+                self._publish_file(svg_file)
+
+        with self._lock:
+            self._hits += hits
+            self._misses += misses
+        TEX_CACHE_LOOKUPS.inc(hits, outcome="hit")
+        TEX_CACHE_LOOKUPS.inc(misses, outcome="miss")
+
+        if misses:
+            gc_directory(self.cache_dir, max_bytes=self.max_bytes)
+        return {"hits": hits, "misses": misses}
+
+    def _publish_file(self, svg_file: Path):
+        target = self.cache_dir / svg_file.name
+        if target.exists():
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=f".{svg_file.name}.", suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(svg_file, tmp_path)
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def stats(self) -> dict:
+        """Cumulative hit statistics for this process and the cache size"""
+        entries = 0
+        size = 0
+        for svg_file in self.cache_dir.glob("*.svg"):
+            try:
+                size += svg_file.stat().st_size
+            except FileNotFoundError:
+                continue
+            entries += 1
+
+        with self._lock:
+            hits, misses = self._hits, self._misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Marker present while a workspace is in use (by any process)
+ACTIVE_MARKER = ".active"
+
+
+class JobWorkspace:
+    """Private scratch directory for one job
+
+    Use as a context manager: the directory is unique (no two jobs can share
+    it, even within the same second) and is removed on exit unless keep is
+    set, e.g. to inspect the files of a failed run.
+    """
+
+    def __init__(self, scratch_dir, prefix: str = "run_"):
+        self.scratch_dir = Path(scratch_dir)
+        self.prefix = prefix
+        self.path = None
+        self.keep = False
+
+    def __enter__(self) -> "JobWorkspace":
+        self.scratch_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.path = Path(tempfile.mkdtemp(prefix=f"{self.prefix}{timestamp}_", dir=self.scratch_dir))
+        (self.path / ACTIVE_MARKER).touch()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.keep:
+            (self.path / ACTIVE_MARKER).unlink(missing_ok=True)
+            print(f"Keeping workspace: {self.path}")
+        else:
+            shutil.rmtree(self.path, ignore_errors=True)
+        return False
+
+
+def _dir_usage(path: Path):
+    size = 0
+    mtime = path.stat().st_mtime
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                stat = (Path(dirpath) / name).stat()
+            except FileNotFoundError:
+                continue
+            size += stat.st_size
+            mtime = max(mtime, stat.st_mtime)
+    return size, mtime
+
+
+def gc_workspaces(scratch_dir, max_bytes: int | None = None, min_free_bytes: int | None = None, max_age_seconds: float | None = None) -> dict:
+    """Remove old job workspaces to keep the scratch volume within budget
+
+    Workspaces older than max_age_seconds are removed (including ones whose
+    job crashed and left them marked active). Then the oldest finished
+    workspaces are removed until the scratch directory fits in max_bytes and
+    the volume has at least min_free_bytes free. Workspaces of running jobs
+    are never removed by the size/free-space pass.
+
+    Returns:
+        Dict with the number of removed workspaces and freed bytes
+    """
+    scratch_dir = Path(scratch_dir)
+    stats = {"removed_workspaces": 0, "freed_bytes": 0}
+    if not scratch_dir.exists():
+        return stats
+
+    workspaces = []
+    for path in scratch_dir.iterdir():
+        if not path.is_dir():
+            continue
+        try:
+            size, mtime = _dir_usage(path)
+        except FileNotFoundError:
+            continue
+        workspaces.append((mtime, size, path, (path / ACTIVE_MARKER).exists()))
+    workspaces.sort(key=lambda w: w[0])
+
+    def remove(size, path):
+        shutil.rmtree(path, ignore_errors=True)
+        stats["removed_workspaces"] += 1
+        stats["freed_bytes"] += size
+
+    now = time.time()
+    kept = []
+    for mtime, size, path, active in workspaces:
+        if max_age_seconds is not None and now - mtime > max_age_seconds:
+            remove(size, path)
+        else:
+            kept.append((mtime, size, path, active))
+
+    total = sum(size for _, size, _, _ in kept)
+    for mtime, size, path, active in kept:
+        over_budget = max_bytes is not None and total > max_bytes
+        low_on_disk = min_free_bytes is not None and shutil.disk_usage(scratch_dir).free < min_free_bytes
+        if not (over_budget or low_on_disk):
+            break
+        if active:
+            continue
+        remove(size, path)
+        total -= size
+
+    return stats
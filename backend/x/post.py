@@ -1,53 +1,136 @@
-import tweepy
+import asyncio
+import mimetypes
 import os
-import httpx
 import tempfile
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 
+from db.db import get_x_media_upload, store_x_media_upload
+from utils.downloads import get_http_client
+
 load_dotenv()
 
-client = tweepy.Client(
-    consumer_key=os.getenv("X_CONSUMER_KEY"),
-    consumer_secret=os.getenv("X_CONSUMER_KEY_SECRET"),
-    access_token=os.getenv("X_ACCESS_TOKEN"),
-    access_token_secret=os.getenv("X_SECRET")
-)
-
-auth = tweepy.OAuth1UserHandler(
-    os.getenv("X_CONSUMER_KEY"),
-    os.getenv("X_CONSUMER_KEY_SECRET"),
-    os.getenv("X_ACCESS_TOKEN"),
-    os.getenv("X_SECRET")
-)
-api = tweepy.API(auth)
-
-
-async def post_media_to_twitter(media_url: str, text: str = ""):
-    async with httpx.AsyncClient() as http_client:
-        response = await http_client.get(media_url)
-        response.raise_for_status()
 
-        file_extension = Path(media_url).suffix
+@lru_cache(maxsize=1)
+def get_client():
+    """X API v2 client, created on first use so importing this module needs no credentials"""
+    import tweepy
+    return tweepy.Client(
+        consumer_key=os.getenv("X_CONSUMER_KEY"),
+        consumer_secret=os.getenv("X_CONSUMER_KEY_SECRET"),
+        access_token=os.getenv("X_ACCESS_TOKEN"),
+        access_token_secret=os.getenv("X_SECRET")
+    )
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-            temp_file.write(response.content)
-            temp_path = temp_file.name
 
-        try:
-            upload = api.media_upload(temp_path)
-            media_id = upload.media_id_string
+@lru_cache(maxsize=1)
+def get_api():
+    """X API v1.1 client (media uploads)"""
+    import tweepy
+    auth = tweepy.OAuth1UserHandler(
+        os.getenv("X_CONSUMER_KEY"),
+        os.getenv("X_CONSUMER_KEY_SECRET"),
+        os.getenv("X_ACCESS_TOKEN"),
+        os.getenv("X_SECRET")
+    )
+    return tweepy.API(auth)
+
+
+VIDEO_SUFFIXES = (".mp4", ".mov", ".webm")
+
+# X media ids are valid for 24h; stop reusing them a bit before that
+X_MEDIA_ID_TTL = timedelta(hours=24)
+X_MEDIA_ID_MARGIN = timedelta(minutes=30)
 
-            tweet_response = client.create_tweet(text=text, media_ids=[media_id])
 
-            tweet_id = None
-            if hasattr(tweet_response, "data") and tweet_response.data:
-                tweet_id = tweet_response.data.get("id") if isinstance(tweet_response.data, dict) else getattr(tweet_response.data, "id", None)
+async def download_media(media_url: str) -> tuple[str, bool]:
+    """Stream media to a temp file
 
-            return {
-                "success": True,
-                "tweet_id": tweet_id,
-                "media_id": media_id
-            }
-        finally:
+    Returns:
+        (path of the temp file, whether the media is a video)
+    """
+    file_extension = Path(media_url.split("?")[0]).suffix
+    async with get_http_client().stream("GET", media_url) as response:
+        response.raise_for_status()
+        content_type = response.headers.get("content-type", "")
+        if not file_extension:
+            # tweepy picks the upload type from the file name
+            file_extension = mimetypes.guess_extension(content_type.split(";")[0].strip()) or ""
+        fd, temp_path = tempfile.mkstemp(suffix=file_extension)
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                async for chunk in response.aiter_bytes(1024 * 1024):
+                    temp_file.write(chunk)
+        except BaseException:
             os.unlink(temp_path)
+            raise
+    is_video = content_type.startswith("video/") or file_extension.lower() in VIDEO_SUFFIXES
+    return temp_path, is_video
+
+
+def upload_media_sync(path: str, is_video: bool):
+    """Upload media to X (blocking); videos use the chunked upload"""
+    api = get_api()
+    if is_video:
+        return api.media_upload(
+            path,
+            chunked=True,
+            media_category="tweet_video",
+            wait_for_async_finalize=True
+        )
+    return api.media_upload(path)
+
+
+async def upload_media(media_url: str) -> tuple[str, datetime]:
+    """Download media and upload it to X off the event loop
+
+    Returns:
+        (X media id, when the media id expires)
+    """
+    temp_path, is_video = await download_media(media_url)
+    try:
+        upload = await asyncio.to_thread(upload_media_sync, temp_path, is_video)
+    finally:
+        os.unlink(temp_path)
+
+    ttl = X_MEDIA_ID_TTL
+    expires_after_secs = getattr(upload, "expires_after_secs", None)
+    if expires_after_secs:
+        ttl = timedelta(seconds=int(expires_after_secs))
+    return upload.media_id_string, datetime.now(timezone.utc) + ttl - X_MEDIA_ID_MARGIN
+
+
+async def post_media_to_twitter(media_url: str, text: str = "", media_row_id: int | None = None):
+    """Post media to X
+
+    Args:
+        media_url: URL of the media to post
+        text: Tweet text
+        media_row_id: ID of the media row; when given, the X media id is
+            cached so reposting the same media skips the upload until it
+            expires or the row's URL changes
+    """
+    media_id = None
+    if media_row_id is not None:
+        media_id = await get_x_media_upload(media_row_id, media_url)
+        if media_id:
+            print(f"Reusing X media id {media_id} for media {media_row_id}")
+
+    if not media_id:
+        media_id, expires_at = await upload_media(media_url)
+        if media_row_id is not None:
+            await store_x_media_upload(media_row_id, media_url, media_id, expires_at)
+
+    tweet_response = await asyncio.to_thread(get_client().create_tweet, text=text, media_ids=[media_id])
+
+    tweet_id = None
+    if hasattr(tweet_response, "data") and tweet_response.data:
+        tweet_id = tweet_response.data.get("id") if isinstance(tweet_response.data, dict) else getattr(tweet_response.data, "id", None)
+
+    return {
+        "success": True,
+        "tweet_id": tweet_id,
+        "media_id": media_id
+    }
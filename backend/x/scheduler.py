@@ -0,0 +1,182 @@
+import asyncio
+import os
+import random
+import socket
+import traceback
+import uuid
+
+from db.db import (
+    claim_due_posts,
+    get_media_by_id,
+    mark_post_failed,
+    mark_post_posted,
+    renew_post_lease,
+)
+from x.post import post_media_to_twitter
+
+
+class PostingWorker:
+    """Posts rows of the posts table once their scheduled_at has passed
+
+    Due rows are claimed in batches and leased for lease_seconds; the lease
+    is renewed while a post is in flight, so any number of worker processes
+    can run against the same database without posting a row twice. Within a
+    process at most `concurrency` posts are in flight, and each social
+    account posts at most `posts_per_window` times per `window_seconds`:
+    the claim itself only hands out posts an account has room for (counted
+    in the database, so the limit holds across processes). Failed posts are
+    retried with exponential backoff until max_attempts is reached. A post
+    that went out is never retried: if recording it fails, recording is
+    retried instead (record_attempts times) while the lease is held.
+
+    Posts go out through x.post with the app's X credentials.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 10,
+        concurrency: int = 4,
+        poll_interval: float = 15,
+        lease_seconds: float = 600,
+        max_attempts: int = 5,
+        backoff_base: float = 60,
+        backoff_max: float = 3600,
+        posts_per_window: int = 50,
+        window_seconds: float = 24 * 3600,
+        record_attempts: int = 5,
+        record_retry_delay: float = 1.0,
+        post=post_media_to_twitter,
+    ):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.posts_per_window = posts_per_window
+        self.window_seconds = window_seconds
+        self.record_attempts = record_attempts
+        self.record_retry_delay = record_retry_delay
+        self._post = post
+        self._semaphore = None
+        self._task = None
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+    def start(self):
+        """Start the polling loop (must be called from the running event loop)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_forever(self):
+        while True:
+            try:
+                claimed = await self.run_once()
+            except Exception as e:
+                print(f"Posting worker poll failed: {e}")
+                traceback.print_exc()
+                claimed = 0
+            # A full batch means more posts are probably due; poll again right away
+            if claimed < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    async def run_once(self) -> int:
+        """Claim one batch of due posts and post them
+
+        Returns:
+            Number of posts claimed
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        posts = await claim_due_posts(
+            self.batch_size, self.lease_seconds, self.max_attempts, self.worker_id,
+            self.posts_per_window, self.window_seconds,
+        )
+        if posts:
+            print(f"Claimed {len(posts)} due post(s)")
+            await asyncio.gather(*(self._run_post(dict(post)) for post in posts))
+        return len(posts)
+
+    def backoff(self, attempts: int) -> float:
+        """Seconds to wait before retrying a post that has failed `attempts` times"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempts)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _run_post(self, post: dict):
+        async with self._semaphore:
+            lease = asyncio.create_task(self._keep_lease(post["id"]))
+            try:
+                try:
+                    media = await get_media_by_id(post["media_id"])
+                    if not media:
+                        raise ValueError(f"Media {post['media_id']} not found")
+                    result = await self._post(media["media_url"], post["caption"] or "", media_row_id=post["media_id"])
+                except Exception as e:
+                    attempts = post["attempts"] + 1
+                    retry_in = self.backoff(attempts - 1)
+                    if attempts < self.max_attempts:
+                        print(f"Post {post['id']} failed (attempt {attempts}/{self.max_attempts}), retrying in {retry_in:.0f}s: {e}")
+                    else:
+                        print(f"Post {post['id']} failed (attempt {attempts}/{self.max_attempts}), giving up: {e}")
+                    if not await mark_post_failed(post["id"], self.worker_id, str(e), retry_in):
+                        print(f"Lost the lease on post {post['id']}; its failure was not recorded")
+                    return
+
+                # The tweet is out: from here on the post must not be retried
+                await self._record_posted(post["id"], result.get("tweet_id"))
+            finally:
+                lease.cancel()
+                await asyncio.gather(lease, return_exceptions=True)
+
+    async def _record_posted(self, post_id: int, tweet_id: str):
+        """Mark a published post as posted, retrying while the database is unavailable
+
+        The lease is still renewed meanwhile, so no other worker posts it again.
+        """
+        delay = self.record_retry_delay
+        for attempt in range(1, self.record_attempts + 1):
+            try:
+                if await mark_post_posted(post_id, tweet_id, self.worker_id):
+                    print(f"Posted post {post_id} as tweet {tweet_id}")
+                else:
+                    print(f"Post {post_id} went out as tweet {tweet_id}, but another worker had taken over its lease")
+                return
+            except Exception as e:
+                print(f"Recording post {post_id} as tweet {tweet_id} failed (attempt {attempt}/{self.record_attempts}): {e}")
+                if attempt < self.record_attempts:
+                    await asyncio.sleep(delay)
+                    delay *= 2
+        print(f"Post {post_id} went out as tweet {tweet_id} but is not marked posted; reconcile it before its lease runs out")
+
+    async def _keep_lease(self, post_id: int):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await renew_post_lease(post_id, self.worker_id, self.lease_seconds):
+                    print(f"Lost the lease on post {post_id}")
+                    return
+            except Exception as e:
+                print(f"Renewing the lease on post {post_id} failed: {e}")
+
+POSTING_WORKER = PostingWorker(
+    batch_size=int(os.getenv("POSTING_BATCH_SIZE", "10")),
+    concurrency=int(os.getenv("POSTING_CONCURRENCY", "4")),
+    poll_interval=float(os.getenv("POSTING_POLL_SECONDS", "15")),
+    max_attempts=int(os.getenv("POSTING_MAX_ATTEMPTS", "5")),
+    posts_per_window=int(os.getenv("X_POSTS_PER_ACCOUNT", "50")),
+    window_seconds=float(os.getenv("X_POST_WINDOW_HOURS", "24")) * 3600,
+)
+
+
+if __name__ == "__main__":
+    # Standalone worker: python -m x.scheduler (run as many as needed)
+    asyncio.run(POSTING_WORKER.run_forever())